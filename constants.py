@@ -34,6 +34,10 @@ DISCOVERY_ENGINE_COLLECTION = "default_collection"
 DISCOVERY_ENGINE_SERVING_CONFIG = "default_search"
 DISCOVERY_ENGINE_ENGINE_ID = os.environ.get("DISCOVERY_ENGINE_ENGINE_ID", None)
 
+# Background tasks (see util/tasks.py): "thread", "local-push" or "cloud-tasks"
+TASKS_MODE = os.environ.get("TASKS_MODE", "thread")
+CLOUD_TASKS_LOCATION = os.environ.get("CLOUD_TASKS_LOCATION", "us-central1")
+
 APPS_SCRIPT_RUNNER_EMAIL = "apps-script-runner@illinimedia.com"
 CONTEND_DOC_AUD = (
     "906651552672-3vsqi0s6ggr50gs1u7chgcn15hqlgg4e.apps.googleusercontent.com"
@@ -78,6 +82,8 @@ RETOOL_API_KEY = os.environ.get("RETOOL_API_KEY", None)
 
 # GSC Budket ID
 GCS_BUCKET_NAME = "cu-calendar-images"
+# Max calls per GCS JSON API batch request
+GCS_BATCH_SIZE = 100
 
 # Google Calendar IDs
 MAIN_IMC_GCAL_ID = (
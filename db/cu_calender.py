@@ -12,7 +12,11 @@ from zoneinfo import ZoneInfo
 from datetime import datetime, timezone
 from constants import DEFAULT_PUBLIC_EVENT_CATEGORY, PUBLIC_EVENT_OPTIONS
 from util.cu_calendar import delete_images_from_gcs
+from util.helpers.geohash import prefixes as geohash_prefixes
+from util.map_clusters import CALENDAR_SOURCE, invalidate_clusters
 from . import client
+from .expiry import register_expiry
+from .map_centroid import get_centroid, update_centroid
 
 
 class CalendarObject(ndb.Model):
@@ -35,6 +39,10 @@ class CalendarObject(ndb.Model):
     submitter_email = ndb.StringProperty(default="")
     is_accepted = ndb.BooleanProperty()
     highlight = ndb.BooleanProperty(default=False)
+    # Every geohash prefix of (lat, long), used for bounding-box queries
+    geohash = ndb.ComputedProperty(
+        lambda self: geohash_prefixes(self.lat, self.long), repeated=True
+    )
 
 
 class CalendarSource(ndb.Model):
@@ -112,6 +120,9 @@ def add_event(
             highlight=highlight,
         )
         new_event.put()
+        if is_accepted:
+            invalidate_clusters(CALENDAR_SOURCE)
+            update_centroid(CALENDAR_SOURCE, added=[(lat, long)])
         return new_event.to_dict()
 
 
@@ -124,9 +135,15 @@ def remove_event(uid):
             print("Removing event:", event.title)
             if event.images:
                 print("Deleting associated images from GCS...")
-                delete_images_from_gcs(event.images)
+                _, failed_urls = delete_images_from_gcs(event.images)
+                if failed_urls:
+                    # The event is still removed; record what was left behind
+                    print(f"Images of event {uid} left in GCS: {failed_urls}")
 
             event.key.delete()
+            invalidate_clusters(CALENDAR_SOURCE)
+            if event.is_accepted:
+                update_centroid(CALENDAR_SOURCE, removed=[(event.lat, event.long)])
             return True
         else:
             return False
@@ -176,6 +193,7 @@ def change_event(
     with client.context():
         point = CalendarObject.get_by_id(int(uid))
         if point is not None:
+            was_accepted, old_coords = point.is_accepted, (point.lat, point.long)
             point.title = title
             point.lat = lat
             point.long = long
@@ -194,6 +212,9 @@ def change_event(
             point.is_accepted = False
             point.highlight = False
             point.put()
+            invalidate_clusters(CALENDAR_SOURCE)
+            if was_accepted:
+                update_centroid(CALENDAR_SOURCE, removed=[old_coords])
             return True
         else:
             return False
@@ -214,32 +235,142 @@ def get_future_public_events():
     return events
 
 
+def query_public_events(
+    *,
+    geohash_cell=None,
+    bbox=None,
+    window_start=None,
+    window_end=None,
+    category=None,
+    highlight_only=False,
+    limit=None,
+    cursor=None,
+):
+    """
+    Return (events, next_cursor) for accepted events that have not ended yet.
+
+    geohash_cell narrows the query to one indexed cell; bbox (south, west, north, east)
+    then trims events outside the exact box. Events must end after window_start and
+    start before window_end. When limit is set, results are paged with urlsafe cursor
+    strings; filtering after the query may leave a page with fewer than limit events.
+    """
+
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    if window_start is not None:
+        window_start = window_start.astimezone(timezone.utc).replace(tzinfo=None)
+        now = max(now, window_start)
+
+    with client.context():
+        query = CalendarObject.query(CalendarObject.is_accepted == True)
+        if geohash_cell:
+            query = query.filter(CalendarObject.geohash == geohash_cell)
+        if category:
+            query = query.filter(CalendarObject.event_type == category)
+        if highlight_only:
+            query = query.filter(CalendarObject.highlight == True)
+        query = (
+            query.filter(CalendarObject.end_date > now)
+            .order(CalendarObject.end_date)
+            .order(CalendarObject.start_date)
+        )
+
+        if limit is None:
+            events, next_cursor = query.fetch(), None
+        else:
+            start_cursor = ndb.Cursor(urlsafe=cursor) if cursor else None
+            events, next_cursor, more = query.fetch_page(
+                limit, start_cursor=start_cursor
+            )
+            next_cursor = next_cursor.urlsafe().decode() if more else None
+
+        events = [event.to_dict() for event in events]
+
+    if bbox is not None:
+        south, west, north, east = bbox
+        events = [
+            event
+            for event in events
+            if event["lat"] is not None
+            and event["long"] is not None
+            and south <= event["lat"] <= north
+            and west <= event["long"] <= east
+        ]
+    if window_end is not None:
+        events = [
+            event
+            for event in events
+            if event["start_date"] is None or event["start_date"] <= window_end
+        ]
+
+    return events, next_cursor
+
+
+def get_future_public_events_in_cell(geohash_cell):
+    """Return accepted events that have not ended yet inside one geohash cell."""
+
+    events, _ = query_public_events(geohash_cell=geohash_cell)
+    return events
+
+
+def backfill_event_geohashes():
+    """Re-save geocoded events so their computed geohash index is written."""
+
+    with client.context():
+        events = [
+            event for event in CalendarObject.query().fetch() if event.lat is not None
+        ]
+        if events:
+            ndb.put_multi(events)
+            invalidate_clusters(CALENDAR_SOURCE)
+        return len(events)
+
+
+def _accepted_event_coords():
+    # Every accepted event, including expired ones the sweeper hasn't removed yet,
+    # since _on_events_expired subtracts each of them
+    with client.context():
+        events = CalendarObject.query(CalendarObject.is_accepted == True).fetch()
+    return [(event.lat, event.long) for event in events]
+
+
 def center_val():
-    """Map center as [lat, long] from future events, or a default."""
+    """
+    Map center as [lat, long] from accepted events, or a default.
+    Served from running sums; expired events drop out when the expiry sweeper runs.
+    """
 
-    events = get_future_public_events()
-    if len(events) == 0:
+    center = get_centroid(CALENDAR_SOURCE, _accepted_event_coords)
+    if center is None:
         return [40.109337703305975, -88.22721514717438]
-    lat_center = 0
-    long_center = 0
-    count = len(events)
-    for event in events:
-        lat_center += event["lat"]
-        long_center += event["long"]
-    lat_center = lat_center / count
-    long_center = long_center / count
-    return [lat_center, long_center]
+    return center
 
 
-def delete_expired_events():
-    """Delete events whose end time is in the past."""
+def _on_events_expired(events):
+    """
+    Expiry sweeper hook: remove images and map aggregates of expired events. Events
+    with images that couldn't be deleted are kept, so the next sweep retries them.
+    """
 
-    with client.context():
-        now = datetime.now(timezone.utc).replace(tzinfo=None)
-        query = CalendarObject.query(CalendarObject.end_date < now)
-        keys_to_delete = [event.key for event in query.fetch()]
-        if keys_to_delete:
-            ndb.delete_multi(keys_to_delete)
+    image_urls = [image for event in events for image in (event.images or [])]
+    bytes_reclaimed, failed_urls = delete_images_from_gcs(image_urls)
+    failed_urls = set(failed_urls)
+    kept = [event for event in events if failed_urls.intersection(event.images or [])]
+    invalidate_clusters(CALENDAR_SOURCE)
+    update_centroid(
+        CALENDAR_SOURCE,
+        removed=[
+            (event.lat, event.long)
+            for event in events
+            if event.is_accepted and event not in kept
+        ],
+    )
+    return {
+        "bytes_reclaimed": bytes_reclaimed,
+        "kept": [event.key for event in kept],
+    }
+
+
+register_expiry(CalendarObject, CalendarObject.end_date, on_expire=_on_events_expired)
 
 
 def get_pending_events():
@@ -256,6 +387,7 @@ def accept_event(uid, lat, long):
     with client.context():
         point = CalendarObject.get_by_id(int(uid))
         if point is not None:
+            was_accepted, old_coords = point.is_accepted, (point.lat, point.long)
             try:
                 point.event_type = normalize_public_event_category(point.event_type)
             except ValueError:
@@ -265,6 +397,12 @@ def accept_event(uid, lat, long):
             point.long = long
             point.is_accepted = True
             point.put()
+            invalidate_clusters(CALENDAR_SOURCE)
+            update_centroid(
+                CALENDAR_SOURCE,
+                added=[(lat, long)],
+                removed=[old_coords] if was_accepted else [],
+            )
             return True
         else:
             return False
@@ -284,6 +422,7 @@ def highlight_event(uid):
     with client.context():
         event = CalendarObject.get_by_id(int(uid))
         if event is not None:
+            was_accepted = event.is_accepted
             try:
                 event.event_type = normalize_public_event_category(event.event_type)
             except ValueError:
@@ -292,6 +431,9 @@ def highlight_event(uid):
             event.highlight = True
             event.is_accepted = True
             event.put()
+            invalidate_clusters(CALENDAR_SOURCE)
+            if not was_accepted:
+                update_centroid(CALENDAR_SOURCE, added=[(event.lat, event.long)])
             return True
         else:
             return False
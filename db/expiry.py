@@ -0,0 +1,153 @@
+"""
+Generic expiry (TTL) sweeper.
+
+Models register the property that marks an entity as expired with register_expiry().
+The /cron/expiry-sweep job then deletes expired entities kind by kind in fixed-size
+batches, so cleanup no longer depends on in-process schedulers surviving restarts.
+
+Each sweep has a time budget. A kind that isn't finished when it runs out saves its
+cursor and cutoff in an ExpiryCheckpoint, and the next sweep resumes from there.
+"""
+
+import logging
+import time
+from datetime import datetime, timezone
+
+from google.cloud import ndb
+
+from . import client
+
+# Entities deleted per delete_multi call (Datastore allows 500 per commit)
+EXPIRY_BATCH_SIZE = 500
+# Seconds a sweep may spend before checkpointing; every kind still gets one batch
+EXPIRY_TIME_BUDGET = 300
+
+_registrations = {}
+
+
+class ExpiryCheckpoint(ndb.Model):
+    """Where an unfinished sweep of a kind (the entity id) left off."""
+
+    cursor = ndb.TextProperty()
+    cutoff = ndb.DateTimeProperty(indexed=False)
+    updated_at = ndb.DateTimeProperty(auto_now=True, indexed=False)
+
+
+def utc_now():
+    """Current time as a naive UTC datetime, the default expiry cutoff."""
+
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def register_expiry(
+    model,
+    expiry_property,
+    cutoff=utc_now,
+    on_expire=None,
+    batch_size=EXPIRY_BATCH_SIZE,
+):
+    """
+    Register a model kind with the expiry sweeper.
+
+    :param model: The ndb.Model subclass
+    :param expiry_property: Property of model; entities whose value is before the cutoff
+        are deleted
+    :param cutoff: Function returning the cutoff datetime, in the same convention
+        (UTC/local, naive/aware) the property is stored in
+    :param on_expire: Optional function called with each batch of expired entities
+        before they are deleted, for side effects like removing files. When set,
+        batches are fetched as full entities instead of keys only. It may return a
+        dict of numeric metrics that are summed per kind; a "kept" entry instead
+        lists keys of entities to leave for a later sweep (e.g. when cleanup failed),
+        and is reported as their count.
+    :param batch_size: Entities per batch, lower for hooks that call rate-limited APIs
+    """
+
+    _registrations[model._get_kind()] = (
+        model,
+        expiry_property,
+        cutoff,
+        on_expire,
+        batch_size,
+    )
+
+
+def get_expiry_kinds():
+    """Return the kinds registered with the sweeper."""
+
+    return sorted(_registrations)
+
+
+def _sweep_kind(kind, deadline):
+    model, expiry_property, cutoff, on_expire, batch_size = _registrations[kind]
+    metrics = {"deleted": 0, "batches": 0, "complete": True}
+
+    checkpoint = ExpiryCheckpoint.get_by_id(kind)
+    if checkpoint is not None:
+        # Finish the interrupted pass over the same snapshot before starting a new one
+        metrics["resumed"] = True
+        cutoff_time = checkpoint.cutoff
+        cursor = ndb.Cursor(urlsafe=checkpoint.cursor)
+    else:
+        cutoff_time = cutoff()
+        cursor = None
+    query = model.query(expiry_property < cutoff_time)
+
+    more = True
+    while more:
+        batch, cursor, more = query.fetch_page(
+            batch_size, start_cursor=cursor, keys_only=on_expire is None
+        )
+        if not batch:
+            break
+
+        if on_expire is None:
+            keys = batch
+        else:
+            results = dict(on_expire(batch) or {})
+            kept = set(results.pop("kept", ()))
+            keys = [entity.key for entity in batch if entity.key not in kept]
+            results["kept"] = len(kept)
+            for name, value in results.items():
+                metrics[name] = metrics.get(name, 0) + value
+
+        ndb.delete_multi(keys)
+        metrics["deleted"] += len(keys)
+        metrics["batches"] += 1
+
+        if more and time.monotonic() > deadline:
+            ExpiryCheckpoint(
+                id=kind, cursor=cursor.urlsafe().decode(), cutoff=cutoff_time
+            ).put()
+            metrics["complete"] = False
+            return metrics
+
+    if checkpoint is not None:
+        checkpoint.key.delete()
+    return metrics
+
+
+def sweep_expired(kinds=None, time_budget=EXPIRY_TIME_BUDGET):
+    """
+    Delete expired entities for every registered kind (or only kinds).
+    Returns {kind: metrics}; a kind that fails reports its error and doesn't stop the rest.
+    Kinds reported with complete=False ran out of time_budget and resume next sweep.
+    """
+
+    deadline = time.monotonic() + time_budget
+    results = {}
+    for kind in kinds or get_expiry_kinds():
+        start_time = time.perf_counter()
+        try:
+            with client.context():
+                metrics = _sweep_kind(kind, deadline)
+        except Exception as e:
+            logging.exception(f"Expiry sweep failed for {kind}")
+            metrics = {"error": str(e)}
+            # Start the next sweep of this kind over, in case the checkpoint is bad
+            with client.context():
+                ndb.Key(ExpiryCheckpoint, kind).delete()
+        metrics["seconds"] = round(time.perf_counter() - start_time, 3)
+        logging.info(f"Expiry sweep {kind}: {metrics}")
+        results[kind] = metrics
+    return results
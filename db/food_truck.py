@@ -5,6 +5,7 @@ from zoneinfo import ZoneInfo
 import logging
 
 from . import client
+from .expiry import register_expiry
 
 logger = logging.getLogger(__name__)
 
@@ -194,13 +195,11 @@ def add_truck_loctime_repeat(
     return True
 
 
-# Remove a locTime by the locTime's UID (and clear all expired times)
+# Remove a locTime by the locTime's UID
 def remove_truck_loctime(uid):
     logger.info(f"Removing loctime with UID = {uid}...")
     locTime = foodTruckLocTime.get_by_id(uid)
 
-    remove_old_loc_times()
-
     if locTime is not None:
         locTime.key.delete()
         logger.info("Loctime deleted.")
@@ -260,20 +259,13 @@ def modify_truck_loctime(
         return None
 
 
-# Removes any locTimes where the end time has passed
-def remove_old_loc_times():
-    logger.debug("Removing expired loctimes...")
-    cur_time = datetime.now(ZoneInfo("America/Chicago")).replace(tzinfo=None)
-    logger.debug(f"Current time = {cur_time}")
-
-    expired_loc_times = foodTruckLocTime.query(
-        foodTruckLocTime.end_time < cur_time
-    ).fetch()
+# Current time in the convention loctimes are stored in (naive America/Chicago)
+def _loctime_now():
+    return datetime.now(ZoneInfo("America/Chicago")).replace(tzinfo=None)
 
-    ndb.delete_multi([locTime.key for locTime in expired_loc_times])
 
-    logger.debug(f"Deleted {len(expired_loc_times)} loctime(s).")
-    return len(expired_loc_times)
+# Expired locTimes are deleted by the expiry sweeper; reads skip them until then
+register_expiry(foodTruckLocTime, foodTruckLocTime.end_time, cutoff=_loctime_now)
 
 
 # Returns true if there is a loctime that overlaps with start_time or end_time (Expects all times in UTC)
@@ -353,25 +345,29 @@ def get_registration_by_id(uid):
         return None
 
 
-# Get every locTime for all trucks (and clear all expired times)
+# Get every current locTime for all trucks
 def get_all_truck_loctimes():
-    remove_old_loc_times()
-    locTimes = [locTime.to_dict() for locTime in foodTruckLocTime.query().fetch()]
+    now = _loctime_now()
+    locTimes = [
+        locTime.to_dict()
+        for locTime in foodTruckLocTime.query(foodTruckLocTime.end_time >= now).fetch()
+    ]
     return locTimes
 
 
-# Get every locTime associated with a specific truck's UID (Sorted by start_time) (and clear all expired times)
+# Get every current locTime associated with a specific truck's UID (Sorted by start_time)
 def get_all_loctimes_for_truck(truck_uid):
     logger.debug(f"Getting all loctimes for truck with UID = {truck_uid}...")
-    remove_old_loc_times()
     locTimes = (
         foodTruckLocTime.query(foodTruckLocTime.truck_uid == float(truck_uid))
         .order(foodTruckLocTime.start_time)
         .fetch()
     )
 
+    # Filtered here since the query already sorts on start_time
+    now = _loctime_now()
     logger.debug("Done.")
-    return [locTime.to_dict() for locTime in locTimes]
+    return [locTime.to_dict() for locTime in locTimes if locTime.end_time >= now]
 
 
 # Get a specific loctime from its UID
@@ -0,0 +1,115 @@
+"""
+Datastore-backed leases so only one instance runs a job at a time.
+
+A lease is held by one process until it is released or its TTL runs out. Every change
+of holder issues a larger fencing token; long-running work should call
+is_lease_current() with its token before side effects (e.g. Slack posts), so a holder
+whose lease expired mid-run stops instead of duplicating work.
+"""
+
+import os
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+
+from google.cloud import ndb
+
+from . import client
+
+# Seconds a lease is held before it expires
+DEFAULT_LEASE_TTL = 60
+
+# Identifies this process as a lease holder
+HOLDER_ID = (
+    f"{os.environ.get('GAE_INSTANCE', 'local')}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+)
+
+
+class Lease(ndb.Model):
+    holder = ndb.StringProperty()
+    token = ndb.IntegerProperty(indexed=False)
+    expires_at = ndb.DateTimeProperty(indexed=False)
+    acquired_at = ndb.DateTimeProperty(indexed=False)
+
+
+def _context():
+    # Leases may be taken from inside another db function's context
+    if ndb.get_context(False) is not None:
+        return nullcontext()
+    return client.context()
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def acquire_lease(name, ttl=DEFAULT_LEASE_TTL):
+    """
+    Take (or extend, if this process already holds it) the named lease.
+    Returns the fencing token, or None if another holder has an unexpired lease.
+    """
+
+    @ndb.transactional()
+    def acquire():
+        now = _now()
+        lease = Lease.get_by_id(name)
+        if lease is None:
+            lease = Lease(id=name, token=0)
+        elif lease.holder != HOLDER_ID and lease.expires_at > now:
+            return None
+
+        if lease.holder != HOLDER_ID or lease.expires_at <= now:
+            lease.token = (lease.token or 0) + 1
+            lease.holder = HOLDER_ID
+            lease.acquired_at = now
+        lease.expires_at = now + timedelta(seconds=ttl)
+        lease.put()
+        return lease.token
+
+    with _context():
+        return acquire()
+
+
+def release_lease(name, token):
+    """Give up a held lease early so other instances don't wait out the TTL."""
+
+    @ndb.transactional()
+    def release():
+        lease = Lease.get_by_id(name)
+        if lease is None or lease.token != token or lease.holder != HOLDER_ID:
+            return False
+        # Keep the entity so the next holder gets a larger token
+        lease.expires_at = _now()
+        lease.put()
+        return True
+
+    with _context():
+        return release()
+
+
+def is_lease_current(name, token):
+    """Fencing check: whether token still belongs to the unexpired holder of name."""
+
+    with _context():
+        lease = Lease.get_by_id(name)
+    return (
+        lease is not None
+        and lease.token == token
+        and lease.holder == HOLDER_ID
+        and lease.expires_at > _now()
+    )
+
+
+@contextmanager
+def held_lease(name, ttl=DEFAULT_LEASE_TTL):
+    """
+    Context manager around acquire/release. Yields the fencing token, or None if the
+    lease is held elsewhere (the body should then skip its work).
+    """
+
+    token = acquire_lease(name, ttl)
+    try:
+        yield token
+    finally:
+        if token is not None:
+            release_lease(name, token)
@@ -0,0 +1,130 @@
+"""
+Running lat/long sums for the map center endpoints.
+
+Each map source (CU Calendar events, map points) keeps one MapCentroid entity that is
+adjusted whenever a point is added, moved or removed, and a copy of it in memory so the
+/center endpoints don't run queries.
+"""
+
+from contextlib import nullcontext
+from datetime import datetime
+from threading import Lock
+import time
+
+from google.cloud import ndb
+
+from . import client
+
+# Seconds before the in-memory copy is re-read, to pick up writes from other instances
+CENTROID_REFRESH_SECONDS = 300
+
+_centroids = {}
+_centroids_lock = Lock()
+
+
+class MapCentroid(ndb.Model):
+    lat_sum = ndb.FloatProperty(indexed=False)
+    long_sum = ndb.FloatProperty(indexed=False)
+    count = ndb.IntegerProperty(indexed=False)
+    updated_at = ndb.DateTimeProperty(indexed=False)
+
+
+def _context():
+    # Reuse the caller's context when called from inside another db function
+    if ndb.get_context(False) is not None:
+        return nullcontext()
+    return client.context()
+
+
+def _remember(source, centroid):
+    with _centroids_lock:
+        _centroids[source] = (
+            time.monotonic(),
+            (centroid.lat_sum, centroid.long_sum, centroid.count),
+        )
+
+
+def get_centroid(source, load_points):
+    """
+    Return the [lat, long] average of a source's points, or None if it has none.
+
+    :param source: MapCentroid id, e.g. "cu-calendar"
+    :param load_points: Function returning every (lat, long) that update_centroid calls
+        may later remove, including expired points not swept yet; only called (outside
+        any client context) to build the sums the first time
+    """
+
+    with _centroids_lock:
+        cached = _centroids.get(source)
+
+    if cached is None or time.monotonic() - cached[0] > CENTROID_REFRESH_SECONDS:
+        with _context():
+            centroid = MapCentroid.get_by_id(source)
+        if centroid is None:
+            points = [
+                (lat, long)
+                for lat, long in load_points()
+                if lat is not None and long is not None
+            ]
+            centroid = MapCentroid(
+                id=source,
+                lat_sum=sum(lat for lat, _ in points),
+                long_sum=sum(long for _, long in points),
+                count=len(points),
+                updated_at=datetime.now(),
+            )
+            with _context():
+                centroid.put()
+        _remember(source, centroid)
+        with _centroids_lock:
+            cached = _centroids[source]
+
+    lat_sum, long_sum, count = cached[1]
+    if count <= 0:
+        return None
+    return [lat_sum / count, long_sum / count]
+
+
+def update_centroid(source, added=(), removed=()):
+    """
+    Adjust a source's running sums.
+
+    :param added: (lat, long) pairs that became visible on the map
+    :param removed: (lat, long) pairs that are no longer visible
+    """
+
+    added = [(lat, long) for lat, long in added if lat is not None and long is not None]
+    removed = [
+        (lat, long) for lat, long in removed if lat is not None and long is not None
+    ]
+    if not added and not removed:
+        return
+
+    @ndb.transactional()
+    def apply():
+        centroid = MapCentroid.get_by_id(source)
+        if centroid is None:
+            # Sums are built from scratch on the next read, which already sees this write
+            return None
+        centroid.lat_sum += sum(lat for lat, _ in added) - sum(
+            lat for lat, _ in removed
+        )
+        centroid.long_sum += sum(long for _, long in added) - sum(
+            long for _, long in removed
+        )
+        centroid.count += len(added) - len(removed)
+        if centroid.count <= 0:
+            # Reset instead of keeping float error around
+            centroid.lat_sum, centroid.long_sum, centroid.count = 0.0, 0.0, 0
+        centroid.updated_at = datetime.now()
+        centroid.put()
+        return centroid
+
+    with _context():
+        centroid = apply()
+
+    if centroid is None:
+        with _centroids_lock:
+            _centroids.pop(source, None)
+    else:
+        _remember(source, centroid)
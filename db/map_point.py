@@ -1,8 +1,22 @@
 from google.cloud import ndb
+from collections import Counter
 from datetime import datetime, timedelta, timezone
-import random
+from threading import Lock
 
+from util.helpers.geohash import prefixes as geohash_prefixes
+from util.map_clusters import MAP_POINTS_SOURCE, invalidate_clusters
 from . import client
+from .expiry import register_expiry
+from .map_centroid import get_centroid, update_centroid
+
+# Grid size (degrees, about 5.5m) of the spatial hash used to keep points apart
+SPATIAL_HASH_STEP = 0.00005
+# How many rings of the spiral to try before stacking on the original point
+SPATIAL_HASH_MAX_RINGS = 10
+
+# Number of current points in each spatial hash cell; loaded on the first add
+_occupied_cells = None
+_occupied_cells_lock = Lock()
 
 
 class MapPoint(ndb.Model):
@@ -19,43 +33,75 @@ class MapPoint(ndb.Model):
     image = ndb.StringProperty()
     address = ndb.StringProperty()
     point_type = ndb.StringProperty()
+    # Every geohash prefix of (lat, long), used for bounding-box queries
+    geohash = ndb.ComputedProperty(
+        lambda self: geohash_prefixes(self.lat, self.long), repeated=True
+    )
+
+
+def _cell(lat, long):
+    return round(lat / SPATIAL_HASH_STEP), round(long / SPATIAL_HASH_STEP)
+
+
+def _spiral(max_rings):
+    """Yield (row, col) offsets ring by ring around (0, 0), always in the same order."""
+
+    yield 0, 0
+    for ring in range(1, max_rings + 1):
+        for col in range(-ring, ring + 1):
+            yield ring, col
+        for row in range(ring - 1, -ring - 1, -1):
+            yield row, ring
+        for col in range(ring - 1, -ring - 1, -1):
+            yield -ring, col
+        for row in range(-ring + 1, ring):
+            yield row, -ring
+
+
+def _load_occupied_cells():
+    global _occupied_cells
+
+    if _occupied_cells is None:
+        with client.context():
+            points = MapPoint.query().fetch()
+        _occupied_cells = Counter(
+            _cell(point.lat, point.long)
+            for point in points
+            if point.lat is not None and point.long is not None
+        )
+    return _occupied_cells
 
 
 def add_point(title, lat, long, url, start_date, end_date, image, address, point_type):
-    # check if this is a duplicate location
-    with client.context():
-        existing = MapPoint.query(MapPoint.lat == lat, MapPoint.long == long).get()
-
-    if existing:
-        # Apply small random offset until it's lat-long is unique
-        # This helps avoid overlapping points on the actual map display
-        while True:
-            lat_jitter = lat + random.uniform(-0.0001, 0.0001)
-            long_jitter = long + random.uniform(-0.0001, 0.0001)
-
-            with client.context():
-                duplicate = MapPoint.query(
-                    MapPoint.lat == lat_jitter, MapPoint.long == long_jitter
-                ).get()
-
-            if not duplicate:
-                lat, long = lat_jitter, long_jitter
+    # Move the point to the first free cell on a spiral around it, so overlapping
+    # points stay visible on the map and land in the same spot every time. The lock is
+    # held through the put so the cell is only counted once the point is saved
+    with _occupied_cells_lock:
+        occupied_cells = _load_occupied_cells()
+        row, col = _cell(lat, long)
+        for row_offset, col_offset in _spiral(SPATIAL_HASH_MAX_RINGS):
+            if not occupied_cells[(row + row_offset, col + col_offset)]:
+                lat += row_offset * SPATIAL_HASH_STEP
+                long += col_offset * SPATIAL_HASH_STEP
                 break
 
-    with client.context():
-        point = MapPoint(
-            title=title,
-            lat=lat,
-            long=long,
-            url=url,
-            created_at=datetime.now(),
-            start_date=start_date,
-            end_date=end_date,
-            image=image,
-            address=address,
-            point_type=point_type,
-        )
-        point.put()
+        with client.context():
+            point = MapPoint(
+                title=title,
+                lat=lat,
+                long=long,
+                url=url,
+                created_at=datetime.now(),
+                start_date=start_date,
+                end_date=end_date,
+                image=image,
+                address=address,
+                point_type=point_type,
+            )
+            point.put()
+        occupied_cells[_cell(lat, long)] += 1
+    invalidate_clusters(MAP_POINTS_SOURCE)
+    update_centroid(MAP_POINTS_SOURCE, added=[(lat, long)])
 
     return point.to_dict()
 
@@ -67,6 +113,11 @@ def remove_point(uid):
 
         if point is not None:
             point.key.delete()
+            invalidate_clusters(MAP_POINTS_SOURCE)
+            with _occupied_cells_lock:
+                if _occupied_cells is not None and point.lat is not None:
+                    _occupied_cells[_cell(point.lat, point.long)] -= 1
+            update_centroid(MAP_POINTS_SOURCE, removed=[(point.lat, point.long)])
             return True
         else:
             return False
@@ -113,21 +164,51 @@ def get_future_points():
     return points
 
 
-def center_val():
-    points = get_future_points()
+def get_future_points_in_cell(geohash_cell):
+    now = datetime.now()
 
-    if len(points) == 0:
-        return [40.109337703305975, -88.22721514717438]
+    with client.context():
+        query = (
+            MapPoint.query(MapPoint.geohash == geohash_cell)
+            .filter(MapPoint.end_date > now)
+            .order(MapPoint.end_date)
+            .order(MapPoint.start_date)
+        )
 
-    lat_center = 0
-    long_center = 0
-    count = len(points)
+        points = [point.to_dict() for point in query.fetch()]
+
+    return points
 
-    for point in points:
-        lat_center += point["lat"]
-        long_center += point["long"]
 
-    lat_center = lat_center / count
-    long_center = long_center / count
+def _on_points_expired(points):
+    """Expiry sweeper hook: drop expired points from the map aggregates."""
+
+    invalidate_clusters(MAP_POINTS_SOURCE)
+    update_centroid(
+        MAP_POINTS_SOURCE, removed=[(point.lat, point.long) for point in points]
+    )
+    with _occupied_cells_lock:
+        if _occupied_cells is not None:
+            for point in points:
+                if point.lat is not None and point.long is not None:
+                    _occupied_cells[_cell(point.lat, point.long)] -= 1
+
+
+# end_date is stored as naive local time, like datetime.now() in get_future_points
+register_expiry(
+    MapPoint, MapPoint.end_date, cutoff=datetime.now, on_expire=_on_points_expired
+)
+
+
+def center_val():
+    # Every stored point, including expired ones the sweeper hasn't removed yet,
+    # since _on_points_expired subtracts each of them
+    center = get_centroid(
+        MAP_POINTS_SOURCE,
+        lambda: [(point["lat"], point["long"]) for point in get_all_points()],
+    )
+
+    if center is None:
+        return [40.109337703305975, -88.22721514717438]
 
-    return [lat_center, long_center]
+    return center
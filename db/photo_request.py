@@ -8,13 +8,17 @@ Created on Oct. 15, 2025 by Jon Hogg
 Last modified Nov. 8, 2025
 """
 
-from datetime import datetime
+from datetime import datetime, time, timedelta
 from zoneinfo import ZoneInfo
 from google.cloud import ndb
 
 from util.helpers.email_to_slackid import email_to_slackid
 
 from . import client
+from .story_keys import is_rekeyed, mark_rekeyed
+
+# Requests submitted less than this long before they are due are flagged as late
+LATE_SUBMIT_NOTICE = timedelta(hours=48)
 
 
 class PhotoRequest(ndb.Model):
@@ -71,14 +75,34 @@ class PhotoRequest(ndb.Model):
     slackChannel = ndb.StringProperty()
     slackTs = ndb.StringProperty()
 
-    # Simple workflow state
+    # Simple workflow state, derived from the timestamps on every write (_set_derived_fields)
     status = ndb.StringProperty(
         choices=["submitted", "claimed", "completed"], default="submitted"
     )
+    # Claimed at some point, including completed requests
+    isClaimed = ndb.ComputedProperty(lambda self: self.claimTimestamp is not None)
 
     # Timestamps
     submissionTimestamp = ndb.DateTimeProperty(tzinfo=ZoneInfo("America/Chicago"))
 
+    # Derived on every write (_set_derived_fields): the end of the due date, and whether
+    # the request was submitted with less than LATE_SUBMIT_NOTICE to spare
+    dueDateTime = ndb.DateTimeProperty(tzinfo=ZoneInfo("America/Chicago"))
+    lateSubmit = ndb.BooleanProperty()
+
+
+class PhotoRequestClaimThread(ndb.Model):
+    """
+    Maps a claim confirmation DM (entity id "<channel>:<thread_ts>") to its request,
+    so replies in that thread can be matched with a key lookup instead of a query.
+    """
+
+    uid = ndb.IntegerProperty(indexed=False)
+
+
+def _claim_thread_key(ch, thread_ts):
+    return ndb.Key(PhotoRequestClaimThread, f"{ch}:{thread_ts}")
+
 
 def add_photo_request(
     submitterEmail,
@@ -153,108 +177,143 @@ def add_photo_request(
             pressPass=pressPass,
             pressPassRequester=pressPassRequester,
         )
+        _set_derived_fields(entity)
         entity.put()
         print("Photo request added.")
         return entity.to_dict()
 
 
-def get_all_photo_requests():
-    """Returns all photo requests, newest first."""
-    with client.context():
-        requests = PhotoRequest.query().order(-PhotoRequest.submissionTimestamp).fetch()
-
-    return [request.to_dict() for request in requests]
+# Requests shown per dashboard page
+PHOTO_REQUESTS_PAGE_SIZE = 100
 
 
-def get_unclaimed_photo_requests():
-    """Return all unclaimed requests (ordered by submission date)."""
-    with client.context():
-        requests = (
-            PhotoRequest.query(PhotoRequest.claimTimestamp == None)
-            .order(-PhotoRequest.submissionTimestamp)
-            .fetch()
+def _set_derived_fields(entity):
+    """
+    Keep the indexed fields derived from other properties up to date: status from the
+    claim/completion timestamps, and dueDateTime/lateSubmit from the due date.
+    """
+    if entity.dueDate is not None:
+        entity.dueDateTime = datetime.combine(
+            entity.dueDate, time.max, tzinfo=ZoneInfo("America/Chicago")
         )
-
-    return [request.to_dict() for request in requests]
-
-
-def get_claimed_photo_requests():
-    """Return all claimed requests (ordered by submission date)."""
-    with client.context():
-        requests = PhotoRequest.query().order(-PhotoRequest.submissionTimestamp).fetch()
-
-    return [
-        request.to_dict() for request in requests if request.claimTimestamp is not None
-    ]
-
-
-def get_completed_photo_requests():
-    """Return all completed requests (ordered by submission date)."""
-    with client.context():
-        requests = PhotoRequest.query().order(-PhotoRequest.submissionTimestamp).fetch()
-
-    return [
-        request.to_dict()
-        for request in requests
-        if request.completedTimestamp is not None
-    ]
-
-
-def get_inprogress_photo_requests():
-    """Return all requests that are claimed but not complete (ordered by submission date)."""
-    with client.context():
-        requests = (
-            PhotoRequest.query()
-            .filter(PhotoRequest.completedTimestamp == None)
-            .order(-PhotoRequest.submissionTimestamp)
-            .fetch()
+    else:
+        entity.dueDateTime = None
+    if entity.dueDateTime is not None and entity.submissionTimestamp is not None:
+        entity.lateSubmit = (
+            entity.dueDateTime - entity.submissionTimestamp < LATE_SUBMIT_NOTICE
         )
+    else:
+        entity.lateSubmit = None
 
-    return [
-        request.to_dict() for request in requests if request.claimTimestamp is not None
-    ]
+    if entity.completedTimestamp is not None:
+        entity.status = "completed"
+    elif entity.claimTimestamp is not None:
+        entity.status = "claimed"
+    else:
+        entity.status = "submitted"
 
 
-def get_claimed_photo_requests_for_user(email):
-    """Return all requests that were claimed by a specified email (ordered by submission date)."""
+def _photo_request_query(selection, email=None, sort="submitted"):
+    """
+    Indexed query for a dashboard selection, newest first, or soonest due first when
+    sort is "due". Raises ValueError for an unknown selection or sort.
+    """
+    match selection:
+        case "all":
+            query = PhotoRequest.query()
+        case "unclaimed":
+            query = PhotoRequest.query(PhotoRequest.status == "submitted")
+        case "in-progress":
+            query = PhotoRequest.query(PhotoRequest.status == "claimed")
+        case "completed":
+            query = PhotoRequest.query(PhotoRequest.status == "completed")
+        case "claimed":
+            query = PhotoRequest.query(PhotoRequest.isClaimed == True)
+        case "claimed-email":
+            query = PhotoRequest.query(PhotoRequest.photogEmail == email)
+        case "completed-email":
+            query = PhotoRequest.query(
+                PhotoRequest.photogEmail == email, PhotoRequest.status == "completed"
+            )
+        case "submitted-email":
+            query = PhotoRequest.query(PhotoRequest.submitterEmail == email)
+        case _:
+            raise ValueError(f"Unknown photo request selection: {selection}")
+
+    if sort == "due":
+        return query.order(PhotoRequest.dueDateTime)
+    if sort not in ("submitted", "due"):
+        raise ValueError(f"Unknown photo request sort: {sort}")
+    return query.order(-PhotoRequest.submissionTimestamp)
+
+
+def get_photo_requests_page(
+    selection,
+    email=None,
+    sort="submitted",
+    limit=PHOTO_REQUESTS_PAGE_SIZE,
+    cursor=None,
+):
+    """
+    Return (requests, next_cursor) for one page of a dashboard selection: all,
+    unclaimed, in-progress, claimed, completed, or claimed-/completed-/submitted-email
+    (which need email). next_cursor is a urlsafe string, or None on the last page.
+    """
     with client.context():
-        requests = (
-            PhotoRequest.query(PhotoRequest.photogEmail == email)
-            .order(-PhotoRequest.submissionTimestamp)
-            .fetch()
-        )
+        query = _photo_request_query(selection, email, sort)
+        start_cursor = ndb.Cursor(urlsafe=cursor) if cursor else None
+        requests, next_cursor, more = query.fetch_page(limit, start_cursor=start_cursor)
 
-    return [request.to_dict() for request in requests]
+    next_cursor = next_cursor.urlsafe().decode() if more else None
+    return [request.to_dict() for request in requests], next_cursor
 
 
-def get_completed_photo_requests_for_user(email):
-    """Return all requests that were completed by a specified email (ordered by submission date)."""
+def get_all_photo_requests():
+    """Returns all photo requests, newest first."""
     with client.context():
-        requests = (
-            PhotoRequest.query(PhotoRequest.photogEmail == email)
-            .order(-PhotoRequest.submissionTimestamp)
-            .fetch()
-        )
+        requests = _photo_request_query("all").fetch()
 
-    return [
-        request.to_dict()
-        for request in requests
-        if request.completedTimestamp is not None
-    ]
+    return [request.to_dict() for request in requests]
 
 
 def get_submitted_photo_requests_for_user(email):
     """Return all requests that were submitted by a specified email (ordered by submission date)."""
     with client.context():
-        requests = (
-            PhotoRequest.query(PhotoRequest.submitterEmail == email)
-            .order(-PhotoRequest.submissionTimestamp)
-            .fetch()
-        )
+        requests = _photo_request_query("submitted-email", email).fetch()
 
     return [request.to_dict() for request in requests]
 
 
+def backfill_photo_request_fields():
+    """
+    Re-save every request so derived fields are set on older rows, and add claim
+    thread mappings for requests claimed before they existed.
+    """
+    updated = 0
+    with client.context():
+        cursor, more = None, True
+        while more:
+            batch, cursor, more = PhotoRequest.query().fetch_page(
+                500, start_cursor=cursor
+            )
+            threads = []
+            for entity in batch:
+                _set_derived_fields(entity)
+                if entity.claimSlackChannel and entity.claimSlackTs:
+                    threads.append(
+                        PhotoRequestClaimThread(
+                            key=_claim_thread_key(
+                                entity.claimSlackChannel, entity.claimSlackTs
+                            ),
+                            uid=entity.uid,
+                        )
+                    )
+            ndb.put_multi(batch + threads)
+            updated += len(batch)
+        mark_rekeyed("PhotoRequest")
+    return updated
+
+
 def get_most_recent_photo_request():
     """Return the single most recent request by submissionTimestamp (or None)."""
     with client.context():
@@ -292,6 +351,7 @@ def update_photo_request(uid, **fields):
                         value = datetime.strptime(value, "%Y-%m-%d").date()
 
                 setattr(entity, key, value)
+        _set_derived_fields(entity)
         entity.put()
         return entity.to_dict()
 
@@ -310,7 +370,7 @@ def claim_photo_request(uid, photogName, photogEmail):
         entity.photogEmail = photogEmail
         entity.photogSlackId = email_to_slackid(photogEmail)
         entity.claimTimestamp = datetime.now(ZoneInfo("America/Chicago"))
-        entity.status = "claimed"
+        _set_derived_fields(entity)
         entity.put()
         return entity.to_dict()
 
@@ -327,14 +387,39 @@ def complete_photo_request(uid, driveURL):
             return None
         entity.driveURL = driveURL
         entity.completedTimestamp = datetime.now(ZoneInfo("America/Chicago"))
-        entity.status = "completed"
+        _set_derived_fields(entity)
         entity.put()
         return entity.to_dict()
 
 
-def get_id_from_slack_claim_ts(ch, thread_ts):
+def set_photo_request_claim_thread(uid, ch, thread_ts):
+    """
+    Record the Slack DM where the claimer was sent their confirmation, on the request
+    and in the claim thread mapping used by get_photo_request_by_claim_thread.
+
+    Returns updated dict, or None if uid not found.
+    """
+    with client.context():
+        entity = PhotoRequest.get_by_id(uid)
+        if entity is None:
+            return None
+        old_key = None
+        if entity.claimSlackChannel and entity.claimSlackTs:
+            old_key = _claim_thread_key(entity.claimSlackChannel, entity.claimSlackTs)
+        entity.claimSlackChannel = ch
+        entity.claimSlackTs = thread_ts
+        thread = PhotoRequestClaimThread(key=_claim_thread_key(ch, thread_ts), uid=uid)
+        ndb.put_multi([entity, thread])
+        if old_key is not None and old_key != thread.key:
+            old_key.delete()
+        return entity.to_dict()
+
+
+def get_photo_request_by_claim_thread(ch, thread_ts):
     """
     Finds a photo request by its Slack claim channel and thread timestamp.
+    Requests claimed before claim thread mappings existed are found by query until
+    backfill_photo_request_fields has run.
 
     Args:
         ch: Slack channel ID where the claim happened
@@ -344,15 +429,27 @@ def get_id_from_slack_claim_ts(ch, thread_ts):
         Dict of the request if found, None otherwise
     """
     with client.context():
-        req = PhotoRequest.query(
-            PhotoRequest.claimSlackChannel == ch, PhotoRequest.claimSlackTs == thread_ts
-        ).get()
-
+        thread = _claim_thread_key(ch, thread_ts).get()
+        if thread is not None:
+            req = PhotoRequest.get_by_id(thread.uid)
+        elif not is_rekeyed("PhotoRequest"):
+            req = PhotoRequest.query(
+                PhotoRequest.claimSlackChannel == ch,
+                PhotoRequest.claimSlackTs == thread_ts,
+            ).get()
+        else:
+            req = None
         if req:
             return req.to_dict()
         return None
 
 
+def claim_threads_backfilled():
+    """Whether every claimed request has a claim thread mapping."""
+    with client.context():
+        return is_rekeyed("PhotoRequest")
+
+
 def delete_photo_request(uid):
     """Delete a single PhotoRequest by UID.
 
@@ -362,7 +459,12 @@ def delete_photo_request(uid):
         entity = PhotoRequest.get_by_id(uid)
         if entity is None:
             return False
-        entity.key.delete()
+        keys = [entity.key]
+        if entity.claimSlackChannel and entity.claimSlackTs:
+            keys.append(
+                _claim_thread_key(entity.claimSlackChannel, entity.claimSlackTs)
+            )
+        ndb.delete_multi(keys)
         return entity.to_dict()
 
 
@@ -372,3 +474,4 @@ def delete_all_photo_requests():
         requests = PhotoRequest.query().fetch()
         for r in requests:
             r.key.delete()
+        ndb.delete_multi(PhotoRequestClaimThread.query().fetch(keys_only=True))
@@ -0,0 +1,133 @@
+"""
+Rolling per-platform posting counters for posting limit checks.
+
+Each PostingCounter (entity id "<kind>:<platform>") holds the times of the posts made
+to a platform in the last POSTING_COUNTER_WINDOW, updated when a post is recorded, so a
+limit check is one key get no matter how many posts are stored. A counter that doesn't
+exist yet is seeded from the posts already stored the first time a post is recorded.
+Until then, checks use count_matching, a server-side COUNT aggregation (ndb's count()
+counts on the client by skipping through the results).
+
+Times are stored as naive UTC; naive datetimes passed in are assumed to be UTC already
+(App Engine's local time).
+"""
+
+from datetime import timedelta, timezone
+
+from google.cloud import datastore, ndb
+from google.cloud.datastore.query import PropertyFilter
+
+from . import client
+from .expiry import utc_now
+
+# Longest window a counter can answer for; older post times are dropped
+POSTING_COUNTER_WINDOW = timedelta(days=31)
+# Post times kept per counter, well above any posting limit
+POSTING_COUNTER_MAX_POSTS = 1000
+
+# google-cloud-datastore client for aggregation queries, which ndb doesn't support
+_datastore_client = None
+
+
+class PostingCounter(ndb.Model):
+    """Recent post times for one platform (entity id "<kind>:<platform>")."""
+
+    posted_at = ndb.DateTimeProperty(repeated=True, indexed=False)
+
+
+def _counter_key(kind, platform):
+    return ndb.Key(PostingCounter, f"{kind}:{platform}")
+
+
+def _to_utc(dt):
+    if dt.tzinfo is None:
+        return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _prune(times):
+    cutoff = utc_now() - POSTING_COUNTER_WINDOW
+    times = sorted(t for t in times if t >= cutoff)
+    return times[-POSTING_COUNTER_MAX_POSTS:]
+
+
+def record_post(kind, platform, posted_at, seed):
+    """
+    Add a post to a platform's counter. Must be called inside a client context, before
+    the post itself is saved.
+
+    :param kind: Kind of the posts being counted, e.g. "DiSocialStory"
+    :param platform: Platform name
+    :param posted_at: When the post was made
+    :param seed: Function returning the post times stored since a given datetime, used
+        to start the counter if it doesn't exist yet
+    """
+    key = _counter_key(kind, platform)
+    seeded = None
+    if key.get() is None:
+        seeded = [_to_utc(t) for t in seed(utc_now() - POSTING_COUNTER_WINDOW)]
+
+    @ndb.transactional()
+    def add():
+        counter = key.get()
+        if counter is None:
+            counter = PostingCounter(key=key, posted_at=seeded or [])
+        counter.posted_at = _prune(counter.posted_at + [_to_utc(posted_at)])
+        counter.put()
+
+    add()
+
+
+def count_posts(kind, platform, since):
+    """
+    Number of posts to a platform since a datetime, or None if the counter can't
+    answer (it doesn't exist yet, or since is older than POSTING_COUNTER_WINDOW).
+    Must be called inside a client context.
+    """
+    since = _to_utc(since)
+    if since < utc_now() - POSTING_COUNTER_WINDOW:
+        return None
+    counter = _counter_key(kind, platform).get()
+    if counter is None:
+        return None
+    return sum(1 for t in counter.posted_at if t >= since)
+
+
+def _get_datastore_client():
+    global _datastore_client
+
+    if _datastore_client is None:
+        _datastore_client = datastore.Client(
+            project=client.project,
+            namespace=client.namespace,
+            database=client.database,
+        )
+    return _datastore_client
+
+
+def count_matching(kind, filters, limit):
+    """
+    Count the entities of a kind matching filters with a COUNT aggregation query,
+    stopping at limit.
+
+    :param kind: Kind to count, e.g. "SocialPost"
+    :param filters: (property name, operator, value) tuples, e.g.
+        ("created_at", ">=", since)
+    :param limit: Count at most this many
+    """
+    datastore_client = _get_datastore_client()
+    query = datastore_client.query(kind=kind)
+    for name, operator, value in filters:
+        query.add_filter(filter=PropertyFilter(name, operator, value))
+    aggregation = datastore_client.aggregation_query(query).count(alias="count")
+    for result in aggregation.fetch(limit=limit):
+        return result[0].value
+    return 0
+
+
+def delete_posting_counters(kind, platforms):
+    """
+    Delete counters so they are seeded again from stored posts. Must be called inside
+    a client context.
+    """
+    ndb.delete_multi([_counter_key(kind, platform) for platform in platforms])
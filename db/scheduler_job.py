@@ -0,0 +1,131 @@
+"""
+Persistent APScheduler jobs, one entity per job.
+
+Used by util.scheduler.DatastoreJobStore. Jobs are grouped by store name (e.g.
+"MAP_JOBS") and indexed by next run time so only due jobs are loaded.
+"""
+
+from contextlib import nullcontext
+from datetime import datetime
+
+from google.cloud import ndb
+
+from . import client
+
+
+class SchedulerJob(ndb.Model):
+    store = ndb.StringProperty()
+    job_id = ndb.StringProperty()
+    # UTC timestamp, None while the job is paused
+    next_run_time = ndb.FloatProperty()
+    job_state = ndb.BlobProperty()
+    updated_at = ndb.DateTimeProperty(indexed=False)
+
+
+def _context():
+    # Jobs may be added from inside another db function's context
+    if ndb.get_context(False) is not None:
+        return nullcontext()
+    return client.context()
+
+
+def _job_key(store, job_id):
+    return ndb.Key(SchedulerJob, f"{store}:{job_id}")
+
+
+def get_scheduler_job_state(store, job_id):
+    """Return the pickled state of a job, or None."""
+
+    with _context():
+        job = _job_key(store, job_id).get()
+        return job.job_state if job else None
+
+
+def get_scheduler_job_states(store, max_next_run_time=None):
+    """
+    Return (job_id, job_state) for scheduled jobs ordered by next run time.
+    Only jobs due at or before max_next_run_time when it is given.
+    """
+
+    with _context():
+        query = SchedulerJob.query(SchedulerJob.store == store)
+        if max_next_run_time is not None:
+            query = query.filter(SchedulerJob.next_run_time <= max_next_run_time)
+        else:
+            # Null sorts before numbers, so this skips paused jobs
+            query = query.filter(SchedulerJob.next_run_time >= 0.0)
+        jobs = query.order(SchedulerJob.next_run_time).fetch()
+        return [(job.job_id, job.job_state) for job in jobs]
+
+
+def get_paused_scheduler_job_states(store):
+    """Return (job_id, job_state) for jobs without a next run time."""
+
+    with _context():
+        jobs = SchedulerJob.query(
+            SchedulerJob.store == store, SchedulerJob.next_run_time == None
+        ).fetch()
+        return [(job.job_id, job.job_state) for job in jobs]
+
+
+def get_next_scheduler_run_time(store):
+    """Return the earliest next run time (UTC timestamp) in a store, or None."""
+
+    with _context():
+        job = (
+            SchedulerJob.query(
+                SchedulerJob.store == store, SchedulerJob.next_run_time >= 0.0
+            )
+            .order(SchedulerJob.next_run_time)
+            .get()
+        )
+        return job.next_run_time if job else None
+
+
+def put_scheduler_job(store, job_id, next_run_time, job_state, must_exist=None):
+    """
+    Save a job. Returns False without writing if must_exist is True and the job is
+    missing, or must_exist is False and the job already exists.
+    """
+
+    @ndb.transactional()
+    def save():
+        key = _job_key(store, job_id)
+        if must_exist is not None and (key.get() is not None) != must_exist:
+            return False
+        SchedulerJob(
+            key=key,
+            store=store,
+            job_id=job_id,
+            next_run_time=next_run_time,
+            job_state=job_state,
+            updated_at=datetime.now(),
+        ).put()
+        return True
+
+    with _context():
+        return save()
+
+
+def delete_scheduler_job(store, job_id):
+    """Delete a job; returns whether it existed."""
+
+    @ndb.transactional()
+    def delete():
+        key = _job_key(store, job_id)
+        if key.get() is None:
+            return False
+        key.delete()
+        return True
+
+    with _context():
+        return delete()
+
+
+def delete_all_scheduler_jobs(store):
+    """Delete every job in a store; returns how many were deleted."""
+
+    with _context():
+        keys = SchedulerJob.query(SchedulerJob.store == store).fetch(keys_only=True)
+        ndb.delete_multi(keys)
+        return len(keys)
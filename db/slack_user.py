@@ -0,0 +1,108 @@
+"""
+Persistent Slack user directory, one entity per Slack user.
+
+Used by util.slackbots.user_directory, which keeps an in-process cache in front of it
+and refreshes entries from Slack once they are older than its staleness window.
+Entries that haven't been refreshed in SLACK_USER_RETENTION are removed by the expiry
+sweep (e.g. users who left the workspace).
+"""
+
+from datetime import timedelta
+
+from google.cloud import ndb
+
+from . import client
+from .expiry import register_expiry, utc_now
+
+# Entries not refreshed (by a lookup or the directory warm-up) for this long are deleted
+SLACK_USER_RETENTION = timedelta(days=30)
+
+
+class SlackUser(ndb.Model):
+    """A Slack user; the entity id is their Slack user ID."""
+
+    # Lowercased, for lookups by email
+    email = ndb.StringProperty()
+    real_name = ndb.TextProperty()
+    display_name = ndb.TextProperty()
+    profile = ndb.JsonProperty()
+    deleted = ndb.BooleanProperty(indexed=False)
+    is_bot = ndb.BooleanProperty(indexed=False)
+    # Naive UTC time the entry was last fetched from Slack
+    fetched_at = ndb.DateTimeProperty()
+
+
+def _slack_user_cutoff():
+    return utc_now() - SLACK_USER_RETENTION
+
+
+register_expiry(SlackUser, SlackUser.fetched_at, cutoff=_slack_user_cutoff)
+
+
+def _to_record(entity):
+    record = entity.to_dict()
+    record["id"] = entity.key.id()
+    return record
+
+
+def get_slack_user(user_id):
+    """Return the stored record for a Slack user ID, or None."""
+
+    with client.context():
+        entity = SlackUser.get_by_id(user_id)
+        return _to_record(entity) if entity else None
+
+
+def get_slack_user_by_email(email):
+    """Return the stored record for an email address (case-insensitive), or None."""
+
+    with client.context():
+        entity = SlackUser.query(SlackUser.email == email.strip().lower()).get()
+        return _to_record(entity) if entity else None
+
+
+def get_slack_users_by_email(emails):
+    """
+    Return {email: record} for the stored users among emails (lowercase), with one
+    query per 30 emails.
+    """
+
+    emails = sorted({email.strip().lower() for email in emails if email})
+    records = {}
+    with client.context():
+        # Datastore allows 30 values per IN filter; server_op sends it as one query
+        # instead of one per value
+        for start in range(0, len(emails), 30):
+            entities = SlackUser.query(
+                SlackUser.email.IN(emails[start : start + 30], server_op=True)
+            ).fetch()
+            for entity in entities:
+                records[entity.email] = _to_record(entity)
+    return records
+
+
+def put_slack_users(records):
+    """
+    Save user records (dicts with id, email, real_name, display_name, profile, deleted
+    and is_bot), stamping them as fetched now. Returns how many were saved.
+    """
+
+    now = utc_now()
+    entities = [
+        SlackUser(
+            id=record["id"],
+            email=(record.get("email") or "").lower() or None,
+            real_name=record.get("real_name"),
+            display_name=record.get("display_name"),
+            profile=record.get("profile") or {},
+            deleted=bool(record.get("deleted")),
+            is_bot=bool(record.get("is_bot")),
+            fetched_at=now,
+        )
+        for record in records
+    ]
+    with client.context():
+        # Datastore allows 500 entities per commit
+        for start in range(0, len(entities), 500):
+            ndb.put_multi(entities[start : start + 500])
+    return len(entities)
@@ -3,6 +3,7 @@ from datetime import datetime, timedelta
 from google.cloud import ndb
 
 from . import client
+from .posting_counter import count_matching, count_posts, record_post
 
 
 class SocialPlatform(StrEnum):
@@ -19,6 +20,18 @@ class SocialPost(ndb.Model):
     created_at = ndb.DateTimeProperty()
 
 
+def _seed_counter(platform):
+    def seed(since):
+        return [
+            post.created_at
+            for post in SocialPost.query(
+                SocialPost.platform == platform, SocialPost.created_at >= since
+            ).fetch(projection=[SocialPost.created_at])
+        ]
+
+    return seed
+
+
 def add_post(title, url, platform, created_by):
     with client.context():
         post = SocialPost(
@@ -28,6 +41,7 @@ def add_post(title, url, platform, created_by):
             created_by=created_by,
             created_at=datetime.now(),
         )
+        record_post("SocialPost", platform, post.created_at, _seed_counter(platform))
         post.put()
     return post.to_dict()
 
@@ -60,13 +74,15 @@ def check_limit(platform, limit, days):
     with client.context():
         current_datetime = datetime.now()
         start_datetime = current_datetime - timedelta(days=days)
-        recent_posts = (
-            SocialPost.query()
-            .filter(
-                SocialPost.platform == platform,
-                SocialPost.created_at >= start_datetime,
-                SocialPost.created_at <= current_datetime,
+        recent_posts = count_posts("SocialPost", platform, start_datetime)
+        if recent_posts is None:
+            recent_posts = count_matching(
+                "SocialPost",
+                [
+                    ("platform", "=", str(platform)),
+                    ("created_at", ">=", start_datetime),
+                    ("created_at", "<=", current_datetime),
+                ],
+                limit,
             )
-            .fetch()
-        )
-    return len(recent_posts) >= limit
+    return recent_posts >= limit
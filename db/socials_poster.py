@@ -5,16 +5,35 @@ Contains the DiSocialStory model and CRUD operations for tracking social media p
 across platforms (Instagram, Facebook, Reddit, X, Threads). Handles story creation,
 updates, queries, and posting limits.
 
+Stories are keyed by their URL (see db.story_keys), and the Slack message posted for a
+story has a SlackMessageRef, so lookups by URL or by message are key gets. Posting
+limits are checked against rolling per-platform counters (see db.posting_counter).
+
 Last modified by Aryaa Rathi on Feb 19, 2026
 """
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 from google.cloud import ndb
 from typing import Any, Optional
 from constants import SOCIAL_MEDIA_POSTS_CHANNEL_ID
 
 from . import client
+from .expiry import register_expiry, utc_now
+from .posting_counter import (
+    count_matching,
+    count_posts,
+    delete_posting_counters,
+    record_post,
+)
+from .story_keys import (
+    get_slack_message_target,
+    is_rekeyed,
+    mark_rekeyed,
+    slack_message_ref,
+    slack_message_ref_key,
+    story_url_id,
+)
 
 
 class DiSocialStory(ndb.Model):
@@ -26,7 +45,9 @@ class DiSocialStory(ndb.Model):
     story_posted_timestamp = ndb.DateTimeProperty(tzinfo=ZoneInfo("America/Chicago"))
     slack_message_ts = (
         ndb.StringProperty()
-    )  # Slack message ts (Unix); used for reaction lookup and "when posted"
+    )  # Slack message ts (Unix); used for reaction lookup
+    # When the Slack message was posted, from slack_message_ts; used for posting limits
+    slack_posted_at = ndb.DateTimeProperty(tzinfo=ZoneInfo("America/Chicago"))
     instagram_timestamp = ndb.DateTimeProperty(tzinfo=ZoneInfo("America/Chicago"))
     facebook_timestamp = ndb.DateTimeProperty(tzinfo=ZoneInfo("America/Chicago"))
     reddit_timestamp = ndb.DateTimeProperty(tzinfo=ZoneInfo("America/Chicago"))
@@ -34,6 +55,103 @@ class DiSocialStory(ndb.Model):
     threads_timestamp = ndb.DateTimeProperty(tzinfo=ZoneInfo("America/Chicago"))
 
 
+# Stories older than this are deleted by the expiry sweeper, well past any posting
+# limit window
+SOCIAL_STORY_RETENTION = timedelta(days=365)
+
+
+def _social_story_cutoff():
+    return utc_now() - SOCIAL_STORY_RETENTION
+
+
+def _slack_ref_keys(stories):
+    return [
+        slack_message_ref_key(SOCIAL_MEDIA_POSTS_CHANNEL_ID, story.slack_message_ts)
+        for story in stories
+        if story.slack_message_ts
+    ]
+
+
+def _delete_slack_refs(stories):
+    ndb.delete_multi(_slack_ref_keys(stories))
+
+
+register_expiry(
+    DiSocialStory,
+    DiSocialStory.story_posted_timestamp,
+    cutoff=_social_story_cutoff,
+    on_expire=_delete_slack_refs,
+)
+
+
+def _story_key(url):
+    return ndb.Key(DiSocialStory, story_url_id(url))
+
+
+def _get_story(url):
+    story = _story_key(url).get()
+    if story is None and not is_rekeyed("DiSocialStory"):
+        # Saved before stories were keyed by URL, and not moved yet
+        story = DiSocialStory.query(DiSocialStory.story_url == url).get()
+    return story
+
+
+# Platform name: property holding when a story was posted there
+_PLATFORM_TIMESTAMPS = {
+    "Slack": "slack_posted_at",
+    "Instagram": "instagram_timestamp",
+    "Facebook": "facebook_timestamp",
+    "Reddit": "reddit_timestamp",
+    "X": "x_timestamp",
+    "Threads": "threads_timestamp",
+}
+
+
+def _platform_timestamp(social_media_name):
+    name = _PLATFORM_TIMESTAMPS.get(social_media_name)
+    if name is None:
+        raise ValueError(f"Invalid social media name: {social_media_name}")
+    return getattr(DiSocialStory, name)
+
+
+def _slack_ts_bound(dt):
+    """
+    The Slack ts string for a datetime (naive ones are taken as UTC). Slack ts strings
+    all have 10 digits before the point, so they sort like the times they stand for.
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return f"{dt.timestamp():.6f}"
+
+
+def _legacy_slack_post_times(since):
+    """
+    Slack post times since a datetime, parsed from slack_message_ts, for stories saved
+    before slack_posted_at was (until the backfill sets it on them).
+    """
+    times = (
+        _slack_ts_to_datetime(story.slack_message_ts)
+        for story in DiSocialStory.query(
+            DiSocialStory.slack_message_ts >= _slack_ts_bound(since)
+        ).fetch(projection=[DiSocialStory.slack_message_ts])
+    )
+    return [t for t in times if t is not None]
+
+
+def _record_post(social_media_name, posted_at):
+    field = _platform_timestamp(social_media_name)
+
+    def seed(since):
+        if social_media_name == "Slack" and not is_rekeyed("DiSocialStory"):
+            return _legacy_slack_post_times(since)
+        return [
+            getattr(story, field._name)
+            for story in DiSocialStory.query(field >= since).fetch(projection=[field])
+        ]
+
+    record_post("DiSocialStory", social_media_name, posted_at, seed)
+
+
 def add_social_story(url, name, date=None):
     """
     Create a new social story record in the database.
@@ -48,6 +166,7 @@ def add_social_story(url, name, date=None):
     """
     with client.context():
         story = DiSocialStory(
+            key=_story_key(url),
             story_url=url,
             story_name=name,
             story_posted_timestamp=datetime.now(ZoneInfo("America/Chicago"))
@@ -65,7 +184,8 @@ def add_social_story(url, name, date=None):
 
 def update_slack_details(url, message_ts):
     """
-    Update the Slack message timestamp for a story by URL.
+    Update the Slack message timestamp for a story by URL. The message is assumed to
+    be in SOCIAL_MEDIA_POSTS_CHANNEL_ID.
 
     Args:
         url: Story URL to update
@@ -75,11 +195,19 @@ def update_slack_details(url, message_ts):
         dict: Updated story as dictionary, or None if not found
     """
     with client.context():
-        query = DiSocialStory.query().filter(DiSocialStory.story_url == url)
-        story = query.get()
+        story = _get_story(url)
         if story:
+            old_refs = _slack_ref_keys([story])
+            posted_at = _slack_ts_to_datetime(message_ts)
+            if story.slack_posted_at is None and posted_at is not None:
+                _record_post("Slack", posted_at)
             story.slack_message_ts = message_ts
-            story.put()
+            story.slack_posted_at = posted_at
+            ref = slack_message_ref(
+                SOCIAL_MEDIA_POSTS_CHANNEL_ID, message_ts, story.key
+            )
+            ndb.put_multi([story, ref])
+            ndb.delete_multi([key for key in old_refs if key != ref.key])
             return story.to_dict()
         else:
             return None
@@ -97,25 +225,18 @@ def update_social(url, social_media_name):
         dict: Updated story as dictionary, or None if not found
     """
     with client.context():
-        query = DiSocialStory.query().filter(DiSocialStory.story_url == url)
-        story = query.get()
+        story = _get_story(url)
         if story:
             now = datetime.now(ZoneInfo("America/Chicago"))
+            field = _platform_timestamp(social_media_name)
             if social_media_name == "Slack":
                 # Slack "posted" time is set when the slackbot calls update_slack_details with message_ts
                 pass
-            elif social_media_name == "Instagram":
-                story.instagram_timestamp = now
-            elif social_media_name == "Facebook":
-                story.facebook_timestamp = now
-            elif social_media_name == "Reddit":
-                story.reddit_timestamp = now
-            elif social_media_name == "X":
-                story.x_timestamp = now
-            elif social_media_name == "Threads":
-                story.threads_timestamp = now
             else:
-                raise ValueError(f"Invalid social media name: {social_media_name}")
+                # Only a story's first post to a platform counts towards its limit
+                if getattr(story, field._name) is None:
+                    _record_post(social_media_name, now)
+                setattr(story, field._name, now)
             story.put()
             return story.to_dict()
         else:
@@ -165,14 +286,41 @@ def get_story_by_url(url):
         dict: Story as dictionary, or None if not found
     """
     with client.context():
-        query = DiSocialStory.query().filter(DiSocialStory.story_url == url)
-        story = query.get()
+        story = _get_story(url)
         if story:
             return story.to_dict()
         else:
             return None
 
 
+def get_existing_story_urls(urls):
+    """
+    Find which of several story URLs are already stored, in one batch.
+
+    Args:
+        urls: Story URLs to check
+
+    Returns:
+        set: The URLs that have a story
+    """
+    urls = list(set(urls))
+    with client.context():
+        stories = ndb.get_multi([_story_key(url) for url in urls])
+        existing = {url for url, story in zip(urls, stories) if story is not None}
+        missing = sorted(set(urls) - existing)
+        if missing and not is_rekeyed("DiSocialStory"):
+            # Stories not moved to their URL keys yet; 30 values per IN filter, run on
+            # the server (IN-filtered properties can't be projected)
+            for start in range(0, len(missing), 30):
+                legacy = DiSocialStory.query(
+                    DiSocialStory.story_url.IN(
+                        missing[start : start + 30], server_op=True
+                    )
+                ).fetch()
+                existing.update(story.story_url for story in legacy)
+    return existing
+
+
 def get_story_by_slack_message(
     channel_id: str, message_ts: str
 ) -> Optional[dict[str, Any]]:
@@ -182,12 +330,15 @@ def get_story_by_slack_message(
     if not message_ts or channel_id != SOCIAL_MEDIA_POSTS_CHANNEL_ID:
         return None
     with client.context():
-        story = (
-            DiSocialStory.query()
-            .filter(DiSocialStory.slack_message_ts == message_ts)
-            .get()
-        )
-        return story.to_dict() if story else None
+        story = get_slack_message_target(channel_id, message_ts)
+        if story is None and not is_rekeyed("DiSocialStory"):
+            # Posted before Slack messages had refs, and not backfilled yet
+            story = DiSocialStory.query(
+                DiSocialStory.slack_message_ts == message_ts
+            ).get()
+        if not isinstance(story, DiSocialStory):
+            return None
+        return story.to_dict()
 
 
 def delete_all_stories():
@@ -199,11 +350,66 @@ def delete_all_stories():
     """
     with client.context():
         stories = DiSocialStory.query().fetch()
-        for story in stories:
-            story.key.delete()
+        ndb.delete_multi([story.key for story in stories] + _slack_ref_keys(stories))
     return "All social stories deleted"
 
 
+def backfill_social_stories():
+    """
+    Move stories saved before they were keyed by URL to their URL keys, add the Slack
+    message refs and slack_posted_at they're missing, and reseed the posting counters.
+    A story already saved under its URL key keeps its values; the old row only fills
+    in what it's missing. Returns how many stories were updated.
+    """
+    updated = 0
+    with client.context():
+        cursor, more = None, True
+        while more:
+            batch, cursor, more = DiSocialStory.query().fetch_page(
+                500, start_cursor=cursor
+            )
+            keys = [
+                _story_key(story.story_url) if story.story_url else None
+                for story in batch
+            ]
+            keyed = {
+                story.key: story
+                for story in ndb.get_multi([key for key in keys if key is not None])
+                if story is not None
+            }
+            puts, deletes = {}, []
+            for story, key in zip(batch, keys):
+                if key is None:
+                    continue
+                moved = story.key != key
+                message_ts = {story.slack_message_ts}
+                if moved:
+                    deletes.append(story.key)
+                    values = story.to_dict(exclude=["uid"])
+                    target = puts.get(key) or keyed.get(key)
+                    if target is None:
+                        story = DiSocialStory(key=key, **values)
+                    else:
+                        for name, value in values.items():
+                            if getattr(target, name) is None:
+                                setattr(target, name, value)
+                        story = target
+                posted_at = _slack_ts_to_datetime(story.slack_message_ts)
+                if moved or story.slack_posted_at != posted_at:
+                    story.slack_posted_at = posted_at
+                    puts[story.key] = story
+                    updated += 1
+                # A merged row's old message still points at the story
+                for ts in (message_ts | {story.slack_message_ts}) - {None, ""}:
+                    ref = slack_message_ref(SOCIAL_MEDIA_POSTS_CHANNEL_ID, ts, key)
+                    puts[ref.key] = ref
+            ndb.put_multi(list(puts.values()))
+            ndb.delete_multi(deletes)
+        delete_posting_counters("DiSocialStory", _PLATFORM_TIMESTAMPS)
+        mark_rekeyed("DiSocialStory")
+    return updated
+
+
 # SAMPLE_STORIES = [
 #     {
 #         "story_url": "https://dailyillini.com/2026/02/10/campus-event-celebrates-community/",
@@ -246,7 +452,7 @@ def _slack_ts_to_datetime(ts):
     if not ts:
         return None
     try:
-        return datetime.fromtimestamp(float(ts))
+        return datetime.fromtimestamp(float(ts), ZoneInfo("America/Chicago"))
     except (ValueError, TypeError):
         return None
 
@@ -263,38 +469,20 @@ def check_limit(social_media_name, limit, days):
     Returns:
         bool: True if limit reached, False otherwise
     """
+    timestamp_field = _platform_timestamp(social_media_name)
     with client.context():
         current_datetime = datetime.now(ZoneInfo("America/Chicago"))
         start_datetime = current_datetime - timedelta(days=days)
 
-        if social_media_name == "Slack":
-            # Slack uses slack_message_ts (string); derive datetime for window
-            stories = (
-                DiSocialStory.query()
-                .filter(DiSocialStory.slack_message_ts != None)
-                .fetch()
-            )
-            recent_posts = []
-            for s in stories:
-                dt = _slack_ts_to_datetime(s.slack_message_ts)
-                if dt and start_datetime <= dt <= current_datetime:
-                    recent_posts.append(s)
-        else:
-            timestamp_field = {
-                "Instagram": DiSocialStory.instagram_timestamp,
-                "Facebook": DiSocialStory.facebook_timestamp,
-                "Reddit": DiSocialStory.reddit_timestamp,
-                "X": DiSocialStory.x_timestamp,
-                "Threads": DiSocialStory.threads_timestamp,
-            }.get(social_media_name)
-            if timestamp_field is None:
-                raise ValueError(f"Invalid social media name: {social_media_name}")
-            recent_posts = (
-                DiSocialStory.query()
-                .filter(
-                    timestamp_field >= start_datetime,
-                    timestamp_field <= current_datetime,
-                )
-                .fetch()
+        recent_posts = count_posts("DiSocialStory", social_media_name, start_datetime)
+        if recent_posts is None:
+            # No counter for this window; count on the server, stopping at the limit
+            name, start, end = timestamp_field._name, start_datetime, current_datetime
+            if social_media_name == "Slack" and not is_rekeyed("DiSocialStory"):
+                # Older stories only have slack_message_ts until the backfill runs
+                name = "slack_message_ts"
+                start, end = _slack_ts_bound(start), _slack_ts_bound(end)
+            recent_posts = count_matching(
+                "DiSocialStory", [(name, ">=", start), (name, "<=", end)], limit
             )
-        return len(recent_posts) >= limit
+        return recent_posts >= limit
@@ -1,6 +1,18 @@
+from collections import deque
+from threading import Lock
+import time
+
 from google.cloud import ndb
 import datetime
 from db import client
+from db.expiry import EXPIRY_BATCH_SIZE, register_expiry, utc_now
+
+# Version of the latest song request write on this instance, for the dashboard stream.
+# Changed requests are found by polling updated_at, but deletions can't be, so the
+# (version, uid) of recent ones are kept here.
+_changes_lock = Lock()
+_change_version = 0
+_recent_deletions = deque(maxlen=500)
 
 
 class SongRequest(ndb.Model):
@@ -23,6 +35,54 @@ class SongRequest(ndb.Model):
 
     slack_ts = ndb.StringProperty()
 
+    updated_at = ndb.DateTimeProperty(auto_now=True)
+
+
+def _notify_song_request_change(deleted_uids=()):
+    global _change_version
+
+    with _changes_lock:
+        _change_version += 1
+        for uid in deleted_uids:
+            _recent_deletions.append((_change_version, str(uid)))
+
+
+def get_song_request_change_version():
+    """Return the version of the latest song request write on this instance."""
+
+    with _changes_lock:
+        return _change_version
+
+
+def get_song_request_deletions_since(version):
+    """Return (latest version, uids deleted on this instance since version)."""
+
+    with _changes_lock:
+        deleted = [uid for v, uid in _recent_deletions if v > version]
+        return _change_version, deleted
+
+
+# Seconds a worker has to deliver a claimed side effect before another may retry it
+SONG_REQUEST_EFFECT_LEASE = 120
+# Deliveries tried before a side effect is marked failed
+SONG_REQUEST_EFFECT_MAX_ATTEMPTS = 5
+
+
+class SongRequestEffect(ndb.Model):
+    """
+    Outbox record for a side effect of a song request (Slack post, email, DM).
+
+    Stored as a child of its SongRequest, keyed by kind, so it is written in the same
+    transaction as the request and each effect is delivered at most once per success.
+    """
+
+    kind = ndb.StringProperty()
+    status = ndb.StringProperty(default="pending")  # pending, done, failed
+    attempts = ndb.IntegerProperty(default=0, indexed=False)
+    lease_until = ndb.DateTimeProperty(indexed=False)
+    last_error = ndb.TextProperty()
+    created_at = ndb.DateTimeProperty(auto_now_add=True)
+
 
 def create_song_request(
     song_name,
@@ -31,8 +91,15 @@ def create_song_request(
     submitter_email,
     is_imc_employee,
     submitter_slack_id,
+    effects=(),
 ):
-    with client.context():
+    """
+    Save a song request and its pending side effects (outbox records) in one
+    transaction. Delivery is left to deliver_song_request_effects.
+    """
+
+    @ndb.transactional()
+    def create():
         song_request = SongRequest(
             song_name=song_name,
             artist_name=artist_name,
@@ -42,14 +109,122 @@ def create_song_request(
             submitter_slack_id=submitter_slack_id,
         )
         song_request.put()
+        ndb.put_multi(
+            [
+                SongRequestEffect(id=kind, parent=song_request.key, kind=kind)
+                for kind in effects
+            ]
+        )
         return song_request
 
+    with client.context():
+        song_request = create()
+    _notify_song_request_change()
+    return song_request
+
+
+def get_pending_song_request_effects(request_id):
+    """Return the kinds of a request's side effects that still need delivering."""
+
+    with client.context():
+        effects = SongRequestEffect.query(
+            SongRequestEffect.status == "pending",
+            ancestor=ndb.Key(SongRequest, int(request_id)),
+        ).fetch()
+        return [effect.kind for effect in effects]
+
+
+def get_undelivered_song_request_ids(limit=100):
+    """Return ids of requests with pending side effects, for the outbox cron."""
+
+    with client.context():
+        keys = SongRequestEffect.query(SongRequestEffect.status == "pending").fetch(
+            limit, keys_only=True
+        )
+        return list(dict.fromkeys(key.parent().id() for key in keys))
+
+
+def claim_song_request_effect(request_id, kind):
+    """
+    Lease a pending side effect for delivery. Returns False if it is done, failed,
+    missing or already leased by another worker.
+    """
+
+    @ndb.transactional()
+    def claim():
+        key = ndb.Key(SongRequest, int(request_id), SongRequestEffect, kind)
+        effect = key.get()
+        now = utc_now()
+        if effect is None or effect.status != "pending":
+            return False
+        if effect.lease_until and effect.lease_until > now:
+            return False
+        effect.attempts += 1
+        effect.lease_until = now + datetime.timedelta(seconds=SONG_REQUEST_EFFECT_LEASE)
+        effect.put()
+        return True
+
+    with client.context():
+        return claim()
+
+
+def complete_song_request_effect(request_id, kind, error=None):
+    """
+    Record the outcome of a claimed side effect. On error it goes back to pending
+    until it has been tried SONG_REQUEST_EFFECT_MAX_ATTEMPTS times.
+    """
+
+    @ndb.transactional()
+    def complete():
+        key = ndb.Key(SongRequest, int(request_id), SongRequestEffect, kind)
+        effect = key.get()
+        if effect is None:
+            return
+        if error is None:
+            effect.status = "done"
+        elif effect.attempts >= SONG_REQUEST_EFFECT_MAX_ATTEMPTS:
+            effect.status = "failed"
+        effect.last_error = error
+        effect.lease_until = None
+        effect.put()
+
+    with client.context():
+        complete()
+
 
 def get_all_song_requests():
     with client.context():
         return SongRequest.query().order(-SongRequest.timestamp).fetch()
 
 
+def get_song_requests_page(status=None, limit=50, cursor=None):
+    """
+    Return (requests, next_cursor) for one page of requests, newest first, optionally
+    with a given status. next_cursor is a urlsafe string, or None on the last page.
+    """
+
+    with client.context():
+        query = SongRequest.query()
+        if status:
+            query = query.filter(SongRequest.status == status)
+        start_cursor = ndb.Cursor(urlsafe=cursor) if cursor else None
+        requests, next_cursor, more = query.order(-SongRequest.timestamp).fetch_page(
+            limit, start_cursor=start_cursor
+        )
+        return requests, next_cursor.urlsafe().decode() if more else None
+
+
+def get_song_requests_changed_since(since, limit=100):
+    """Return requests written after since (naive UTC), oldest change first."""
+
+    with client.context():
+        return (
+            SongRequest.query(SongRequest.updated_at > since)
+            .order(SongRequest.updated_at)
+            .fetch(limit)
+        )
+
+
 def update_request_status(
     request_id, new_status, reviewer_name=None, rejection_reason=None
 ):
@@ -60,6 +235,7 @@ def update_request_status(
             song_request.reviewer_name = reviewer_name
             song_request.rejection_reason = rejection_reason
             song_request.put()
+            _notify_song_request_change()
             return song_request
         return None
 
@@ -74,27 +250,82 @@ def update_slack_ts(request_id, ts):
         return None
 
 
-def delete_all_song_requests():
-    with client.context():
-        keys = SongRequest.query().fetch(keys_only=True)
+def _delete_all_keys(model):
+    # Keys-only pages, one delete_multi per page, to stay under per-RPC limits
+    deleted = []
+    cursor, more = None, True
+    while more:
+        keys, cursor, more = model.query().fetch_page(
+            EXPIRY_BATCH_SIZE, start_cursor=cursor, keys_only=True
+        )
         ndb.delete_multi(keys)
-        return len(keys)
+        deleted.extend(keys)
+    return deleted
 
 
-def delete_old_song_requests(days_old=60):
+def delete_all_song_requests():
     with client.context():
-        now_utc_naive = datetime.datetime.now(datetime.timezone.utc).replace(
-            tzinfo=None
-        )
-        cutoff_date = now_utc_naive - datetime.timedelta(days=days_old)
-        keys = SongRequest.query(SongRequest.timestamp < cutoff_date).fetch(
-            keys_only=True
-        )
+        keys = _delete_all_keys(SongRequest)
+        _delete_all_keys(SongRequestEffect)
+    _notify_song_request_change(deleted_uids=[key.id() for key in keys])
+    return len(keys)
+
+
+# Requests older than this are deleted by the expiry sweeper
+SONG_REQUEST_RETENTION = datetime.timedelta(days=60)
+# Expired requests per sweeper batch; each may need a Slack chat.delete call
+SONG_REQUEST_EXPIRY_BATCH_SIZE = 50
+# Seconds between Slack message deletions, under chat.delete's ~50 per minute limit
+SLACK_DELETE_INTERVAL = 1.2
 
-        if keys:
-            ndb.delete_multi(keys)
 
-        return len(keys)
+def _song_request_cutoff():
+    return utc_now() - SONG_REQUEST_RETENTION
+
+
+def _on_song_requests_expired(song_requests):
+    """
+    Expiry sweeper hook: remove expired requests' messages from the Slack channel.
+    Requests whose message couldn't be deleted are kept, so the next sweep retries them.
+    """
+
+    # Imported here because the Slack bot module imports this one
+    from util.slackbots.song_request import delete_song_request_message
+
+    metrics = {"slack_deleted": 0, "slack_failed": 0}
+    kept = []
+    for song_request in song_requests:
+        if not song_request.slack_ts:
+            continue
+        res = delete_song_request_message(message_ts=song_request.slack_ts)
+        if res.get("ok") or "message_not_found" in str(res.get("error") or ""):
+            metrics["slack_deleted"] += 1
+        else:
+            metrics["slack_failed"] += 1
+            kept.append(song_request.key)
+        time.sleep(SLACK_DELETE_INTERVAL)
+
+    _notify_song_request_change(
+        deleted_uids=[
+            song_request.key.id()
+            for song_request in song_requests
+            if song_request.key not in kept
+        ]
+    )
+    metrics["kept"] = kept
+    return metrics
+
+
+register_expiry(
+    SongRequest,
+    SongRequest.timestamp,
+    cutoff=_song_request_cutoff,
+    on_expire=_on_song_requests_expired,
+    batch_size=SONG_REQUEST_EXPIRY_BATCH_SIZE,
+)
+register_expiry(
+    SongRequestEffect, SongRequestEffect.created_at, cutoff=_song_request_cutoff
+)
 
 
 def get_song_request_by_id(uid):
@@ -109,5 +340,7 @@ def delete_song_request(uid):
         if not song_key.get():
             return False
 
-        song_key.delete()
-        return True
+        effect_keys = SongRequestEffect.query(ancestor=song_key).fetch(keys_only=True)
+        ndb.delete_multi([song_key] + effect_keys)
+    _notify_song_request_change(deleted_uids=[uid])
+    return True
@@ -2,6 +2,13 @@ from datetime import datetime
 from google.cloud import ndb
 
 from . import client
+from .story_keys import (
+    get_slack_message_target,
+    is_rekeyed,
+    mark_rekeyed,
+    slack_message_ref,
+    story_url_id,
+)
 
 
 class Story(ndb.Model):
@@ -12,25 +19,99 @@ class Story(ndb.Model):
     slack_message_id = ndb.StringProperty()
     created_by = ndb.StringProperty()
     created_at = ndb.DateTimeProperty()
+    slack_channel_id = ndb.StringProperty()
+    # Publish watcher state (see util.breaking_news_watcher)
+    published_url = ndb.TextProperty()
+    published_at = ndb.DateTimeProperty(indexed=False)
+    # When the watcher should next check WordPress; None once published or given up
+    next_check_at = ndb.DateTimeProperty()
+    checks = ndb.IntegerProperty(indexed=False, default=0)
+    wp_etag = ndb.TextProperty()
+    wp_last_modified = ndb.TextProperty()
+
+
+def _to_record(story):
+    record = story.to_dict()
+    record["id"] = story.key.id()
+    return record
 
 
 def add_story(
-    title, url, post_to_reddit, post_to_twitter, slack_message_id, created_by
+    title,
+    url,
+    post_to_reddit,
+    post_to_twitter,
+    slack_message_id,
+    created_by,
+    slack_channel_id=None,
 ):
+    """
+    Save a breaking story, keyed by its URL. When slack_channel_id is given, the
+    story can be found from its Slack message with get_story_by_slack_message(), and
+    the publish watcher updates that message once the story is live.
+    """
+    now = datetime.now()
     with client.context():
         story = Story(
+            id=story_url_id(url),
             title=title,
             url=url,
             post_to_reddit=post_to_reddit,
             post_to_twitter=post_to_twitter,
             slack_message_id=slack_message_id,
             created_by=created_by,
-            created_at=datetime.now(),
+            created_at=now,
+            slack_channel_id=slack_channel_id,
+            next_check_at=now if slack_channel_id and slack_message_id else None,
         )
-        story.put()
+        entities = [story]
+        if slack_channel_id and slack_message_id:
+            entities.append(
+                slack_message_ref(slack_channel_id, slack_message_id, story.key)
+            )
+        ndb.put_multi(entities)
     return story.to_dict()
 
 
+def get_story_by_slack_message(channel_id, message_ts):
+    """Return the story posted as a Slack message, or None."""
+    if not message_ts:
+        return None
+    with client.context():
+        story = get_slack_message_target(channel_id, message_ts)
+        if story is None and not is_rekeyed("Story"):
+            # Posted before stories were keyed by URL, and not moved yet
+            story = Story.query(Story.slack_message_id == message_ts).get()
+        if not isinstance(story, Story):
+            return None
+        return _to_record(story)
+
+
+def get_stories_due_for_check(now, limit):
+    """Return up to limit watched stories whose next publish check is due."""
+    with client.context():
+        stories = (
+            Story.query(Story.next_check_at <= now)
+            .order(Story.next_check_at)
+            .fetch(limit=limit)
+        )
+        return [_to_record(story) for story in stories]
+
+
+def update_story_watch(story_id, **fields):
+    """
+    Set publish watcher fields (slack_channel_id, published_url, published_at,
+    next_check_at, checks, wp_etag, wp_last_modified) on a story. Returns the updated story, or None.
+    """
+    with client.context():
+        story = Story.get_by_id(story_id)
+        if story is None:
+            return None
+        story.populate(**fields)
+        story.put()
+        return _to_record(story)
+
+
 def get_all_stories():
     with client.context():
         stories = [story.to_dict() for story in Story.query().fetch()]
@@ -51,3 +132,48 @@ def delete_all_stories():
         stories = Story.query().fetch()
         for story in stories:
             story.key.delete()
+
+
+def rekey_stories(slack_channel_id):
+    """
+    Move stories saved before they were keyed by URL to their URL keys, and add
+    Slack message refs (for messages in slack_channel_id) they're missing. A story
+    already saved under its URL key is kept, and the old row's message points at it.
+    Returns how many stories were moved.
+    """
+    updated = 0
+    with client.context():
+        cursor, more = None, True
+        while more:
+            batch, cursor, more = Story.query().fetch_page(500, start_cursor=cursor)
+            keys = [
+                ndb.Key(Story, story_url_id(story.url)) if story.url else None
+                for story in batch
+            ]
+            keyed = {
+                story.key
+                for story in ndb.get_multi([key for key in keys if key is not None])
+                if story is not None
+            }
+            puts, deletes = {}, []
+            for story, key in zip(batch, keys):
+                if key is None:
+                    continue
+                if story.key != key:
+                    deletes.append(story.key)
+                    if key not in keyed and key not in puts:
+                        moved = Story(key=key, **story.to_dict())
+                        moved.slack_channel_id = (
+                            moved.slack_channel_id or slack_channel_id
+                        )
+                        puts[key] = moved
+                        updated += 1
+                if story.slack_message_id:
+                    ref = slack_message_ref(
+                        slack_channel_id, story.slack_message_id, key
+                    )
+                    puts[ref.key] = ref
+            ndb.put_multi(list(puts.values()))
+            ndb.delete_multi(deletes)
+        mark_rekeyed("Story")
+    return updated
@@ -0,0 +1,89 @@
+"""
+Keys for story entities that are looked up by URL or by Slack message.
+
+DiSocialStory and Story entities are keyed by story_url_id(url), a hash of the
+canonical story URL, so finding a story by URL is a key get instead of a query.
+SlackMessageRef entities (id "<channel>:<ts>") point from a Slack message to the
+story it was posted for, so reaction and button handlers can also find it by key.
+
+Rows saved before this still have their old keys and no refs until their kind's
+backfill runs, so until then (see is_rekeyed) lookups that miss fall back to the old
+queries.
+"""
+
+import hashlib
+from datetime import datetime
+from urllib.parse import urlsplit, urlunsplit
+
+from google.cloud import ndb
+
+from .kv_store import KVStore
+
+# Kinds whose backfill is known to have finished, so this process stops checking
+_rekeyed = set()
+
+
+class SlackMessageRef(ndb.Model):
+    """Maps a Slack message (entity id "<channel>:<ts>") to the entity it belongs to."""
+
+    target = ndb.KeyProperty(indexed=False)
+
+
+def canonical_story_url(url):
+    """
+    Normalize a story URL so the same story always gets the same key: surrounding
+    whitespace, scheme/host case, the fragment and a trailing slash are ignored.
+    """
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), path, parts.query, "")
+    )
+
+
+def story_url_id(url):
+    """Entity id for a story URL."""
+    return hashlib.sha256(canonical_story_url(url).encode("utf-8")).hexdigest()
+
+
+def slack_message_ref_key(channel_id, message_ts):
+    return ndb.Key(SlackMessageRef, f"{channel_id}:{message_ts}")
+
+
+def slack_message_ref(channel_id, message_ts, target):
+    """A SlackMessageRef pointing a message at target (a key), ready to put."""
+    return SlackMessageRef(
+        key=slack_message_ref_key(channel_id, message_ts), target=target
+    )
+
+
+def _rekeyed_flag(kind):
+    return f"{kind.upper()}_REKEYED"
+
+
+def is_rekeyed(kind):
+    """
+    Whether every entity of kind has been moved to its URL key (and given Slack refs)
+    by its backfill. Must be called inside a client context.
+    """
+    if kind not in _rekeyed and KVStore.get_by_id(_rekeyed_flag(kind)) is not None:
+        _rekeyed.add(kind)
+    return kind in _rekeyed
+
+
+def mark_rekeyed(kind):
+    """Record that kind's backfill has finished. Must be called inside a client context."""
+    now = datetime.now()
+    KVStore(id=_rekeyed_flag(kind), value="true", created_at=now, updated_at=now).put()
+    _rekeyed.add(kind)
+
+
+def get_slack_message_target(channel_id, message_ts):
+    """
+    Return the entity a Slack message refers to, or None. Must be called inside a
+    client context.
+    """
+    ref = slack_message_ref_key(channel_id, message_ts).get()
+    if ref is None or ref.target is None:
+        return None
+    return ref.target.get()
@@ -39,8 +39,6 @@ with InitTimer("Standard Libraries"):
     import json
     import os
     import urllib
-    import atexit
-    from threading import Thread
     from datetime import datetime, timedelta, timezone
     from zoneinfo import ZoneInfo
 
@@ -48,11 +46,11 @@ with InitTimer("Third-Party Libraries"):
     import requests
     from flask_talisman import Talisman
     from oauthlib.oauth2 import WebApplicationClient
-    from apscheduler.triggers.date import DateTrigger
 
 with InitTimer("Flask and Flask-Login"):
     from flask import (
         Flask,
+        before_render_template,
         redirect,
         render_template,
         request,
@@ -86,7 +84,6 @@ with InitTimer("Database Functions"):
         get_user,
         get_all_users,
         get_user_favorite_tools,
-        get_user_name,
         set_user_ask_oauth_tokens,
     )
     from db.all_tools import (
@@ -94,11 +91,10 @@ with InitTimer("Database Functions"):
         get_all_tools_restricted,
         get_tool_by_uid,
     )
-    from db.map_point import get_all_points
-    from db.json_store import json_store_set
     from db.employee_management import initialize_ems_settings
-    from db.cu_calender import delete_expired_events
-    from db.song_request import delete_old_song_requests
+    from db.expiry import sweep_expired
+    from db.lease import held_lease
+    from db.song_request import get_undelivered_song_request_ids
 
 ################################################################################
 # UTIL IMPORTS #################################################################
@@ -111,15 +107,21 @@ with InitTimer("Utility Functions"):
         update_groups,
         restrict_to,
     )
-    from util.map_point import remove_point
     from util.gcal import get_allstaff_events
     from util.slackbots.copy_editing import scheduler as copy_scheduler
-    from util.map_point import scheduler as map_scheduler
     from util.rss_social_listener import process_new_stories_to_slack
-    from util.scheduler import scheduler_to_json, db_to_scheduler
+    from util.breaking_news_watcher import watch_breaking_stories
+    from util.tasks import QueueFull, enqueue, get_task_metrics, run_pushed_task
+    from util.slackbots.song_request import deliver_song_request_effects
+    from util.slackbots.user_directory import warm_slack_user_directory
+    from util.slackbots.slack_client import get_slack_metrics
     from util.changelog_parser import parse_changelog
-    from util.slackbots._slackbot import start_slack
-    from util.helpers.email_to_slackid import email_to_slackid
+    from util.slackbots._slackbot import get_slack_event_metrics, start_slack
+    from util.helpers.template_lookups import (
+        email_to_slackid,
+        prefetch_template_lookups,
+        to_user_name,
+    )
     from util.all_tools import format_restricted_groups
     from util.cu_calendar import sync_gcal_sources
     from util.employee_management import get_ems_brand_image_url
@@ -231,24 +233,18 @@ app.jinja_env.filters["ap_daydate"] = ap_daydate
 app.jinja_env.filters["ap_daydatetime"] = ap_daydatetime
 app.jinja_env.filters["email_to_slackid"] = email_to_slackid
 app.jinja_env.filters["format_restricted_groups"] = format_restricted_groups
-app.jinja_env.filters["to_user_name"] = get_user_name
+app.jinja_env.filters["to_user_name"] = to_user_name
 app.jinja_env.filters["days_since"] = days_since
 app.jinja_env.filters["months_since"] = months_since
 app.jinja_env.filters["years_since"] = years_since
 app.jinja_env.filters["time_since"] = time_since
 app.jinja_env.filters["time_between"] = time_between
 app.jinja_env.filters["get_ems_brand_image_url"] = get_ems_brand_image_url
+# Resolves the emails a template passes to to_user_name/email_to_slackid in one batch
+before_render_template.connect(prefetch_template_lookups, app)
 logging.info("Done registering Jinja filters.")
 
 
-@atexit.register
-def log_scheduler():
-    maps = scheduler_to_json(map_scheduler)
-    copy = scheduler_to_json(copy_scheduler)
-    json_store_set("MAP_JOBS", maps)
-    json_store_set("COPY_JOBS", copy)
-
-
 ################################################################################
 ############################ BEGIN ERROR HANDLERS ##############################
 ################################################################################
@@ -393,46 +389,111 @@ def add_template_context():
 
 @app.route("/schedulers")
 def schedulers():
-    # whatever
-    # token = request.args.get("token")
-    # if token != os.environ.get("SCHEDULER_TOKEN"):
-    #     return "Invalid token", 403
-    # db_to_scheduler(map_scheduler, "MAP_JOBS")
-    # db_to_scheduler(copy_scheduler, "COPY_JOBS")
-    map_points = get_all_points()
-    for point in map_points:
-        if point["end_date"] < datetime.now():
-            trigger = DateTrigger(point["end_date"], timezone="America/Chicago")
-            map_scheduler.add_job(
-                func=remove_point, args=[int(point["uid"])], trigger=trigger
-            )
-    return "Schedulers updated", 200
+    # Called after each deploy. Scheduled jobs live in Datastore and expiry is handled
+    # by /cron/expiry-sweep, so this only confirms the copy-editing scheduler is up.
+    return f"Schedulers running ({len(copy_scheduler.get_jobs())} copy jobs)", 200
+
+
+@app.route("/task-queues")
+@login_required
+@restrict_to(TOOLS_ADMIN_ACCESS_GROUPS)
+def task_queues():
+    # Depth, outcomes and latency for each background task queue on this instance
+    return get_task_metrics(), 200
+
+
+@app.route("/slack-metrics")
+@login_required
+@restrict_to(TOOLS_ADMIN_ACCESS_GROUPS)
+def slack_metrics():
+    # Calls, rate limit waits and 429s per Slack API method, and Events API deliveries
+    # shed by filters and deduplication, on this instance
+    return {"api": get_slack_metrics(), "events": get_slack_event_metrics()}, 200
 
 
 ################################################################################
 ############################## BEGIN CRON JOBS #################################
 ################################################################################
 # All endpoints beginning with /cron/ are called by the Google Cloud Scheduler
-# from jobs defined in cron.yaml
+# from jobs defined in cron.yaml. Each job holds a lease while it runs, so a retry
+# landing on another instance doesn't run it twice at once.
+
+# Seconds a cron job's lease lasts, the App Engine request deadline
+CRON_LEASE_TTL = 600
 
 
-# add cron job for
-# import regular function and run it
-@app.route("/cron/delete-expired-events", methods=["GET", "POST"])
+@app.route("/cron/expiry-sweep", methods=["GET", "POST"])
 @csrf.exempt
 @talisman(force_https=False)
-def cron_delete_expired_events():
+def cron_expiry_sweep():
+    """
+    Cron endpoint: delete expired entities of every kind registered with db.expiry
+    (CU Calendar events and their images, map points, food truck loctimes, old song
+    requests and their Slack messages, social stories). Reports per-kind metrics;
+    kinds left unfinished by the sweep's time budget resume on the next run.
+    """
+    if request.headers.get("X-Appengine-Cron") != "true":
+        logging.warning("Unauthorized attempt to trigger expiry sweep cron job")
+        return "Unauthorized", 403
+
+    with held_lease("cron:expiry-sweep", CRON_LEASE_TTL) as token:
+        if token is None:
+            logging.info("Expiry sweep already running on another instance")
+            return {"success": True, "skipped": True}, 200
+        results = sweep_expired()
+    success = not any("error" in metrics for metrics in results.values())
+    return {"success": success, "kinds": results}, 200 if success else 500
+
+
+@app.route("/cron/song-request-outbox", methods=["GET", "POST"])
+@csrf.exempt
+@talisman(force_https=False)
+def cron_song_request_outbox():
+    """
+    Cron endpoint: deliver song request side effects (Slack post, email, DM) that
+    weren't delivered when the request was submitted, e.g. after a failed send or
+    an instance restart.
+    """
+    if request.headers.get("X-Appengine-Cron") != "true":
+        return "Unauthorized", 403
+
+    processed, failed = 0, 0
+    with held_lease("cron:song-request-outbox", CRON_LEASE_TTL) as token:
+        if token is None:
+            logging.info("Song request outbox already running on another instance")
+            return {"success": True, "skipped": True}, 200
+        for request_id in get_undelivered_song_request_ids():
+            try:
+                deliver_song_request_effects(request_id)
+                processed += 1
+            except Exception:
+                logging.exception(
+                    f"Song request outbox delivery failed for {request_id}"
+                )
+                failed += 1
+    return {"success": True, "processed": processed, "failed": failed}, 200
+
+
+@app.route("/cron/slack-user-directory", methods=["GET", "POST"])
+@csrf.exempt
+@talisman(force_https=False)
+def cron_slack_user_directory():
+    """
+    Cron endpoint: reload the Slack user directory from users.list, so user lookups
+    by email or Slack ID are answered from Datastore instead of the Slack API.
+    """
     if request.headers.get("X-Appengine-Cron") != "true":
-        logging.warning(
-            "Unauthorized attempt to trigger delete_expired_events cron job"
-        )
         return "Unauthorized", 403
     try:
-        delete_expired_events()
-        logging.info("delete_expired_events cron job completed successfully")
-        return {"success": True}, 200
+        with held_lease("cron:slack-user-directory", CRON_LEASE_TTL) as token:
+            if token is None:
+                logging.info("Slack user directory already loading on another instance")
+                return {"success": True, "skipped": True}, 200
+            stored = warm_slack_user_directory()
+        logging.info(f"Slack user directory loaded: {stored} users")
+        return {"success": True, "stored": stored}, 200
     except Exception as e:
-        logging.exception("delete_expired_events cron job failed")
+        logging.exception("Slack user directory load failed")
         return {"success": False, "error": str(e)}, 500
 
 
@@ -467,7 +528,10 @@ def cron_rss_listener():
         logging.info(f"RSS listener manually triggered by {current_user.email}")
 
     try:
-        count, links = process_new_stories_to_slack()
+        # Manual runs poll right away; cron runs follow the adaptive poll interval
+        count, links = process_new_stories_to_slack(
+            force=request.headers.get("X-Appengine-Cron") != "true"
+        )
         logging.info(f"RSS cron job completed: {count} new stories posted")
         return {"success": True, "stories_posted": count, "links": links}, 200
     except Exception as e:
@@ -475,6 +539,30 @@ def cron_rss_listener():
         return {"success": False, "error": str(e)}, 500
 
 
+@app.route("/cron/breaking-news-watcher", methods=["GET", "POST"])
+@csrf.exempt
+@talisman(force_https=False)
+def cron_breaking_news_watcher():
+    """
+    Cron endpoint: check breaking news stories that aren't published yet with
+    WordPress, and update their Slack alerts once they are.
+    """
+    if request.headers.get("X-Appengine-Cron") != "true":
+        return "Unauthorized", 403
+    try:
+        with held_lease("cron:breaking-news-watcher", CRON_LEASE_TTL) as token:
+            if token is None:
+                logging.info(
+                    "Breaking news watcher already running on another instance"
+                )
+                return {"success": True, "skipped": True}, 200
+            checked, published = watch_breaking_stories()
+        return {"success": True, "checked": checked, "published": published}, 200
+    except Exception as e:
+        logging.exception("Breaking news watcher failed")
+        return {"success": False, "error": str(e)}, 500
+
+
 @app.route("/cron/cu-calendar-sync-30d", methods=["GET", "POST"])
 @csrf.exempt
 @talisman(force_https=False)
@@ -486,7 +574,11 @@ def cron_cu_calendar_sync_30d():
     if request.headers.get("X-Appengine-Cron") != "true":
         return "Unauthorized", 403
     try:
-        added = sync_gcal_sources(future_days=60)
+        with held_lease("cron:cu-calendar-sync", CRON_LEASE_TTL) as token:
+            if token is None:
+                logging.info("cu_calendar sync already running on another instance")
+                return {"success": True, "skipped": True}, 200
+            added = sync_gcal_sources(future_days=60)
         logging.info(f"cu_calendar 30d sync completed: added={added}")
         return {"success": True, "added": added}, 200
     except Exception as e:
@@ -505,7 +597,11 @@ def cron_cu_calendar_sync_year():
     if request.headers.get("X-Appengine-Cron") != "true":
         return "Unauthorized", 403
     try:
-        added = sync_gcal_sources(future_days=365)
+        with held_lease("cron:cu-calendar-sync", CRON_LEASE_TTL) as token:
+            if token is None:
+                logging.info("cu_calendar sync already running on another instance")
+                return {"success": True, "skipped": True}, 200
+            added = sync_gcal_sources(future_days=365)
         logging.info(f"cu_calendar yearly sync completed: added={added}")
         return {"success": True, "added": added}, 200
     except Exception as e:
@@ -513,32 +609,32 @@ def cron_cu_calendar_sync_year():
         return {"success": False, "error": str(e)}, 500
 
 
-@app.route("/cron/wpgu-song-requests-cleanup", methods=["GET", "POST"])
+################################################################################
+############################### END CRON JOBS ##################################
+################################################################################
+
+
+@app.route("/tasks/<queue>", methods=["POST"])
 @csrf.exempt
 @talisman(force_https=False)
-def cron_wpgu_song_requests_cleanup():
+def run_task(queue):
     """
-    Cron endpoint: delete WPGU song requests older than 60 days.
-    Intended to run weekly via cron.yaml.
+    Push endpoint for background tasks (see util/tasks.py), called by Cloud Tasks or
+    by this app itself when TASKS_MODE is "local-push". App Engine strips the
+    X-AppEngine-QueueName header from outside requests.
     """
-    if request.headers.get("X-Appengine-Cron") != "true":
-        logging.warning(
-            "Unauthorized attempt to trigger WPGU song request cleanup cron job"
-        )
+    if request.headers.get("X-AppEngine-QueueName") != queue:
+        logging.warning(f"Unauthorized attempt to run a task on queue {queue}")
         return "Unauthorized", 403
 
     try:
-        deleted_count = delete_old_song_requests(days_old=60)
-        logging.info(f"WPGU song requests cleanup completed: deleted={deleted_count}")
-        return {"success": True, "deleted": deleted_count}, 200
-    except Exception as e:
-        logging.exception("WPGU song requests cleanup cron job failed")
-        return {"success": False, "error": str(e)}, 500
-
-
-################################################################################
-############################### END CRON JOBS ##################################
-################################################################################
+        ran = run_pushed_task(queue, request.get_data())
+    except Exception:
+        logging.exception(f"Task on queue {queue} failed")
+        # Non-2xx responses make Cloud Tasks retry per queue.yaml
+        return {"success": False}, 500
+    # Unknown tasks are acknowledged so they aren't retried forever
+    return {"success": ran}, 200
 
 
 # Consider this to client-side fetching so that the page loads faster.
@@ -709,9 +805,11 @@ def callback():
                 expiry=expiry,
             )
 
-        # Create new thread to sync user's group memberships
-        thread = Thread(target=update_groups, args=[user_email])
-        thread.start()
+        # Sync user's group memberships in the background
+        try:
+            enqueue(update_groups, user_email)
+        except QueueFull:
+            logging.warning(f"Group sync queue full, skipping sync for {user_email}")
 
         # Begin user session by logging the user in
         login_user(user)
@@ -786,14 +884,6 @@ if __name__ == "__main__":
         exit(1)
     app.jinja_env.auto_reload = True
     app.config["TEMPLATES_AUTO_RELOAD"] = True
-    try:
-        logging.info("Loading schedulers...")
-        db_to_scheduler(map_scheduler, "MAP_JOBS")
-        db_to_scheduler(copy_scheduler, "COPY_JOBS")
-        logging.info("Done loading schedulers.")
-    except Exception as e:
-        logging.exception(f"[scheduling] No logs to import: {str(e)}")
-
     development_mode = (
         os.environ.get("FLASK_DEBUG_POTENTIAL_SECURITY_RISK_DEV_ONLY", "False").lower()
         == "true"
@@ -0,0 +1,141 @@
+"""
+Watches breaking news stories until WordPress publishes them.
+
+Editors used to press "Check if Published" on the Slack alert until the story went
+live, and every press asked WordPress directly. Now /cron/breaking-news-watcher checks
+each story that is still waiting (Story.next_check_at is due) through one shared HTTP
+session, sending the ETag/Last-Modified of the previous check. Checks back off
+exponentially while a story stays unpublished and stop after BREAKING_WATCH_FOR. When
+a story is published its Slack alert is updated, and the button only reads the stored
+status (and asks for the next check to happen right away).
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+from constants import SLACK_BOT_TOKEN
+from db.story import get_stories_due_for_check, update_story_watch
+from util.slackbots._slackbot import app
+from util.stories import check_published
+
+logger = logging.getLogger(__name__)
+
+# Delay after the first unpublished check, doubled after each one up to the max
+BREAKING_CHECK_BASE_DELAY = timedelta(minutes=1)
+BREAKING_CHECK_MAX_DELAY = timedelta(minutes=15)
+# Stories not published this long after they were submitted are no longer checked
+BREAKING_WATCH_FOR = timedelta(days=2)
+# Stories checked per watcher run
+BREAKING_CHECKS_PER_RUN = 50
+
+POSTED_SUCCESSFULLY = [
+    {"type": "divider"},
+    {
+        "type": "header",
+        "text": {
+            "type": "plain_text",
+            "text": ":white_check_mark:*BREAKING NEWS HAS BEEN PUBLISHED*:white_check_mark:",
+            "emoji": True,
+        },
+    },
+    {
+        "type": "section",
+        "text": {
+            "type": "mrkdwn",
+            "text": ":white_check_mark: Story has been published :white_check_mark:",
+        },
+    },
+    {"type": "divider"},
+]
+
+
+def _next_check_at(story, now):
+    created_at = story.get("created_at")
+    if created_at is not None and now - created_at >= BREAKING_WATCH_FOR:
+        logger.info(f"Breaking story {story['url']} still unpublished; not watching")
+        return None
+    delay = BREAKING_CHECK_BASE_DELAY * 2 ** min(story.get("checks") or 0, 10)
+    return now + min(delay, BREAKING_CHECK_MAX_DELAY)
+
+
+def update_published_message(story):
+    """Replace a story's Slack alert with the published message."""
+    app.client.chat_update(
+        token=SLACK_BOT_TOKEN,
+        channel=story["slack_channel_id"],
+        ts=story["slack_message_id"],
+        blocks=POSTED_SUCCESSFULLY,
+        text="STORY HAS BEEN POSTED",
+    )
+
+
+def check_story(story, now=None):
+    """
+    Check one watched story with WordPress and record the result. Returns True if the
+    story has been published.
+    """
+    now = now or datetime.now()
+    checks = (story.get("checks") or 0) + 1
+    try:
+        result = check_published(
+            story["url"], story.get("wp_etag"), story.get("wp_last_modified")
+        )
+    except Exception as e:
+        logger.warning(f"Publish check failed for {story['url']}: {e}")
+        update_story_watch(
+            story["id"], checks=checks, next_check_at=_next_check_at(story, now)
+        )
+        return False
+
+    if result["status"] == "published":
+        update_story_watch(
+            story["id"],
+            published_url=result["link"],
+            published_at=now,
+            next_check_at=None,
+            checks=checks,
+        )
+        try:
+            update_published_message(story)
+        except Exception:
+            # The button still shows the stored status if the update didn't go through
+            logger.exception(f"Failed to update Slack alert for {story['url']}")
+        return True
+
+    update_story_watch(
+        story["id"],
+        checks=checks,
+        # URLs without a post ID can't be checked
+        next_check_at=(
+            None if result["status"] == "invalid" else _next_check_at(story, now)
+        ),
+        wp_etag=result["etag"],
+        wp_last_modified=result["last_modified"],
+    )
+    return False
+
+
+def request_publish_check(story_id, slack_channel_id):
+    """
+    Have the next watcher run check a story, resetting its backoff. slack_channel_id
+    is where its alert was posted (older stories didn't record it).
+    """
+    update_story_watch(
+        story_id,
+        slack_channel_id=slack_channel_id,
+        next_check_at=datetime.now(),
+        checks=0,
+    )
+
+
+def watch_breaking_stories():
+    """
+    Check every breaking story whose next check is due. Returns (checked, published).
+    """
+    now = datetime.now()
+    checked, published = 0, 0
+    for story in get_stories_due_for_check(now, BREAKING_CHECKS_PER_RUN):
+        checked += 1
+        if check_story(story, now):
+            published += 1
+    return checked, published
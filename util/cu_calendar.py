@@ -12,11 +12,13 @@ from zoneinfo import ZoneInfo
 
 import googlemaps
 from google.cloud import storage
+from google.cloud.storage.batch import Batch
 from gcsa.google_calendar import GoogleCalendar
 
 from constants import (
     BACKEND_GOOGLE_MAP_API,
     DEFAULT_PUBLIC_EVENT_CATEGORY,
+    GCS_BATCH_SIZE,
     GCS_BUCKET_NAME,
 )
 from util.security import get_creds
@@ -68,22 +70,78 @@ def upload_images_to_gcs(files):
     return uploaded_urls
 
 
+def _blob_name_from_url(url):
+    """Return the GCS object name for a public image URL."""
+
+    return url.split(f"{GCS_BUCKET_NAME}/")[-1]
+
+
+class _StatusBatch(Batch):
+    """Storage batch that keeps the HTTP status of each deferred request, in order."""
+
+    statuses = ()
+
+    def finish(self, raise_exception=True):
+        responses = super().finish(raise_exception=raise_exception)
+        self.statuses = [response.status_code for response in responses]
+        return responses
+
+
 def delete_images_from_gcs(image_urls):
-    """Delete GCS objects by public URL."""
+    """Delete GCS objects by public URL; return (bytes reclaimed, URLs not deleted).
+
+    Uses the storage batch API (one round-trip to read sizes and one to delete per
+    GCS_BATCH_SIZE objects). Objects that no longer exist count as already deleted;
+    any other failure (permissions, rate limits, server errors) leaves the URL in the
+    returned list so the caller can keep track of it.
+    """
+
+    urls_by_name = {}
+    for url in image_urls or []:
+        if url:
+            urls_by_name.setdefault(_blob_name_from_url(url), []).append(url)
+    blob_names = list(urls_by_name)
+    if not blob_names:
+        return 0, []
 
-    if not image_urls:
-        return
     storage_client = storage.Client()
     bucket = storage_client.bucket(GCS_BUCKET_NAME)
-    for url in image_urls:
+    bytes_reclaimed = 0
+    failed_urls = []
+    for start in range(0, len(blob_names), GCS_BATCH_SIZE):
+        blobs = [
+            bucket.blob(name) for name in blob_names[start : start + GCS_BATCH_SIZE]
+        ]
         try:
-            blob_name = url.split(f"{GCS_BUCKET_NAME}/")[-1]
-            blob = bucket.blob(blob_name)
-            if blob.exists():
-                blob.delete()
-                print(f"Deleted image from GCS: {blob_name}")
+            # Per-object errors aren't raised; their statuses are checked below
+            with _StatusBatch(storage_client, raise_exception=False) as sizes:
+                for blob in blobs:
+                    blob.reload()
+            with _StatusBatch(storage_client, raise_exception=False) as deletes:
+                for blob in blobs:
+                    blob.delete()
         except Exception as e:
-            print(f"Error deleting image {url} from GCS: {e}")
+            print(f"Error deleting {len(blobs)} images from GCS: {e}")
+            for blob in blobs:
+                failed_urls.extend(urls_by_name[blob.name])
+            continue
+
+        deleted = 0
+        for blob, size_status, delete_status in zip(
+            blobs, sizes.statuses, deletes.statuses
+        ):
+            if delete_status == 404:
+                continue
+            if not 200 <= delete_status < 300:
+                print(f"Error deleting {blob.name} from GCS: HTTP {delete_status}")
+                failed_urls.extend(urls_by_name[blob.name])
+                continue
+            deleted += 1
+            if 200 <= size_status < 300:
+                bytes_reclaimed += blob.size or 0
+        print(f"Deleted {deleted} of {len(blobs)} images from GCS")
+
+    return bytes_reclaimed, failed_urls
 
 
 def _parse_calendar_id_from_url(gcal_url: str) -> Optional[str]:
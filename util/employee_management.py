@@ -23,6 +23,7 @@ from util.slackbots.general import (
     add_user_to_channel,
     remove_user_from_channel,
 )
+from util.slackbots.channel_cache import CHANNEL_MEMBERS_FRESH_FOR, is_channel_member
 
 logger = logging.getLogger(__name__)
 
@@ -484,8 +485,16 @@ def update_slack_channels(
     Returns:
         tuple (`bool`, `str | None`): Whether the operation was successful and an error message if not
     """
+    # Removals always go out, since a member set cached in this process may have missed
+    # the user joining (not_in_channel counts as success). Invites are skipped only
+    # when a member set loaded within CHANNEL_MEMBERS_FRESH_FOR already has the user;
+    # one load serves every employee of a position update
     remove_from_channels = list(set(old_channels) - set(new_channels))
-    add_to_channels = list(set(new_channels) - set(old_channels))
+    add_to_channels = [
+        channel
+        for channel in set(new_channels) - set(old_channels)
+        if not is_channel_member(user_id, channel, max_age=CHANNEL_MEMBERS_FRESH_FOR)
+    ]
 
     # Logging
     logger.debug(f"Removing {user_id} from channels: {remove_from_channels}")
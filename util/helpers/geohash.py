@@ -0,0 +1,90 @@
+"""Geohash helpers used to index map entities for bounding-box queries.
+
+A geohash is a base32 string where every extra character narrows the cell, so all
+points inside a cell share that cell's geohash as a prefix.
+"""
+
+from typing import List, Optional, Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+# Precision 6 cells are roughly 1.2km x 0.6km, small enough for a zoomed-in campus map
+GEOHASH_PRECISION = 6
+
+
+def encode(lat: float, long: float, precision: int = GEOHASH_PRECISION) -> str:
+    """Return the geohash of a point at the given precision."""
+
+    lat_range = [-90.0, 90.0]
+    long_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even_bit = True
+
+    while len(geohash) < precision:
+        # Bits alternate between longitude and latitude, starting with longitude
+        value_range, value = (long_range, long) if even_bit else (lat_range, lat)
+        mid = (value_range[0] + value_range[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            value_range[0] = mid
+        else:
+            bits = bits << 1
+            value_range[1] = mid
+        even_bit = not even_bit
+
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(_BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(geohash)
+
+
+def decode_bbox(geohash: str) -> Tuple[float, float, float, float]:
+    """Return the (south, west, north, east) bounds of a geohash cell."""
+
+    lat_range = [-90.0, 90.0]
+    long_range = [-180.0, 180.0]
+    even_bit = True
+
+    for char in geohash:
+        bits = _BASE32.index(char)
+        for shift in range(4, -1, -1):
+            value_range = long_range if even_bit else lat_range
+            mid = (value_range[0] + value_range[1]) / 2
+            if (bits >> shift) & 1:
+                value_range[0] = mid
+            else:
+                value_range[1] = mid
+            even_bit = not even_bit
+
+    return lat_range[0], long_range[0], lat_range[1], long_range[1]
+
+
+def prefixes(lat: Optional[float], long: Optional[float]) -> List[str]:
+    """
+    Return every geohash prefix of a point from 1 to GEOHASH_PRECISION characters.
+    Stored as a repeated property so a cell at any precision is one equality filter.
+    """
+
+    if lat is None or long is None:
+        return []
+    geohash = encode(lat, long)
+    return [geohash[:length] for length in range(1, len(geohash) + 1)]
+
+
+def covering_cell(south: float, west: float, north: float, east: float) -> str:
+    """
+    Return the smallest geohash cell (up to GEOHASH_PRECISION) that contains the whole
+    bounding box. Returns "" if the box spans the top-level cells.
+    """
+
+    south_west = encode(south, west)
+    north_east = encode(north, east)
+    length = 0
+    while length < len(south_west) and south_west[length] == north_east[length]:
+        length += 1
+    return south_west[:length]
@@ -2,7 +2,7 @@ from typing import List, Optional, Tuple
 
 from db.user import get_user
 from util.security import update_groups
-from util.slackbots._slackbot import app
+from util.slackbots.user_directory import get_slack_email
 
 
 def get_email_and_groups(
@@ -14,14 +14,7 @@ def get_email_and_groups(
     (synchronously) before returning.
     Returns (None, []) if the email cannot be resolved.
     """
-    try:
-        info = app.client.users_info(user=slack_user_id)
-    except Exception as e:
-        print(f"[slack_groups] users_info failed for {slack_user_id}: {e}")
-        return None, []
-
-    profile = (info or {}).get("user", {}).get("profile", {}) or {}
-    email = profile.get("email")
+    email = get_slack_email(slack_user_id)
     if not email:
         return None, []
 
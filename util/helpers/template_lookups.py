@@ -0,0 +1,150 @@
+"""
+Batched lookups for the to_user_name and email_to_slackid Jinja filters.
+
+Calling those filters in a loop used to do one Datastore query or Slack API call per
+row. Before a template renders, prefetch_template_lookups() checks which of the two
+filters the template (and the templates it extends or includes) uses, collects the
+email addresses in the render context, and resolves them all at once. The filters then
+read from a per-request memo, and only fall back to single lookups for values the
+pre-scan didn't find (e.g. built inside the template). The pre-scan picks up any
+email-like string, so it only resolves Slack IDs from the stored directory; asking
+Slack is left to the filter, for the values it is actually given.
+"""
+
+from flask import g, has_app_context
+from google.cloud import ndb
+from jinja2 import meta, nodes
+
+from db.user import get_user_name, get_user_names
+from util.slackbots.user_directory import get_slack_id_by_email, get_slack_ids_by_email
+
+
+def _stored_slack_ids_by_email(emails):
+    return get_slack_ids_by_email(emails, lookup_missing=False)
+
+
+# Filter name: (bulk resolver for a set of emails, whether emails it doesn't return
+# are known to have no match)
+_BATCH_RESOLVERS = {
+    "to_user_name": (get_user_names, True),
+    "email_to_slackid": (_stored_slack_ids_by_email, False),
+}
+
+# Limits on how much of the render context is scanned for emails
+_SCAN_DEPTH = 4
+_SCAN_MAX_VALUES = 300
+
+# Template name: names of the batched filters it (or anything it loads) uses
+_template_filters = {}
+
+
+def _memo(filter_name):
+    """Per-request {email: result} for a filter, or None outside an app context."""
+
+    if not has_app_context():
+        return None
+    memos = g.setdefault("template_lookups", {})
+    return memos.setdefault(filter_name, {})
+
+
+def _lookup(filter_name, email, single_lookup):
+    memo = _memo(filter_name)
+    if memo is None:
+        return single_lookup(email)
+    if email not in memo:
+        memo[email] = single_lookup(email)
+    return memo[email]
+
+
+def to_user_name(email):
+    """Jinja filter: the name of the user with this email, or None."""
+
+    return _lookup("to_user_name", email, get_user_name)
+
+
+def email_to_slackid(email):
+    """Jinja filter: the Slack user ID for this email, or None."""
+
+    return _lookup("email_to_slackid", email, get_slack_id_by_email)
+
+
+def _filters_used(env, name, seen=None):
+    if name in _template_filters:
+        return _template_filters[name]
+
+    seen = seen if seen is not None else set()
+    if name in seen:
+        return set()
+    seen.add(name)
+
+    source = env.loader.get_source(env, name)[0]
+    ast = env.parse(source)
+    used = {
+        node.name
+        for node in ast.find_all(nodes.Filter)
+        if node.name in _BATCH_RESOLVERS
+    }
+    for child in meta.find_referenced_templates(ast):
+        # Dynamic includes (None) can't be followed
+        if child is not None:
+            used |= _filters_used(env, child, seen)
+
+    _template_filters[name] = used
+    return used
+
+
+def _collect_emails(value, emails, depth=0):
+    if len(emails) >= _SCAN_MAX_VALUES or depth > _SCAN_DEPTH:
+        return
+    if isinstance(value, str):
+        if "@" in value and " " not in value and len(value) < 255:
+            emails.add(value)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_emails(item, emails, depth + 1)
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            _collect_emails(item, emails, depth + 1)
+    elif isinstance(value, ndb.Model):
+        try:
+            _collect_emails(value.to_dict(), emails, depth)
+        except Exception:
+            pass
+
+
+def prefetch_template_lookups(sender, template, context, **extra):
+    """
+    Flask before_render_template receiver: resolve every email in the context for the
+    batched filters the template uses, in one bulk lookup per filter (a Datastore query
+    per 30 emails). At most _SCAN_MAX_VALUES values are prefetched; the filters look
+    up the rest one at a time.
+    """
+
+    if template.name is None:
+        return
+    try:
+        used = _filters_used(sender.jinja_env, template.name)
+    except Exception:
+        sender.logger.exception(f"Could not scan template {template.name}")
+        return
+    if not used:
+        return
+
+    emails = set()
+    for key, value in context.items():
+        if key not in ("g", "request", "session", "config"):
+            _collect_emails(value, emails)
+
+    for filter_name in used:
+        memo = _memo(filter_name)
+        missing = emails - memo.keys()
+        if missing:
+            resolver, complete = _BATCH_RESOLVERS[filter_name]
+            try:
+                resolved = resolver(missing)
+                if complete:
+                    # Emails the resolver didn't return have no match
+                    memo.update(dict.fromkeys(missing))
+                memo.update(resolved)
+            except Exception:
+                sender.logger.exception(f"Batch lookup for {filter_name} failed")
@@ -0,0 +1,220 @@
+"""Server-side marker clustering for the CU Calendar and map-points feeds.
+
+Clusters are built per geohash tile from the stored geohash prefixes and cached in
+memory per (source, tile, cluster precision) until a write to that source invalidates
+them or the entry expires. Keys are always whole geohash tiles at a precision derived
+from the zoom, never raw request values, and the least recently used tiles are dropped
+past CLUSTER_CACHE_SIZE entries.
+"""
+
+import math
+import time
+from collections import Counter, OrderedDict
+from threading import Lock
+
+from util.helpers.geohash import GEOHASH_PRECISION, decode_bbox, encode
+
+# Seconds before a cached tile is rebuilt even without writes (covers events ending)
+CLUSTER_CACHE_TTL = 600
+# Tiles kept in the cache across all sources and precisions
+CLUSTER_CACHE_SIZE = 2000
+# Tiles are this many geohash characters coarser than the cluster cells inside them
+TILE_LEVELS_ABOVE_CLUSTERS = 2
+# Most tiles a single request may cover before tiles get coarser
+MAX_TILES_PER_REQUEST = 32
+
+CALENDAR_SOURCE = "cu-calendar"
+MAP_POINTS_SOURCE = "map-points"
+
+# (source, tile, precision) -> (time.monotonic() it expires, clusters)
+_cluster_cache = OrderedDict()
+# Bumped on every invalidation so a tile built during a write is not cached
+_cache_generation = Counter()
+_cluster_cache_lock = Lock()
+
+
+def parse_bbox(args):
+    """
+    Return (south, west, north, east) from request args, or None if none are given.
+    Raises ValueError if the box is incomplete or invalid.
+    """
+
+    bounds = [args.get(name) for name in ("south", "west", "north", "east")]
+    if not any(bounds):
+        return None
+    if not all(bounds):
+        raise ValueError("north, south, east and west must be given together.")
+    try:
+        south, west, north, east = (float(value) for value in bounds)
+    except ValueError as exc:
+        raise ValueError("Bounding box values must be numbers.") from exc
+    if south > north or west > east:
+        raise ValueError("Invalid bounding box.")
+    return south, west, north, east
+
+
+def zoom_to_precision(zoom):
+    """Map a web-map zoom level (0-22) to the geohash precision of its clusters."""
+
+    if zoom <= 2:
+        return 1
+    if zoom <= 5:
+        return 2
+    if zoom <= 7:
+        return 3
+    if zoom <= 10:
+        return 4
+    if zoom <= 12:
+        return 5
+    return GEOHASH_PRECISION
+
+
+def _cell_size(precision):
+    """Return (height, width) in degrees of a geohash cell at a precision."""
+
+    bits = 5 * precision
+    lat_bits = bits // 2
+    long_bits = bits - lat_bits
+    return 180.0 / (2**lat_bits), 360.0 / (2**long_bits)
+
+
+def _tile_span(south, west, north, east, precision):
+    """Return (first_row, last_row, first_col, last_col) of the cells covering a box."""
+
+    height, width = _cell_size(precision)
+    south, north = max(south, -90.0), min(north, 90.0)
+    west, east = max(west, -180.0), min(east, 180.0)
+    # The north and east edges of the world belong to the last row and column
+    rows, cols = round(180.0 / height), round(360.0 / width)
+    return (
+        math.floor((south + 90.0) / height),
+        min(math.floor((north + 90.0) / height), rows - 1),
+        math.floor((west + 180.0) / width),
+        min(math.floor((east + 180.0) / width), cols - 1),
+    )
+
+
+def count_tiles(south, west, north, east, precision):
+    """Number of cells tiles_for_bbox() would return (at most), without building them."""
+
+    first_row, last_row, first_col, last_col = _tile_span(
+        south, west, north, east, precision
+    )
+    return (last_row - first_row + 1) * (last_col - first_col + 1)
+
+
+def tiles_for_bbox(south, west, north, east, precision):
+    """Return the geohash cells at a precision that intersect a bounding box."""
+
+    height, width = _cell_size(precision)
+    first_row, last_row, first_col, last_col = _tile_span(
+        south, west, north, east, precision
+    )
+
+    tiles = set()
+    for row in range(first_row, last_row + 1):
+        for col in range(first_col, last_col + 1):
+            lat = min(-90.0 + (row + 0.5) * height, 90.0)
+            long = min(-180.0 + (col + 0.5) * width, 180.0)
+            tiles.add(encode(lat, long, precision))
+    return sorted(tiles)
+
+
+def _build_clusters(entities, precision, category_field):
+    """Group entity dicts by their geohash prefix at a precision."""
+
+    clusters = {}
+    for entity in entities:
+        geohash = entity.get("geohash") or []
+        if len(geohash) < precision:
+            continue
+        cell = geohash[precision - 1]
+        cluster = clusters.setdefault(
+            cell, {"count": 0, "lat_sum": 0.0, "long_sum": 0.0, "categories": Counter()}
+        )
+        cluster["count"] += 1
+        cluster["lat_sum"] += entity["lat"]
+        cluster["long_sum"] += entity["long"]
+        cluster["categories"][entity.get(category_field) or "Other"] += 1
+
+    return [
+        {
+            "geohash": cell,
+            "count": cluster["count"],
+            "lat": cluster["lat_sum"] / cluster["count"],
+            "long": cluster["long_sum"] / cluster["count"],
+            "categories": dict(cluster["categories"]),
+        }
+        for cell, cluster in sorted(clusters.items())
+    ]
+
+
+def get_clusters(source, fetch_in_cell, bbox, zoom, category_field):
+    """
+    Return clusters (geohash, count, centroid, category histogram) inside a bounding box.
+
+    :param source: Cache namespace, CALENDAR_SOURCE or MAP_POINTS_SOURCE
+    :param fetch_in_cell: Function returning current entity dicts inside a geohash cell
+    :param bbox: (south, west, north, east)
+    :param zoom: Web-map zoom level
+    :param category_field: Entity field used for the category histogram
+    """
+
+    precision = zoom_to_precision(zoom)
+    tile_precision = max(1, precision - TILE_LEVELS_ABOVE_CLUSTERS)
+    # Size the tiles before building any, so a large box at a high zoom stays cheap
+    while (
+        count_tiles(*bbox, tile_precision) > MAX_TILES_PER_REQUEST
+        and tile_precision > 1
+    ):
+        tile_precision -= 1
+    tiles = tiles_for_bbox(*bbox, tile_precision)
+
+    now = time.monotonic()
+    clusters = []
+    for tile in tiles:
+        cache_key = (source, tile, precision)
+        with _cluster_cache_lock:
+            cached = _cluster_cache.get(cache_key)
+            if cached is not None:
+                _cluster_cache.move_to_end(cache_key)
+        if cached is None or cached[0] <= now:
+            generation = _cache_generation[source]
+            tile_clusters = _build_clusters(
+                fetch_in_cell(tile), precision, category_field
+            )
+            with _cluster_cache_lock:
+                if _cache_generation[source] == generation:
+                    _cluster_cache[cache_key] = (
+                        now + CLUSTER_CACHE_TTL,
+                        tile_clusters,
+                    )
+                    _cluster_cache.move_to_end(cache_key)
+                    while len(_cluster_cache) > CLUSTER_CACHE_SIZE:
+                        _cluster_cache.popitem(last=False)
+        else:
+            tile_clusters = cached[1]
+        clusters.extend(tile_clusters)
+
+    # Tiles can extend past the box, so only keep cells that overlap it
+    south, west, north, east = bbox
+    visible = []
+    for cluster in clusters:
+        cell_south, cell_west, cell_north, cell_east = decode_bbox(cluster["geohash"])
+        if (
+            cell_north >= south
+            and cell_south <= north
+            and cell_east >= west
+            and cell_west <= east
+        ):
+            visible.append(cluster)
+    return visible
+
+
+def invalidate_clusters(source):
+    """Drop every cached tile for a source after one of its entities changes."""
+
+    with _cluster_cache_lock:
+        _cache_generation[source] += 1
+        for cache_key in [key for key in _cluster_cache if key[0] == source]:
+            del _cluster_cache[cache_key]
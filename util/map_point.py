@@ -1,17 +1,8 @@
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.date import DateTrigger
-from db.map_point import add_point, remove_point
-
-from datetime import datetime
-from db.json_store import json_store_set
-from util.scheduler import scheduler_to_json
-
-scheduler = BackgroundScheduler()
-scheduler.start()
+from db.map_point import add_point
 
 
 def add(title, lat, long, url, start_date, end_date, image, address, point_type):
-    point = add_point(
+    add_point(
         title=title,
         lat=lat,
         long=long,
@@ -22,16 +13,6 @@ def add(title, lat, long, url, start_date, end_date, image, address, point_type)
         address=address,
         point_type=point_type,
     )
-    trigger = DateTrigger(end_date, timezone="America/Chicago")
-    scheduler.add_job(trigger=trigger, func=remove, args=[int(point["uid"])])
-
-    map_json = scheduler_to_json(scheduler)
-    json_store_set("MAP_JOBS", map_json, replace=True)
 
+    # Removed by the expiry sweeper (db/expiry.py) once end_date passes
     print(f"Point will be deleted {end_date}")
-
-
-def remove(uid):
-    remove_point(uid)
-    map_json = scheduler_to_json(scheduler)
-    json_store_set("MAP_JOBS", map_json, replace=True)
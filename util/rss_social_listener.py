@@ -4,8 +4,13 @@ RSS feed listener for Daily Illini stories.
 Fetches the Daily Illini RSS feed, filters out sponsored content,
 and posts new stories to the social media Slack channel. 
 
-Designed to be triggered via HTTP endpoint by Google Cloud Scheduler
-to avoid duplicate runs across multiple App Engine instances.
+Designed to be triggered via HTTP endpoint by Google Cloud Scheduler. Each run
+holds a lease so overlapping runs on different App Engine instances don't post
+the same story twice.
+
+The scheduler calls in every few minutes, but the feed is only polled as often as
+RSS_POLL_INTERVALS allows for the time of day. Polls send the ETag/Last-Modified of
+the previous response (kept in KVStore), so an unchanged feed costs a 304.
 
 Last modified by Jacob Slabosz on Feb 21, 2026
 """
@@ -14,12 +19,25 @@ from zoneinfo import ZoneInfo
 
 import feedparser
 import logging
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from util.helpers.ap_datetime import ap_daydatetime
 
 logger = logging.getLogger(__name__)
 
 RSS_URL = "https://dailyillini.com/feed/"
+RSS_LEASE_NAME = "rss-listener"
+# Seconds a run may hold the lease, the App Engine request deadline
+RSS_LEASE_TTL = 600
+
+# Minimum time between polls: (first hour, last hour) in Chicago time -> interval.
+# Stories are mostly published during the day; hours not listed use the overnight one
+RSS_POLL_INTERVALS = {(7, 23): timedelta(minutes=5)}
+RSS_OVERNIGHT_POLL_INTERVAL = timedelta(minutes=30)
+
+# KVStore keys for the conditional GET validators and the last poll time
+RSS_ETAG_KEY = "RSS_FEED_ETAG"
+RSS_MODIFIED_KEY = "RSS_FEED_MODIFIED"
+RSS_LAST_POLL_KEY = "RSS_FEED_LAST_POLL"
 
 
 def is_sponsored(entry):
@@ -54,17 +72,72 @@ def parse_date(entry):
     return datetime.now(ZoneInfo("America/Chicago"))
 
 
+def _poll_interval(now):
+    for (first_hour, last_hour), interval in RSS_POLL_INTERVALS.items():
+        if first_hour <= now.hour <= last_hour:
+            return interval
+    return RSS_OVERNIGHT_POLL_INTERVAL
+
+
+def is_poll_due(now=None):
+    """
+    Whether enough time has passed since the last poll for the time of day.
+    """
+    from db.kv_store import kv_store_get
+
+    now = now or datetime.now(ZoneInfo("America/Chicago"))
+    last_poll = kv_store_get(RSS_LAST_POLL_KEY)
+    if not last_poll:
+        return True
+    try:
+        last_poll = datetime.fromisoformat(last_poll)
+    except ValueError:
+        return True
+    # Allow a minute of slack so a poll on the cron's schedule isn't skipped
+    return now - last_poll >= _poll_interval(now) - timedelta(minutes=1)
+
+
 def fetch_rss():
     """
-    Fetch and parse the Daily Illini RSS feed, returning all entries.
+    Fetch and parse the Daily Illini RSS feed, returning (entries, validators).
+    Entries are empty when the feed hasn't changed since the last fetch (HTTP 304).
+    Validators are the response's ETag/Last-Modified, for save_feed_validators() once
+    the entries have been handled.
     """
+    from db.kv_store import kv_store_get, kv_store_set
+
     try:
         logger.info(f"Fetching RSS feed from {RSS_URL}")
-        feed = feedparser.parse(RSS_URL)
-        return feed.entries
+        feed = feedparser.parse(
+            RSS_URL,
+            etag=kv_store_get(RSS_ETAG_KEY),
+            modified=kv_store_get(RSS_MODIFIED_KEY),
+        )
+        kv_store_set(
+            RSS_LAST_POLL_KEY, datetime.now(ZoneInfo("America/Chicago")).isoformat()
+        )
+        if feed.get("status") == 304:
+            logger.info("RSS feed not modified since the last fetch")
+            return [], {}
+        validators = {
+            RSS_ETAG_KEY: feed.get("etag"),
+            RSS_MODIFIED_KEY: feed.get("modified"),
+        }
+        return feed.entries, validators
     except Exception as e:
         logger.error(f"Failed to get RSS feed: {str(e)}")
-        return []
+        return [], {}
+
+
+def save_feed_validators(validators):
+    """
+    Store the ETag/Last-Modified from fetch_rss() to send with the next poll.
+    """
+    from db.kv_store import kv_store_set
+
+    for key, value in validators.items():
+        if value:
+            kv_store_set(key, value)
 
 
 def process_rss_item(entry):
@@ -84,20 +157,36 @@ def process_rss_item(entry):
     }
 
 
-def process_new_stories_to_slack():
+def process_new_stories_to_slack(force=False):
     """
     Fetch RSS feed, filter sponsored posts, and post new stories to Slack.
     Adds new stories to database and notifies the social media channel.
+    Skips the poll when the last one was too recent for the time of day, unless force.
     Returns (number_new_posted, list of story links posted).
     """
-    from db.socials_poster import add_social_story, get_story_by_url
+    from db.lease import held_lease
+
+    if not force and not is_poll_due():
+        logger.info("RSS feed polled recently; skipping")
+        return 0, []
+
+    with held_lease(RSS_LEASE_NAME, RSS_LEASE_TTL) as token:
+        if token is None:
+            logger.info("RSS listener already running on another instance; skipping")
+            return 0, []
+        return _process_new_stories(token)
+
+
+def _process_new_stories(token):
+    from db.lease import is_lease_current
+    from db.socials_poster import add_social_story, get_existing_story_urls
     from util.slackbots.socials_slackbot import notify_new_story_from_rss
 
-    entries = fetch_rss()
+    entries, validators = fetch_rss()
     if not entries:
         return 0, []
 
-    posted = []
+    stories = []
     for entry in entries:
         if is_sponsored(entry):
             continue
@@ -109,13 +198,26 @@ def process_new_stories_to_slack():
         date = result.get("pub_date", "")
         if not link or not title:
             continue
-        if get_story_by_url(link) is not None:
+        stories.append((link, title, date))
+
+    # One lookup for the whole feed instead of one per entry
+    existing = get_existing_story_urls([link for link, _, _ in stories])
+
+    posted = []
+    for link, title, date in stories:
+        if link in existing:
             continue
+        if not is_lease_current(RSS_LEASE_NAME, token):
+            logger.warning("RSS listener lost its lease; stopping before posting")
+            break
         add_social_story(link, title, date)
         notify_new_story_from_rss(
             story_url=link, story_title=title, post_date=ap_daydatetime(date)
         )
         posted.append(link)
+    else:
+        # Only skip this version of the feed next time once all of it was handled
+        save_feed_validators(validators)
 
     logger.info(f"RSS processing complete: {len(posted)} new stories posted to Slack")
     return len(posted), posted
@@ -1,132 +1,138 @@
-from apscheduler.schedulers.base import (
-    BaseScheduler,
-    STATE_PAUSED,
-    STATE_RUNNING,
-    STATE_STOPPED,
-    Mapping,
-    obj_to_ref,
-    ExitStack,
-    ref_to_obj,
-    Job,
+import pickle
+from datetime import datetime, timedelta, timezone
+
+from apscheduler.job import Job
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
+
+from db.lease import acquire_lease
+from db.scheduler_job import (
+    delete_all_scheduler_jobs,
+    delete_scheduler_job,
+    get_next_scheduler_run_time,
+    get_paused_scheduler_job_states,
+    get_scheduler_job_state,
+    get_scheduler_job_states,
+    put_scheduler_job,
 )
-from db.json_store import json_store_get
 
+# Seconds the instance running a store's due jobs holds its lease
+SCHEDULER_LEASE_TTL = 60
+# Seconds an instance without the lease waits before checking for due jobs again
+SCHEDULER_LEASE_RETRY = 30
 
-def to_json(self, jobstore=None):
-    """
-    Export stored jobs as JSON.
-
-    :param outfile: either a file object opened in text write mode ("w"), or a path
-        to the target file
-    :param jobstore: alias of the job store to export jobs from (if omitted, export
-        from all configured job stores)
 
+class DatastoreJobStore(BaseJobStore):
     """
-    import json
-    import pickle
-    from base64 import b64encode
-
-    from apscheduler import version
+    APScheduler job store that keeps one Datastore entity per job.
 
-    if self.state == STATE_STOPPED:
-        raise RuntimeError(
-            "the scheduler must have been started for job export to work"
-        )
-
-    def encode_with_pickle(obj):
-        return b64encode(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)).decode("ascii")
-
-    def json_default(obj):
-        if hasattr(obj, "__getstate__") and hasattr(obj, "__setstate__"):
-            state = obj.__getstate__()
-            if isinstance(state, Mapping):
-                return {
-                    "__apscheduler_class__": obj_to_ref(obj.__class__),
-                    "__apscheduler_state__": state,
-                }
-
-        return {"__apscheduler_pickle__": encode_with_pickle(obj)}
-
-    with self._jobstores_lock:
-        all_jobs = [
-            job
-            for alias, store in self._jobstores.items()
-            for job in store.get_all_jobs()
-            if jobstore in (None, alias)
-        ]
-
-    to_return = ""
-
-    with ExitStack() as stack:
-        # if not hasattr(outfile, "write"):
-        #     outfile = stack.enter_context(open(outfile, "w"))
-
-        to_return = json.dumps(
-            {
-                "version": 1,
-                "scheduler_version": version,
-                "jobs": [job.__getstate__() for job in all_jobs],
-            },
-            default=json_default,
-        )
+    Adding or removing a job writes a single entity, and the scheduler only loads jobs
+    that are due, so restarts don't replay every job at once. Job functions must be
+    importable module-level functions (no lambdas) so they can be pickled.
 
-    return to_return
+    Every instance shares the same jobs, so due jobs are only handed to the scheduler
+    of the instance holding the store's lease; the others check back later.
 
-
-def import_from_db(self, key, jobstore="default"):
+    :param str name: store name jobs are saved under, e.g. "COPY_JOBS"
+    :param int pickle_protocol: pickle protocol level to use (for serialization)
     """
-    Import jobs previously exported via :meth:`export_jobs.
 
-    :param infile: either a file object opened in text read mode ("r") or a path to
-        a JSON file containing previously exported jobs
-    :param jobstore: the alias of the job store to import the jobs to
+    def __init__(self, name, pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        if not name:
+            raise ValueError('The "name" parameter must not be empty')
+        self.name = name
+        self.pickle_protocol = pickle_protocol
+        self._leased_elsewhere = False
+
+    def lookup_job(self, job_id):
+        job_state = get_scheduler_job_state(self.name, job_id)
+        return self._reconstitute_job(job_state) if job_state else None
+
+    def get_due_jobs(self, now):
+        token = acquire_lease(f"scheduler:{self.name}", SCHEDULER_LEASE_TTL)
+        self._leased_elsewhere = token is None
+        if self._leased_elsewhere:
+            return []
+        timestamp = datetime_to_utc_timestamp(now)
+        return self._get_jobs(get_scheduler_job_states(self.name, timestamp))
+
+    def get_next_run_time(self):
+        timestamp = get_next_scheduler_run_time(self.name)
+        if timestamp is None:
+            return None
+        next_run_time = utc_timestamp_to_datetime(timestamp)
+        if self._leased_elsewhere:
+            # Jobs stay due until the lease holder runs them; don't spin on them
+            retry_at = datetime.now(timezone.utc) + timedelta(
+                seconds=SCHEDULER_LEASE_RETRY
+            )
+            next_run_time = max(next_run_time, retry_at)
+        return next_run_time
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs(get_scheduler_job_states(self.name))
+        jobs.extend(self._get_jobs(get_paused_scheduler_job_states(self.name)))
+        return jobs
+
+    def add_job(self, job):
+        if not self._put_job(job, must_exist=False):
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        if not self._put_job(job, must_exist=True):
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        if not delete_scheduler_job(self.name, job_id):
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        delete_all_scheduler_jobs(self.name)
+
+    def _put_job(self, job, must_exist):
+        return put_scheduler_job(
+            self.name,
+            job.id,
+            datetime_to_utc_timestamp(job.next_run_time),
+            pickle.dumps(job.__getstate__(), self.pickle_protocol),
+            must_exist=must_exist,
+        )
 
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, job_states):
+        jobs = []
+        for job_id, job_state in job_states:
+            try:
+                jobs.append(self._reconstitute_job(job_state))
+            except BaseException:
+                self._logger.exception(
+                    'Unable to restore job "%s" -- removing it', job_id
+                )
+                delete_scheduler_job(self.name, job_id)
+        return jobs
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} (name={self.name})>"
+
+
+def persistent_scheduler(name):
+    """
+    Start a BackgroundScheduler whose jobs are saved in Datastore under name.
+    Jobs that came due while the app was down still run (once) when it starts.
     """
-    import json
-    import pickle
-    from base64 import b64decode
-
-    def json_object_hook(dct):
-        if pickle_data := dct.get("__apscheduler_pickle__"):
-            return pickle.loads(b64decode(pickle_data))
-
-        if obj_class := dct.get("__apscheduler_class__"):
-            if obj_state := dct.get("__apscheduler_state__"):
-                obj_class = ref_to_obj(obj_class)
-                obj = object.__new__(obj_class)
-                obj.__setstate__(obj_state)
-                return obj
-
-        return dct
-
-    jobstore = self._jobstores[jobstore]
-    with ExitStack() as stack:
-        # if not hasattr(infile, "read"):
-        #     infile = stack.enter_context(open(infile))
-
-        j = json_store_get(key)
-
-        data = json.loads(j, object_hook=json_object_hook)
-        if not isinstance(data, dict):
-            raise ValueError()
-
-        if (version := data.get("version", None)) != 1:
-            raise ValueError(f"unrecognized version: {version}")
-
-        for job_state in data["jobs"]:
-            job = object.__new__(Job)
-            job.__setstate__(job_state)
-            jobstore.add_job(job)
-
-
-BaseScheduler.to_json = to_json
-BaseScheduler.import_from_db = import_from_db
-
-
-def scheduler_to_json(scheduler):
-    scheduler.print_jobs()
-    return scheduler.to_json()
-
 
-def db_to_scheduler(scheduler, key):
-    scheduler.import_from_db(key)
+    scheduler = BackgroundScheduler(
+        jobstores={"default": DatastoreJobStore(name)},
+        job_defaults={"coalesce": True, "misfire_grace_time": None},
+    )
+    scheduler.start()
+    return scheduler
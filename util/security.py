@@ -17,6 +17,7 @@ import requests
 from constants import ENV, ADMIN_EMAIL, GOOGLE_PROJECT_ID, RECAPTCHA_SECRET_KEY
 from db.group import add_group
 from db.user import update_user_groups
+from util.tasks import task
 
 
 GOOGLE_DISCOVERY_URL = "https://accounts.google.com/.well-known/openid-configuration"
@@ -64,6 +65,7 @@ def get_admin_creds(scopes):
     return creds
 
 
+@task("groups")
 def update_groups(user_email):
     graph = nx.DiGraph()
     queue = set([user_email])
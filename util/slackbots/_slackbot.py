@@ -1,8 +1,12 @@
-from threading import Thread
+import json
+import time
+from collections import Counter, OrderedDict
+from threading import Lock, Thread
 
 from flask import request
 from slack_bolt import App
 import logging
+from slack_sdk.signature import SignatureVerifier
 from slack_bolt.adapter.flask import SlackRequestHandler
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 
@@ -13,6 +17,8 @@ from constants import (
     SLACK_SIGNING_SECRET,
 )
 from util.security import csrf
+from util.slackbots.slack_client import RateLimitedWebClient
+from util.tasks import QueueFull, enqueue, enqueue_once, task
 from db.user import add_user, get_user_entity
 from util.ask_oauth import get_valid_access_token
 from util.discovery_engine import (
@@ -346,7 +352,98 @@ IMC_WELCOME_MESSAGE_TEXT = "Welcome to Illini Media Company!"
 
 logger = logging.getLogger(__name__)
 
-app = App(token=SLACK_BOT_TOKEN, signing_secret=SLACK_SIGNING_SECRET)
+# Every app.client call goes through Slack's per-method rate limits (see slack_client)
+app = App(
+    client=RateLimitedWebClient(token=SLACK_BOT_TOKEN),
+    signing_secret=SLACK_SIGNING_SECRET,
+)
+
+
+@app.middleware
+def _use_rate_limited_client(context, next):
+    # Bolt builds a plain WebClient for each request; give listeners (their client
+    # argument and say()) app.client instead, so their calls are rate limited too
+    context["client"] = app.client
+    next()
+
+
+# Events API deliveries are checked before Bolt sees them (see start_slack). Filters
+# registered for an event type drop events no listener would act on, and event_ids seen
+# in the last SLACK_EVENT_DEDUPE_TTL seconds (Slack retries) are acknowledged and skipped.
+SLACK_EVENT_DEDUPE_TTL = 600
+SLACK_EVENT_DEDUPE_SIZE = 5000
+
+_event_filters = {}
+_seen_event_ids = OrderedDict()
+_seen_event_ids_lock = Lock()
+_event_metrics = {}
+_event_metrics_lock = Lock()
+
+
+def register_event_filter(event_type, keep):
+    """
+    Only pass events of event_type to Bolt when keep(event) is true. Filters must be
+    cheap (no API or database calls); an event is kept if any of its filters keeps it.
+    """
+    _event_filters.setdefault(event_type, []).append(keep)
+
+
+def _record_event(event_type, **values):
+    with _event_metrics_lock:
+        metrics = _event_metrics.setdefault(event_type, Counter())
+        for name, value in values.items():
+            metrics[name] += value
+
+
+def _is_duplicate_event(event_id):
+    now = time.monotonic()
+    with _seen_event_ids_lock:
+        expires = _seen_event_ids.get(event_id)
+        if expires is not None and expires > now:
+            return True
+        _seen_event_ids[event_id] = now + SLACK_EVENT_DEDUPE_TTL
+        _seen_event_ids.move_to_end(event_id)
+        while len(_seen_event_ids) > SLACK_EVENT_DEDUPE_SIZE:
+            _seen_event_ids.popitem(last=False)
+        return False
+
+
+def _should_dispatch(payload, retry_num):
+    """Whether an Events API payload needs to reach Bolt, counting the outcome."""
+    if payload.get("type") != "event_callback":
+        return True
+    event = payload.get("event") or {}
+    event_type = event.get("type") or "unknown"
+    _record_event(event_type, received=1, retries=1 if retry_num else 0)
+
+    filters = _event_filters.get(event_type)
+    if filters and not any(keep(event) for keep in filters):
+        _record_event(event_type, filtered=1)
+        return False
+
+    event_id = payload.get("event_id")
+    if event_id and _is_duplicate_event(event_id):
+        _record_event(event_type, duplicates=1)
+        return False
+
+    _record_event(event_type, dispatched=1)
+    return True
+
+
+def get_slack_event_metrics():
+    """
+    Return {event type: counts} of Events API deliveries on this instance: received,
+    Slack retries, dropped by filters or as duplicates, and passed on to Bolt.
+    """
+    with _event_metrics_lock:
+        snapshot = {name: dict(metrics) for name, metrics in _event_metrics.items()}
+    return {
+        event_type: {
+            name: metrics.get(name, 0)
+            for name in ("received", "retries", "filtered", "duplicates", "dispatched")
+        }
+        for event_type, metrics in sorted(snapshot.items())
+    }
 
 
 @app.event("app_mention")
@@ -354,49 +451,76 @@ def handle_mention(event, say):
     say("👋 Hey!")
 
 
+# Slack handlers only acknowledge and hand their Slack API calls to the "slack" task
+# queue, so a burst of joins or clicks doesn't tie up request threads or time out
+
+
+@task("slack")
+def _send_direct_message(user_id, blocks, text):
+    app.client.chat_postMessage(
+        token=SLACK_BOT_TOKEN,
+        channel=user_id,
+        blocks=blocks,
+        text=text,
+    )
+    print("   Message sent to " + user_id + ".\n")
+
+
+WELCOME_CHANNEL_IDS = {
+    IMC_GENERAL_ID,
+    IMC_GENERAL_TEST_ID,
+    ILLIO_ANNOUNCEMENTS_ID,
+    WPGU_ANNOUNCEMENTS_ID,
+}
+register_event_filter(
+    "member_joined_channel", lambda event: event.get("channel") in WELCOME_CHANNEL_IDS
+)
+
+
 @app.event("member_joined_channel")
-def member_joined_channel(event):
+def member_joined_channel(event, body, context):
+    # channel_cache imports this module, so it can't be imported at the top
+    from util.slackbots.channel_cache import note_member_joined
+
     user_id = event["user"]
     channel_id = event["channel"]
+    note_member_joined(channel_id, user_id, context.bot_user_id)
     print("\nUser " + user_id + " joined channel " + channel_id)
     print(channel_id + " Here")
     if channel_id in [IMC_GENERAL_ID, IMC_GENERAL_TEST_ID]:
-        directMessage = user_id
-        print("   User ID: " + user_id)
-        app.client.chat_postMessage(
-            token=SLACK_BOT_TOKEN,
-            channel=directMessage,
-            blocks=IMC_WELCOME_MESSAGE,
-            text=IMC_WELCOME_MESSAGE_TEXT,
-        )
-        print("   Message sent.\n")
+        blocks, text = IMC_WELCOME_MESSAGE, IMC_WELCOME_MESSAGE_TEXT
     elif channel_id == ILLIO_ANNOUNCEMENTS_ID:
-        directMessage = user_id
-        print("   User ID: " + user_id)
-        app.client.chat_postMessage(
-            token=SLACK_BOT_TOKEN,
-            channel=directMessage,
-            blocks=ILLIO_MESSAGE,
-            text=ILLIO_MESSAGE_TEXT,
-        )
-        print("   Message sent.\n")
+        blocks, text = ILLIO_MESSAGE, ILLIO_MESSAGE_TEXT
     elif channel_id == WPGU_ANNOUNCEMENTS_ID:
-        directMessage = user_id
-        print("   User ID: " + user_id)
-        app.client.chat_postMessage(
-            token=SLACK_BOT_TOKEN,
-            channel=directMessage,
-            blocks=WPGU_MESSAGE,
-            text=WPGU_MESSAGE_TEXT,
-        )
-        print("   Message sent.\n")
+        blocks, text = WPGU_MESSAGE, WPGU_MESSAGE_TEXT
     else:
         print("  Not a channel of interest. No messages sent.")
+        return
+
+    print("   User ID: " + user_id)
+    try:
+        # Slack retries events it doesn't see acknowledged; only welcome once
+        enqueue_once(
+            body.get("event_id") or f"joined:{channel_id}:{user_id}",
+            _send_direct_message,
+            user_id,
+            blocks,
+            text,
+        )
+    except QueueFull:
+        logger.error(f"Slack task queue full, not messaging {user_id}")
 
 
 def buttonWrapper(buttonName, buttonHashtag, channel, userName, userId):
     print("User " + userName + " clicked " + buttonName + " Button")
+    try:
+        enqueue(_add_to_channel, buttonHashtag, channel, userName, userId)
+    except QueueFull:
+        logger.error(f"Slack task queue full, not adding {userId} to {buttonHashtag}")
 
+
+@task("slack")
+def _add_to_channel(buttonHashtag, channel, userName, userId):
     try:
         app.client.conversations_invite(
             token=SLACK_BOT_TOKEN,
@@ -477,14 +601,10 @@ def imc_business_button(ack, body, logger):
     print("User " + userName + " clicked IMC Business button")
 
     # direct message the user
-    app.client.chat_postMessage(
-        token=SLACK_BOT_TOKEN,
-        channel=userId,
-        blocks=IMC_MESSAGE,
-        text=IMC_MESSAGE_TEXT,
-    )
-
-    print("    Section choose message sent.\n")
+    try:
+        enqueue(_send_direct_message, userId, IMC_MESSAGE, IMC_MESSAGE_TEXT)
+    except QueueFull:
+        logger.error(f"Slack task queue full, not messaging {userId}")
 
 
 # IMC Business buttons
@@ -657,10 +777,23 @@ def start_slack(flask_app):
 
     if ENV == "prod":
         handler = SlackRequestHandler(app)
+        verifier = SignatureVerifier(SLACK_SIGNING_SECRET)
 
         @flask_app.route("/slack/events", methods=["POST"])
         @csrf.exempt
         def slack_events():
+            # Shed unwanted and repeated events before Bolt parses and dispatches them.
+            # Only verified requests are trusted, so forged event_ids can't block events.
+            if request.is_json:
+                body = request.get_data()
+                if verifier.is_valid_request(body, dict(request.headers)):
+                    try:
+                        payload = json.loads(body)
+                    except ValueError:
+                        payload = {}
+                    retry_num = request.headers.get("X-Slack-Retry-Num")
+                    if not _should_dispatch(payload, retry_num):
+                        return "", 200
             return handler.handle(request)
 
         logger.info("Slack events listener registered at /slack/events")
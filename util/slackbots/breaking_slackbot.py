@@ -4,11 +4,13 @@ from slack_bolt.adapter.flask import SlackRequestHandler
 from slack_bolt.adapter.socket_mode import SocketModeHandler
 from util.slackbots._slackbot import app
 from flask_login import login_required
-from db.story import add_story, get_recent_stories
-from util.stories import get_published_url, get_title_from_url
+from db.story import add_story, get_story_by_slack_message
+from util.breaking_news_watcher import request_publish_check
+from util.stories import get_title_from_url
 
 from constants import ENV, SLACK_BOT_TOKEN, SLACK_APP_TOKEN, SLACK_SIGNING_SECRET
 from util.security import csrf
+from util.tasks import QueueFull, enqueue, task
 
 DI_COPYING_ID = "C06LYTJ5N6S"
 
@@ -117,7 +119,15 @@ def post_message():
         text="BREAKING NEWS ALERT",
     )
 
-    add_story(story_title, story_url, False, False, result["ts"], "User")
+    add_story(
+        story_title,
+        story_url,
+        False,
+        False,
+        result["ts"],
+        "User",
+        slack_channel_id=DI_COPYING_ID,
+    )
     return "success", 200
 
 
@@ -125,12 +135,21 @@ def post_message():
 def breaking_button(ack, logger, body):
     ack()
     logger.info(body)
-    ts = body["message"]["ts"]
+    try:
+        enqueue(_check_breaking_story, body["message"]["ts"])
+    except QueueFull:
+        logger.error("[breaking_button] task queue full, dropping click")
+
 
-    url = story_url_from_ts(20, ts)
+@task("slack")
+def _check_breaking_story(ts):
+    # WordPress is checked by the publish watcher; the button shows what it found
+    story = get_story_by_slack_message(DI_COPYING_ID, ts)
+    url = story["url"] if story else None
     if url == None:
-        print("story is no longer recent")
-    elif get_published_url(url) == None:
+        print("no story found for this message")
+    elif story.get("published_url") == None:
+        request_publish_check(story["id"], DI_COPYING_ID)
         app.client.chat_update(
             token=SLACK_BOT_TOKEN,
             channel=DI_COPYING_ID,
@@ -138,7 +157,7 @@ def breaking_button(ack, logger, body):
             blocks=NOT_POSTED,
             text="STORY HAS NOT BEEN POSTED",
         )
-    elif get_published_url(url) != None:
+    else:
         app.client.chat_update(
             token=SLACK_BOT_TOKEN,
             channel=DI_COPYING_ID,
@@ -146,11 +165,3 @@ def breaking_button(ack, logger, body):
             blocks=POSTED_SUCCESSFULLY,
             text="STORY HAS BEEN POSTED",
         )
-
-
-def story_url_from_ts(count, ts):
-    stories = get_recent_stories(count)
-    for i in stories:
-        if i["slack_message_id"] == ts:
-            return i["url"]
-    return None
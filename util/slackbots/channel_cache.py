@@ -0,0 +1,144 @@
+"""
+In-process cache of the bot's channel access and channel member sets.
+
+can_bot_access_channel() used to call conversations.info on every check, and EMS
+channel syncs invited or removed users without knowing who was already in a channel.
+Access results are kept for CHANNEL_ACCESS_TTL. A channel's members are loaded once
+with conversations.members and then kept current from member_joined_channel /
+member_left_channel events (and from this app's own invites and removals) until
+CHANNEL_MEMBERS_TTL, which covers any events that were missed. EMS syncs only trust
+a member set loaded within CHANNEL_MEMBERS_FRESH_FOR, and only to skip invites.
+
+The Slack app must be subscribed to member_left_channel for removals to be seen
+between refreshes.
+"""
+
+import logging
+import time
+from threading import Lock
+from typing import Optional
+
+from constants import SLACK_BOT_TOKEN
+from util.slackbots._slackbot import app, register_event_filter
+
+logger = logging.getLogger(__name__)
+
+# Seconds a channel access check is reused
+CHANNEL_ACCESS_TTL = 10 * 60
+# Seconds a channel's member set is used before it is reloaded
+CHANNEL_MEMBERS_TTL = 30 * 60
+# Seconds after loading that a member set is trusted to skip an invite
+CHANNEL_MEMBERS_FRESH_FOR = 60
+# Members per conversations.members page
+CHANNEL_MEMBERS_PAGE_SIZE = 1000
+
+# channel ID -> (time.monotonic() it expires, value); _members entries also end with
+# the time.monotonic() they were loaded
+_access = {}
+_members = {}
+_lock = Lock()
+
+
+def _get(cache, channel_id):
+    with _lock:
+        entry = cache.get(channel_id)
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+
+def get_channel_access(channel_id: str) -> Optional[bool]:
+    """Cached result of the bot's access to a channel, or None if not checked lately."""
+    return _get(_access, channel_id)
+
+
+def set_channel_access(channel_id: str, has_access: bool):
+    with _lock:
+        _access[channel_id] = (time.monotonic() + CHANNEL_ACCESS_TTL, has_access)
+
+
+def get_channel_members(channel_id: str, max_age: float = None) -> Optional[set]:
+    """
+    Return the set of user IDs in a channel, loading it from Slack if it isn't cached
+    (or was loaded more than max_age seconds ago). Returns None if Slack can't list
+    the channel's members.
+    """
+    with _lock:
+        entry = _members.get(channel_id)
+    now = time.monotonic()
+    if (
+        entry is not None
+        and entry[0] > now
+        and (max_age is None or now - entry[2] <= max_age)
+    ):
+        return entry[1]
+
+    members = set()
+    cursor = None
+    try:
+        while True:
+            res = app.client.conversations_members(
+                token=SLACK_BOT_TOKEN,
+                channel=channel_id,
+                limit=CHANNEL_MEMBERS_PAGE_SIZE,
+                cursor=cursor,
+            )
+            members.update(res.get("members", []))
+            cursor = (res.get("response_metadata") or {}).get("next_cursor")
+            if not cursor:
+                break
+    except Exception as e:
+        logger.warning(f"Could not list members of channel {channel_id}: {e}")
+        return None
+
+    now = time.monotonic()
+    with _lock:
+        _members[channel_id] = (now + CHANNEL_MEMBERS_TTL, members, now)
+    return members
+
+
+def is_channel_member(
+    user_id: str, channel_id: str, max_age: float = None
+) -> Optional[bool]:
+    """
+    Whether a user is in a channel, or None if membership can't be determined.
+    max_age is passed to get_channel_members.
+    """
+    members = get_channel_members(channel_id, max_age)
+    return None if members is None else user_id in members
+
+
+def note_member_joined(channel_id: str, user_id: str, bot_user_id: str = None):
+    """Record a user joining a channel in whatever is cached for it."""
+    with _lock:
+        entry = _members.get(channel_id)
+        if entry is not None:
+            entry[1].add(user_id)
+        if bot_user_id and user_id == bot_user_id:
+            _access.pop(channel_id, None)
+
+
+def note_member_left(channel_id: str, user_id: str, bot_user_id: str = None):
+    """Record a user leaving a channel in whatever is cached for it."""
+    with _lock:
+        entry = _members.get(channel_id)
+        if entry is not None:
+            entry[1].discard(user_id)
+        if bot_user_id and user_id == bot_user_id:
+            _access.pop(channel_id, None)
+            _members.pop(channel_id, None)
+
+
+def _is_cached_channel(event) -> bool:
+    channel_id = event.get("channel")
+    return channel_id in _members or channel_id in _access
+
+
+# Membership events for channels with nothing cached have nothing to update
+register_event_filter("member_joined_channel", _is_cached_channel)
+register_event_filter("member_left_channel", _is_cached_channel)
+
+
+@app.event("member_left_channel")
+def _on_member_left_channel(event, context):
+    note_member_left(event.get("channel"), event.get("user"), context.bot_user_id)
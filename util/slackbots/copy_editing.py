@@ -8,13 +8,13 @@ from db.kv_store import kv_store_get, kv_store_set
 from db.user import add_user, get_user, update_user_last_edited
 from util.security import get_creds
 from util.slackbots._slackbot import app
+from util.slackbots.user_directory import get_slack_id_by_email
 from apscheduler.triggers.date import DateTrigger
-from apscheduler.schedulers.background import BackgroundScheduler
+from util.scheduler import persistent_scheduler
 import random
 
 
-scheduler = BackgroundScheduler()
-scheduler.start()
+scheduler = persistent_scheduler("COPY_JOBS")
 SCOPES = ["https://www.googleapis.com/auth/calendar.events"]
 SHIFT_OFFSET = timedelta(
     minutes=15
@@ -42,7 +42,7 @@ def get_copy_editor(story_url, is_breaking):
             )
         )
         scheduler.add_job(
-            lambda: notify_copy_editor(story_url, is_breaking), trigger=trigger
+            notify_copy_editor, args=[story_url, is_breaking], trigger=trigger
         )
         print("\tNo editor on shift. Notification delayed.")
         return None, False
@@ -114,7 +114,9 @@ def notify_copy_editor(story_url, is_breaking, copy_chief_email=None, call=False
         print(f"\tEditor decided Copy Chief ({copy_chief_email}).")
         email = copy_chief_email
 
-    slack_id = app.client.users_lookupByEmail(email=email)["user"]["id"]
+    slack_id = get_slack_id_by_email(email)
+    if slack_id is None:
+        raise ValueError(f"No Slack account found for {email}")
     app.client.chat_postMessage(
         token=SLACK_BOT_TOKEN,
         channel=DI_COPY_TAG_CHANNEL_ID,
@@ -9,18 +9,22 @@ import logging
 from typing import Any, Dict, List, Optional
 from constants import SLACK_BOT_TOKEN
 from util.slackbots._slackbot import app
+from util.slackbots.channel_cache import (
+    get_channel_access,
+    note_member_joined,
+    note_member_left,
+    set_channel_access,
+)
+from util.slackbots.user_directory import get_slack_id_by_email
 
 
 logger = logging.getLogger(__name__)
 
 
-# Local cache for user IDs
-_user_id_cache = {}
-
-
 def can_bot_access_channel(channel_id: str) -> bool:
     """
-    Checks if a channel exists and if the acting bot is in it.
+    Checks if a channel exists and if the acting bot is in it. Results are cached for
+    a few minutes (see channel_cache).
 
     Arguments:
         `channel_id` (`str`): The ID of the channel
@@ -30,11 +34,16 @@ def can_bot_access_channel(channel_id: str) -> bool:
     """
     logging.debug(f"Checking bot access for channel {channel_id}")
 
+    cached = get_channel_access(channel_id)
+    if cached is not None:
+        return cached
+
     try:
         res = app.client.conversations_info(channel=channel_id)
 
         if not res.get("ok"):
             logging.warning(f"Slack API returned ok=False for channel {channel_id}.")
+            set_channel_access(channel_id, False)
             return False
 
         is_member = res["channel"].get("is_member", False)
@@ -44,6 +53,7 @@ def can_bot_access_channel(channel_id: str) -> bool:
         else:
             logging.debug(f"Bot is NOT a member of channel {channel_id}.")
 
+        set_channel_access(channel_id, is_member)
         return is_member
     except Exception as e:
         error_msg = str(e)
@@ -52,6 +62,7 @@ def can_bot_access_channel(channel_id: str) -> bool:
             logging.error(
                 f"Channel ID {channel_id} not found. Verify channel's ID and existence."
             )
+            set_channel_access(channel_id, False)
         elif "missing_scope" in error_msg:
             logging.critical(
                 f"Permissions Error: Bot lacks 'channels:read' or 'groups:read' scope."
@@ -253,11 +264,13 @@ def add_user_to_channel(user_id: str, channel_id: str) -> tuple[bool, str | None
     try:
         res = app.client.conversations_invite(channel=channel_id, users=[user_id])
         logging.info(f"Successfully added user {user_id} to channel {channel_id}.")
+        note_member_joined(channel_id, user_id)
         return True, None
     except Exception as e:
         error_msg = str(e)
         if "already_in_channel" in error_msg:
             logging.info(f"User {user_id} already in channel {channel_id}. Continuing.")
+            note_member_joined(channel_id, user_id)
             return True, None  # Treat as success if they are already there
         elif "ratelimited" in error_msg:
             logging.critical(f"SLACK RATE LIMIT HIT: {error_msg}")
@@ -286,11 +299,13 @@ def remove_user_from_channel(user_id: str, channel_id: str) -> tuple[bool, str |
     try:
         res = app.client.conversations_kick(channel=channel_id, user=user_id)
         logging.info(f"Successfully removed user {user_id} from channel {channel_id}.")
+        note_member_left(channel_id, user_id)
         return True, None
     except Exception as e:
         error_msg = str(e)
         if "not_in_channel" in error_msg:
             logging.info(f"User {user_id} not in channel {channel_id}. Continuing.")
+            note_member_left(channel_id, user_id)
             return True, None  # Treat as success if they are already not in channel
         elif "restricted_action" in error_msg:
             logging.warning(
@@ -345,8 +360,8 @@ def update_message_blocks(
 
 def _lookup_user_id_by_email(email: str) -> Optional[str]:
     """
-    Get a user's Slack ID from their associated account email. First tries a local cache,
-    then resorts to Slack API.
+    Get a user's Slack ID from their associated account email, via the Slack user
+    directory (which only calls the Slack API for unknown or stale users).
 
     Arguments:
         `email` (`str`): The IMC email of the user
@@ -354,29 +369,4 @@ def _lookup_user_id_by_email(email: str) -> Optional[str]:
         `str`: The user's Slack ID, else `None`
     """
     logging.debug(f"Looking for Slack ID for user {email}")
-
-    if email in _user_id_cache:
-        user_id = _user_id_cache[email]
-        logging.info(f"Mapped {email} to {user_id} via cache.")
-        return user_id
-
-    try:
-        logging.debug(f"Querying Slack API for email {email}.")
-        user_id = app.client.users_lookupByEmail(email=email)["user"]["id"]
-
-        _user_id_cache[email] = user_id
-        logging.info(f"Successfully mapped {email} to Slack ID {user_id}")
-        return user_id
-    except Exception as e:
-        error_msg = str(e)
-
-        if "users_not_found" in error_msg:
-            logging.warning(f"Lookup failed: No Slack account found for {email}")
-        elif "ratelimited" in error_msg:
-            logging.critical(f"SLACK RATE LIMIT HIT: {error_msg}")
-        else:
-            logging.exception(
-                f"Unexpected Slack API error during lookup for {email}: {error_msg}"
-            )
-
-        return None
+    return get_slack_id_by_email(email)
@@ -8,9 +8,11 @@ import datetime
 import logging
 import re
 import random
+from slack_bolt.context.respond import Respond
 from util.slackbots._slackbot import app
-from threading import Thread
+from util.slackbots.user_directory import get_slack_user
 from util.security import csrf
+from util.tasks import QueueFull, enqueue, task
 from db.user import add_user, get_user_entity, check_and_log_query
 from util.ask_oauth import get_valid_access_token
 from util.discovery_engine import (
@@ -19,7 +21,7 @@ from util.discovery_engine import (
     extract_search_results,
     search_query,
 )
-from constants import SLACK_BOT_TOKEN, BASE_URL
+from constants import BASE_URL
 
 
 logger = logging.getLogger(__name__)
@@ -27,15 +29,11 @@ logger = logging.getLogger(__name__)
 
 def _slack_user_profile(user_id):
     """
-    Fetch a Slack user's profile data by user id.
-    Returns None if the Slack API call fails.
+    Fetch a Slack user's profile data by user id from the Slack user directory.
+    Returns None if the user can't be found.
     """
-    try:
-        res = app.client.users_info(token=SLACK_BOT_TOKEN, user=user_id)
-        return res.get("user", {}).get("profile", {})
-    except Exception as e:
-        logging.error(f"[ask] users_info failed: {e}")
-        return None
+    user = get_slack_user(user_id)
+    return user["profile"] if user else None
 
 
 def _format_sources(sources):
@@ -159,11 +157,23 @@ def _easter_egg_response(question_raw: str):
     return exact.get(q)
 
 
-def _ask_and_respond(question, access_token, user_id, respond):
+@task("ask")
+def _ask_and_respond(question, email, user_id, response_url):
     """
     Query Discovery Engine and send a formatted Slack response.
     Includes fallback search sources and user-facing error handling.
+    Runs as a background task, so it takes the user's email and the command's
+    response_url rather than an access token and respond function.
     """
+    respond = Respond(response_url=response_url)
+    access_token = get_valid_access_token(email)
+    if not access_token:
+        respond(
+            text="Your Illini Media Google account is no longer connected. Please log in again.",
+            response_type="ephemeral",
+        )
+        return
+
     try:
         response = answer_query(
             query=question,
@@ -290,8 +300,10 @@ def ask_command(ack, body, respond):
         return
 
     respond(text="Thinking...", response_type="ephemeral")
-    Thread(
-        target=_ask_and_respond,
-        args=(question, access_token, user_id, respond),
-        daemon=True,
-    ).start()
+    try:
+        enqueue(_ask_and_respond, question, email, user_id, body.get("response_url"))
+    except QueueFull:
+        respond(
+            text="I'm answering a lot of questions right now. Please try again in a minute.",
+            response_type="ephemeral",
+        )
@@ -6,32 +6,46 @@ Last modified Nov. 8, 2025
 
 from __future__ import annotations
 import json
+import logging
 import re
+import time
 from typing import Any, Dict, List, Optional
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 from constants import SLACK_BOT_TOKEN, ENV
-from util.slackbots._slackbot import app
+from util.slackbots._slackbot import app, register_event_filter
 from util.slackbots.general import (
     _lookup_user_id_by_email,
     dm_user_by_email,
     dm_channel_by_id,
 )
+from util.slackbots.user_directory import get_slack_user
 from db.photo_request import (
     claim_photo_request,
+    claim_threads_backfilled,
     complete_photo_request,
-    update_photo_request,
-    get_id_from_slack_claim_ts,
+    get_photo_request_by_claim_thread,
+    get_photo_request_by_uid,
+    set_photo_request_claim_thread,
     delete_photo_request,
 )
 from util.helpers.ap_datetime import ap_daydate, ap_daydatetime, ap_datetime
+from util.tasks import QueueFull, enqueue, enqueue_once, task
 
 from constants import (
     PHOTO_REQUESTS_CHANNEL_ID,
     COURTESY_REQUESTS_CHANNEL_ID,
 )
 
+logger = logging.getLogger(__name__)
+
+# DM threads recently found not to be claim confirmations, so further replies in them
+# skip the db. (channel, thread_ts) -> time.monotonic() the entry expires
+_NOT_CLAIM_THREAD_TTL = 600
+_NOT_CLAIM_THREAD_MAX = 1000
+_not_claim_threads = {}
+
 
 def get_slack_emoji(destination: Optional[str]) -> str:
     """Return a Slack emoji code based on the destination."""
@@ -105,11 +119,10 @@ def send_claimer_confirmation(
 
     if isinstance(res, dict) and res.get("ok"):
         try:
-            update_photo_request(
-                uid=int(request_id),
-                claimSlackChannel=res.get("channel"),
-                claimSlackTs=res.get("ts"),
+            set_photo_request_claim_thread(
+                uid=int(request_id), ch=res.get("channel"), thread_ts=res.get("ts")
             )
+            _not_claim_threads.pop((res.get("channel"), res.get("ts")), None)
 
             return {"ok": True, "message": res}
 
@@ -209,10 +222,18 @@ def _handle_claim_generic(ack, body, logger):
     - Rebuilds Slack message from updated record (so Status footer flips to Claimed)
     - Sends confirmation DM to claimer
     - DMs requester and updates original requstor message
+    The work runs as a background task so the click is acknowledged right away.
     """
     ack()
     logger.info(body)
+    try:
+        enqueue(_do_photo_claim, body)
+    except QueueFull:
+        logger.error("[photo_claim] task queue full, dropping claim")
 
+
+@task("slack")
+def _do_photo_claim(body):
     try:
         channel_id = (body.get("channel") or {}).get("id") or (
             body.get("container") or {}
@@ -248,13 +269,12 @@ def _handle_claim_generic(ack, body, logger):
             return
 
         # Get claimer identity from Slack (email may be None if hidden)
-        try:
-            user_info = app.client.users_info(token=SLACK_BOT_TOKEN, user=user_id)
-            claimer_profile = user_info.get("user", {}).get("profile", {})
-            claimer_email = claimer_profile.get("email")
-            claimer_name = user_info.get("user", {}).get("real_name") or f"<@{user_id}>"
-        except Exception as e:
-            logger.error(f"[photo_claim] users_info failed for {user_id}: {e}")
+        claimer = get_slack_user(user_id)
+        if claimer:
+            claimer_email = claimer.get("email")
+            claimer_name = claimer.get("real_name") or f"<@{user_id}>"
+        else:
+            logger.error(f"[photo_claim] Slack user lookup failed for {user_id}")
             claimer_email, claimer_name = None, f"<@{user_id}>"
 
         try:
@@ -560,6 +580,19 @@ def _extract_drive_url(text: str) -> Optional[str]:
     return m.group(0) if m else None
 
 
+def _is_dm_thread_reply(event) -> bool:
+    """Cheap check for a user's reply in a DM thread, the only messages handled here."""
+    return (
+        not event.get("bot_id")
+        and event.get("channel_type") == "im"
+        and bool(event.get("thread_ts"))
+        and event.get("thread_ts") != event.get("ts")
+    )
+
+
+register_event_filter("message", _is_dm_thread_reply)
+
+
 @app.event("message")
 def _on_dm_message(body, logger, event):
     """
@@ -602,54 +635,83 @@ def _on_dm_message(body, logger, event):
 
         print("[slack_dm] DM reply received; channel, ts = ", channel, thread_ts)
 
-        req = get_id_from_slack_claim_ts(channel, thread_ts)
+        thread_key = (channel, thread_ts)
+        if _not_claim_threads.get(thread_key, 0) > time.monotonic():
+            return
+
+        req = get_photo_request_by_claim_thread(channel, thread_ts)
 
         if not req:
+            # Remember threads that aren't claims; the cache is small, so just reset it.
+            # Misses are only remembered once every claim has a thread mapping, since
+            # before that they come from an eventually consistent query
+            if not claim_threads_backfilled():
+                return
+            if len(_not_claim_threads) >= _NOT_CLAIM_THREAD_MAX:
+                _not_claim_threads.clear()
+            _not_claim_threads[thread_key] = time.monotonic() + _NOT_CLAIM_THREAD_TTL
             return  # Simply return if this message isn't one we care about so we don't break other code
 
         print("[slack_dm] Identified DM for current photo request.")
 
-        # Make sure the link is a valid Google Drive URL
-        drive = _extract_drive_url(text)
-        if not drive:
-            # Let the user know if the link was invalid
-            try:
-                res = app.client.chat_postMessage(
-                    token=SLACK_BOT_TOKEN,
-                    channel=user_id,
-                    text=f"That doesn't look like a Google Drive link to me, could you try again?",
-                    thread_ts=thread_ts,
-                )
-                return {"ok": True, "channel": res["channel"], "ts": res["ts"]}
-            except Exception as e:
-                print(f"[dm_link] DM by id failed: {e}")
-                return {"ok": False, "error": str(e)}
-
-        # Check if the request has already been completed
-        if req.get("status") == "completed":
-            # Let the user know it was already completed
-            try:
-                res = app.client.chat_postMessage(
-                    token=SLACK_BOT_TOKEN,
-                    channel=user_id,
-                    text=f"This request has already been completed.",
-                    thread_ts=thread_ts,
-                )
-                return {"ok": True, "channel": res["channel"], "ts": res["ts"]}
-            except Exception as e:
-                print(f"[dm_link] DM by id failed: {e}")
-                return {"ok": False, "error": str(e)}
+        # Validating the link and completing the request runs in the background, once
+        # per message even if Slack retries the event
+        enqueue_once(
+            body.get("event_id") or f"dm:{channel}:{ev.get('ts')}",
+            _handle_claim_thread_reply,
+            uid=req.get("uid"),
+            user_id=user_id,
+            thread_ts=thread_ts,
+            text=text,
+        )
 
-        # Complete the request
+    except QueueFull:
+        logger.error("[dm_link] task queue full, dropping DM reply")
+    except Exception as e:
+        logger.error(f"[dm_link] handler error: {e}")
+
+
+@task("slack")
+def _handle_claim_thread_reply(*, uid, user_id, thread_ts, text):
+    """
+    Complete a photo request from the photographer's reply in its claim thread, or
+    tell them why it couldn't be.
+    """
+    # Make sure the link is a valid Google Drive URL
+    drive = _extract_drive_url(text)
+    if not drive:
+        # Let the user know if the link was invalid
         try:
-            complete_request(uid=req.get("uid"), driveURL=drive)
+            app.client.chat_postMessage(
+                token=SLACK_BOT_TOKEN,
+                channel=user_id,
+                text=f"That doesn't look like a Google Drive link to me, could you try again?",
+                thread_ts=thread_ts,
+            )
         except Exception as e:
-            logger.error(
-                f"[dm_link] DB complete_request failed for {req.get('uid')}: {e}"
+            print(f"[dm_link] DM by id failed: {e}")
+        return
+
+    # Check if the request has already been completed
+    req = get_photo_request_by_uid(uid)
+    if req and req.get("status") == "completed":
+        # Let the user know it was already completed
+        try:
+            app.client.chat_postMessage(
+                token=SLACK_BOT_TOKEN,
+                channel=user_id,
+                text=f"This request has already been completed.",
+                thread_ts=thread_ts,
             )
+        except Exception as e:
+            print(f"[dm_link] DM by id failed: {e}")
+        return
 
+    # Complete the request
+    try:
+        complete_request(uid=uid, driveURL=drive)
     except Exception as e:
-        logger.error(f"[dm_link] handler error: {e}")
+        logger.error(f"[dm_link] DB complete_request failed for {uid}: {e}")
 
 
 def claim_request(uid: int, name: str, email: str):
@@ -0,0 +1,236 @@
+"""
+Rate-limit-aware Slack Web API client.
+
+Slack limits each Web API method per workspace by tier (and chat.postMessage to about
+one message per second per channel). RateLimitedWebClient is the client behind
+app.client: every call waits for a token from its method's bucket (per channel for
+chat.postMessage), so bursts such as mass onboarding or a flood of RSS stories are
+spread out instead of being rejected. When Slack still answers 429, the bucket pauses
+for the Retry-After it gives and the call is retried.
+
+chat.update calls for a message that is still waiting for its turn are coalesced:
+the latest blocks/text win and every caller gets the result of the one request.
+
+Calls that would wait longer than SLACK_MAX_QUEUE_WAIT raise SlackRateLimited instead,
+which callers handle like any other Slack error.
+"""
+
+import logging
+import time
+from collections import Counter
+from concurrent.futures import Future
+from threading import Lock
+
+from slack_sdk import WebClient
+from slack_sdk.errors import SlackApiError
+
+logger = logging.getLogger(__name__)
+
+# Requests per minute for each Slack rate limit tier
+SLACK_TIER_RATES = {1: 1, 2: 20, 3: 50, 4: 100}
+# Tier of each method this app calls; unlisted methods use SLACK_DEFAULT_TIER
+SLACK_METHOD_TIERS = {
+    "users.list": 2,
+    "conversations.list": 2,
+    "chat.update": 3,
+    "chat.delete": 3,
+    "conversations.info": 3,
+    "conversations.invite": 3,
+    "conversations.join": 3,
+    "conversations.kick": 3,
+    "conversations.history": 3,
+    "conversations.replies": 3,
+    "users.lookupByEmail": 3,
+    "chat.postEphemeral": 4,
+    "chat.getPermalink": 4,
+    "conversations.members": 4,
+    "conversations.open": 4,
+    "users.info": 4,
+    "views.open": 4,
+    "views.update": 4,
+}
+SLACK_DEFAULT_TIER = 3
+# chat.postMessage isn't tiered; it is limited per channel instead
+SLACK_POST_MESSAGE_RATE = 60
+# Calls a bucket lets through at once before spacing them out
+SLACK_BURST = 5
+# Seconds a call may wait for its turn before failing with SlackRateLimited
+SLACK_MAX_QUEUE_WAIT = 30
+# Times a call answered with 429 is retried
+SLACK_RATE_LIMIT_RETRIES = 2
+
+_metrics = {}
+_metrics_lock = Lock()
+
+
+class SlackRateLimited(Exception):
+    """Raised when a Slack call would have to wait too long for its rate limit."""
+
+
+def _record(method, **values):
+    with _metrics_lock:
+        metrics = _metrics.setdefault(method, Counter())
+        for name, value in values.items():
+            metrics[name] += value
+
+
+class _TokenBucket:
+    """
+    Tokens refill at rate_per_minute up to burst. Callers reserve a token even when
+    none is left (the count goes negative), so waiting callers are served in order.
+    """
+
+    def __init__(self, rate_per_minute, burst=SLACK_BURST):
+        self.rate = rate_per_minute / 60
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0
+        self._lock = Lock()
+
+    def reserve(self, max_wait):
+        """Take a token; returns seconds to wait for it, or None if over max_wait."""
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            wait = max(0, self._paused_until - now)
+            if self._tokens < 1:
+                wait = max(wait, (1 - self._tokens) / self.rate)
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+    def pause(self, seconds):
+        """Hold every call on this bucket for seconds (Slack's Retry-After)."""
+
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RateLimitedWebClient(WebClient):
+    """WebClient that queues calls through per-method token buckets."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._buckets = {}
+        self._buckets_lock = Lock()
+        # (channel, ts) -> {"kwargs", "future"} of the chat.update waiting for its turn
+        self._pending_updates = {}
+        self._pending_lock = Lock()
+
+    def _bucket(self, api_method, channel):
+        if api_method == "chat.postMessage":
+            key, rate = f"{api_method}:{channel}", SLACK_POST_MESSAGE_RATE
+        else:
+            tier = SLACK_METHOD_TIERS.get(api_method, SLACK_DEFAULT_TIER)
+            key, rate = api_method, SLACK_TIER_RATES[tier]
+        with self._buckets_lock:
+            if key not in self._buckets:
+                self._buckets[key] = _TokenBucket(rate)
+            return self._buckets[key]
+
+    def _wait_for_turn(self, api_method, bucket):
+        wait = bucket.reserve(SLACK_MAX_QUEUE_WAIT)
+        if wait is None:
+            _record(api_method, rejected=1)
+            raise SlackRateLimited(api_method)
+        if wait > 0:
+            _record(api_method, queued=1, wait_seconds_total=wait)
+            time.sleep(wait)
+
+    def _send(self, api_method, bucket, kwargs, have_turn=False):
+        attempt = 0
+        while True:
+            if not have_turn:
+                self._wait_for_turn(api_method, bucket)
+            have_turn = False
+            try:
+                response = super().api_call(api_method, **kwargs)
+            except SlackApiError as e:
+                if e.response.status_code != 429 or attempt >= SLACK_RATE_LIMIT_RETRIES:
+                    _record(api_method, errors=1)
+                    raise
+                headers = e.response.headers or {}
+                retry_after = int(
+                    headers.get("Retry-After") or headers.get("retry-after") or 1
+                )
+                logger.warning(
+                    f"Slack rate limited {api_method}; retrying in {retry_after}s"
+                )
+                _record(api_method, throttled=1)
+                bucket.pause(retry_after)
+                attempt += 1
+                continue
+            _record(api_method, calls=1)
+            return response
+
+    def _update_message(self, bucket, message, kwargs):
+        with self._pending_lock:
+            pending = self._pending_updates.get(message)
+            if pending is not None:
+                # Replace the waiting update's content and share its result
+                pending["kwargs"] = kwargs
+                _record("chat.update", coalesced=1)
+                joined = True
+            else:
+                pending = {"kwargs": kwargs, "future": Future()}
+                self._pending_updates[message] = pending
+                joined = False
+        if joined:
+            return pending["future"].result()
+
+        try:
+            try:
+                self._wait_for_turn("chat.update", bucket)
+            finally:
+                with self._pending_lock:
+                    del self._pending_updates[message]
+            response = self._send(
+                "chat.update", bucket, pending["kwargs"], have_turn=True
+            )
+        except Exception as e:
+            pending["future"].set_exception(e)
+            raise
+        pending["future"].set_result(response)
+        return response
+
+    def api_call(self, api_method, **kwargs):
+        args = kwargs.get("json") or kwargs.get("data") or kwargs.get("params") or {}
+        channel = args.get("channel")
+        bucket = self._bucket(api_method, channel)
+        if api_method == "chat.update" and args.get("ts"):
+            return self._update_message(bucket, (channel, args["ts"]), kwargs)
+        return self._send(api_method, bucket, kwargs)
+
+
+def get_slack_metrics():
+    """
+    Return {method: metrics}: calls made, calls that waited for their turn (and the
+    average wait), 429s from Slack, coalesced chat.updates, and calls rejected or failed.
+    """
+
+    with _metrics_lock:
+        snapshot = {method: dict(metrics) for method, metrics in _metrics.items()}
+
+    results = {}
+    for method, metrics in sorted(snapshot.items()):
+        queued = metrics.get("queued", 0)
+        results[method] = {
+            "calls": metrics.get("calls", 0),
+            "queued": queued,
+            "avg_wait_seconds": (
+                round(metrics.get("wait_seconds_total", 0) / queued, 3)
+                if queued
+                else 0.0
+            ),
+            "throttled": metrics.get("throttled", 0),
+            "coalesced": metrics.get("coalesced", 0),
+            "rejected": metrics.get("rejected", 0),
+            "errors": metrics.get("errors", 0),
+        }
+    return results
@@ -24,7 +24,7 @@ from constants import (
     SOCIAL_MEDIA_POSTS_CHANNEL_ID,
 )
 from util.security import get_creds
-from util.slackbots._slackbot import app
+from util.slackbots._slackbot import app, register_event_filter
 from util.slackbots.general import (
     _lookup_user_id_by_email,
     dm_channel_by_id,
@@ -37,6 +37,7 @@ from db.socials_poster import (
 )
 from util.helpers.ap_datetime import ap_datetime
 from util.social_posts import post_to_reddit, post_to_twitter
+from util.tasks import QueueFull, enqueue, enqueue_once, task
 
 logger = logging.getLogger(__name__)
 
@@ -233,6 +234,14 @@ def _handle_needs_visual(ack, body, logger):
     """
     ack()
     logger.info(body)
+    try:
+        enqueue(_post_needs_visual, body)
+    except QueueFull:
+        logger.error("[social_needs_visual] task queue full, dropping action")
+
+
+@task("slack")
+def _post_needs_visual(body):
     try:
         channel_id = (body.get("channel") or {}).get("id") or (
             body.get("container") or {}
@@ -300,6 +309,7 @@ VISUAL_ADDED_MODAL_CALLBACK = "social_visual_added_modal"
 def _handle_visual_added(ack, body, logger, client):
     """
     Handle "Visual added" button click: open modal to enter image URL. Not in use right now.
+    Runs in the listener, since the trigger_id for views.open expires in 3 seconds.
     """
     ack()
     logger.info(body)
@@ -360,6 +370,14 @@ def _handle_visual_added_modal_submit(ack, body, logger, view):
     Handle visual added modal submission: post image to original social thread. Not in use right now.
     """
     ack()
+    try:
+        enqueue(_post_visual_added, view)
+    except QueueFull:
+        logger.error("[social_visual_added_modal] task queue full, dropping submission")
+
+
+@task("slack")
+def _post_visual_added(view):
     try:
         meta = json.loads(view.get("private_metadata") or "{}")
         social_channel_id = meta.get("social_channel_id")
@@ -400,11 +418,75 @@ def _handle_visual_added_modal_submit(ack, body, logger, view):
 # --- Reaction added: if it's a platform emoji on our message, update DB and reply ---
 
 
+@task("socials")
+def _auto_post_story(
+    *, platform, story_url, story_name, channel_id, message_ts, time_str
+):
+    """
+    Post a story to Reddit or X after its reaction was added, then record it and
+    reply in the story's Slack thread. Runs as a background task so the Slack event
+    is acknowledged right away.
+    """
+    social_url = None
+    if platform == "Reddit":
+        try:
+            social_url, _ = post_to_reddit(title=story_name, url=story_url)
+        except Exception:
+            logger.exception(
+                f"Failed to automatically post story {story_url} to Reddit after reaction."
+            )
+    elif platform == "X":
+        try:
+            social_url, _ = post_to_twitter(title=story_name, url=story_url)
+        except Exception:
+            logger.exception(
+                f"Failed to automatically post story {story_url} to Twitter after reaction."
+            )
+
+    if social_url:
+        update_social(story_url, platform)
+
+        # Send Slack message in thread confirming the update
+        reply_to_slack_message(
+            channel_id=channel_id,
+            thread_ts=message_ts,
+            text=f"Automatically posted to {platform} at {time_str}.",
+            blocks=[
+                {
+                    "type": "section",
+                    "text": {
+                        "type": "mrkdwn",
+                        "text": f"Automatically posted to <{social_url}|{platform}> at {time_str}.",
+                    },
+                }
+            ],
+        )
+    else:
+        logger.error(
+            f"Failed to automatically post story {story_url} to {platform} after reaction."
+        )
+        reply_to_slack_message(
+            channel_id=channel_id,
+            thread_ts=message_ts,
+            text=f"Failed to automatically post to {platform} at {time_str}.",
+            blocks=None,
+        )
+
+
+register_event_filter(
+    "reaction_added",
+    lambda event: (event.get("item") or {}).get("type") == "message"
+    and (event.get("reaction") or "").strip().lower() in REACTION_TO_PLATFORM,
+)
+
+
 @app.event("reaction_added")
-def _on_reaction_added(event):
+def _on_reaction_added(event, body):
     """
     Handle reaction added event: when someone reacts with a platform emoji (e.g. :instagram:),
     mark that platform as posted in the database and reply with timestamp in thread.
+    Only the checks that need no lookups run here; the rest runs as a background task,
+    once per event even if Slack retries it.
     """
     logger.debug(f"Reaction added event: {event}")
     try:
@@ -427,6 +509,24 @@ def _on_reaction_added(event):
             )
             return
 
+        enqueue_once(
+            body.get("event_id") or f"reaction:{channel_id}:{message_ts}:{reaction}",
+            _process_reaction,
+            channel_id=channel_id,
+            message_ts=message_ts,
+            reaction=reaction,
+            platform=platform,
+        )
+    except QueueFull:
+        logger.error(f"Slack task queue full, dropping reaction '{reaction}'")
+    except Exception as e:
+        logger.error(f"Failed to handle reaction added event: {str(e)}")
+
+
+@task("slack")
+def _process_reaction(*, channel_id, message_ts, reaction, platform):
+    """Record a platform reaction on a story message, posting to Reddit/X if needed."""
+    try:
         story = get_story_by_slack_message(channel_id, message_ts)
         if not story:
             logger.debug(
@@ -449,47 +549,19 @@ def _on_reaction_added(event):
             logger.info(
                 f"Reaction '{reaction}' added to story {story_url}, automatically posting to {platform}"
             )
-
-            story_name = story.get("story_name")
-            social_url = None
-            if platform == "Reddit":
-                try:
-                    social_url, _ = post_to_reddit(title=story_name, url=story_url)
-                except Exception:
-                    logger.exception(
-                        f"Failed to automatically post story {story_url} to Reddit after reaction."
-                    )
-                    pass
-            elif platform == "X":
-                try:
-                    social_url, _ = post_to_twitter(title=story_name, url=story_url)
-                except Exception:
-                    logger.exception(
-                        f"Failed to automatically post story {story_url} to Twitter after reaction."
-                    )
-                    pass
-
-            if social_url:
-                update_social(story_url, platform)
-
-                # Send Slack message in thread confirming the update
-                reply_to_slack_message(
+            try:
+                enqueue(
+                    _auto_post_story,
+                    platform=platform,
+                    story_url=story_url,
+                    story_name=story.get("story_name"),
                     channel_id=channel_id,
-                    thread_ts=message_ts,
-                    text=f"Automatically posted to {platform} at {time_str}.",
-                    blocks=[
-                        {
-                            "type": "section",
-                            "text": {
-                                "type": "mrkdwn",
-                                "text": f"Automatically posted to <{social_url}|{platform}> at {time_str}.",
-                            },
-                        }
-                    ],
+                    message_ts=message_ts,
+                    time_str=time_str,
                 )
-            else:
+            except QueueFull:
                 logger.error(
-                    f"Failed to automatically post story {story_url} to {platform} after reaction."
+                    f"Socials task queue full, not posting story {story_url} to {platform}"
                 )
                 reply_to_slack_message(
                     channel_id=channel_id,
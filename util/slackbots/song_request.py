@@ -4,13 +4,27 @@ Provides Claim / Approve / Deny buttons directly in the #wpgu_song-requests chan
 """
 
 import json
-from threading import Thread
+import logging
 
 from constants import SLACK_BOT_TOKEN, WPGU_SONG_REQUESTS_ID
 from util.slackbots._slackbot import app
 from util.slackbots.general import dm_channel_by_id, dm_user_by_email
-from db.song_request import update_request_status, get_song_request_by_id
-from util.song_request import send_song_request_update_email
+from util.slackbots.user_directory import get_slack_user
+from db.song_request import (
+    claim_song_request_effect,
+    complete_song_request_effect,
+    get_pending_song_request_effects,
+    get_song_request_by_id,
+    update_request_status,
+    update_slack_ts,
+)
+from util.song_request import (
+    send_song_request_submission_email,
+    send_song_request_update_email,
+)
+from util.tasks import QueueFull, enqueue, task
+
+logger = logging.getLogger(__name__)
 
 
 def build_song_request_blocks(
@@ -153,17 +167,99 @@ def post_song_request_to_slack(
         return {"ok": False, "error": str(e)}
 
 
+# ---------------------------------------------------------------------------
+# Outbox delivery for new requests
+# ---------------------------------------------------------------------------
+
+
+def _check_ok(res, action):
+    if not res.get("ok"):
+        raise RuntimeError(f"{action} failed: {res.get('error')}")
+
+
+def _deliver_slack_post(song_request):
+    # Posting twice would duplicate the channel message, so a saved ts means done
+    if song_request.slack_ts:
+        return
+    res = post_song_request_to_slack(
+        song_name=song_request.song_name,
+        artist_name=song_request.artist_name,
+        submitter_slack_id=song_request.submitter_slack_id,
+        submitter_email=song_request.submitter_email,
+        request_id=song_request.key.id(),
+    )
+    _check_ok(res, "Slack post")
+    update_slack_ts(song_request.key.id(), res["ts"])
+
+
+def _deliver_submission_email(song_request):
+    res = send_song_request_submission_email(
+        to_email=song_request.submitter_email,
+        song_name=song_request.song_name,
+        artist_name=song_request.artist_name,
+    )
+    _check_ok(res, "Submission email")
+
+
+def _deliver_submission_dm(song_request):
+    text = f'✅ Your song request "*{song_request.song_name}*" by "*{song_request.artist_name}*" has been submitted!'
+    if song_request.submitter_slack_id:
+        res = dm_channel_by_id(channel_id=song_request.submitter_slack_id, text=text)
+    else:
+        res = dm_user_by_email(email=song_request.submitter_email, text=text)
+    _check_ok(res, "Submission DM")
+
+
+# Outbox record kind: delivery function, in the order they are delivered
+SONG_REQUEST_EFFECTS = {
+    "slack_post": _deliver_slack_post,
+    "submission_email": _deliver_submission_email,
+    "submission_dm": _deliver_submission_dm,
+}
+
+
+@task("slack")
+def deliver_song_request_effects(request_id):
+    """
+    Deliver a new song request's pending side effects (see create_song_request).
+    Each is claimed before it is sent and marked done after, so the form handler,
+    retries and the outbox cron can all call this without sending anything twice.
+    Raises if any effect failed so the task is retried.
+    """
+    pending = get_pending_song_request_effects(request_id)
+    if not pending:
+        return
+    song_request = get_song_request_by_id(request_id)
+    if song_request is None:
+        return
+
+    failed = []
+    for kind, deliver in SONG_REQUEST_EFFECTS.items():
+        if kind not in pending or not claim_song_request_effect(request_id, kind):
+            continue
+        try:
+            deliver(song_request)
+        except Exception as e:
+            logger.exception(f"[song_request] {kind} failed for request {request_id}")
+            complete_song_request_effect(request_id, kind, error=str(e))
+            failed.append(kind)
+        else:
+            complete_song_request_effect(request_id, kind)
+
+    if failed:
+        raise RuntimeError(
+            f"Song request {request_id} side effects failed: {', '.join(failed)}"
+        )
+
+
 # ---------------------------------------------------------------------------
 # Helper: resolve reviewer name from Slack user_id
 # ---------------------------------------------------------------------------
 
 
 def _get_reviewer_name(user_id: str) -> str:
-    try:
-        info = app.client.users_info(token=SLACK_BOT_TOKEN, user=user_id)
-        return info.get("user", {}).get("real_name") or f"<@{user_id}>"
-    except Exception:
-        return f"<@{user_id}>"
+    user = get_slack_user(user_id)
+    return (user and user.get("real_name")) or f"<@{user_id}>"
 
 
 def update_song_request_message(
@@ -233,10 +329,14 @@ def delete_song_request_message(
 @app.action("song_request_claim")
 def handle_song_request_claim(ack, body, logger):
     ack()
-    Thread(target=_do_claim, args=(body, logger)).start()
+    try:
+        enqueue(_do_claim, body)
+    except QueueFull:
+        logger.error("[song_request_claim] task queue full, dropping action")
 
 
-def _do_claim(body, logger):
+@task("slack")
+def _do_claim(body):
     try:
         user_id = (body.get("user") or {}).get("id")
         channel_id = (body.get("container") or {}).get("channel_id")
@@ -277,10 +377,14 @@ def _do_claim(body, logger):
 @app.action("song_request_approve")
 def handle_song_request_approve(ack, body, logger):
     ack()
-    Thread(target=_do_approve, args=(body, logger)).start()
+    try:
+        enqueue(_do_approve, body)
+    except QueueFull:
+        logger.error("[song_request_approve] task queue full, dropping action")
 
 
-def _do_approve(body, logger):
+@task("slack")
+def _do_approve(body):
     try:
         user_id = (body.get("user") or {}).get("id")
         channel_id = (body.get("container") or {}).get("channel_id")
@@ -329,7 +433,7 @@ def _do_approve(body, logger):
 def handle_song_request_deny(ack, body, logger):
     """Opens a modal to collect an optional denial reason."""
     ack()
-    # Modal open is fast — no thread needed, must happen before trigger_id expires
+    # Modal open is fast — no background task needed, must happen before trigger_id expires
     try:
         trigger_id = body.get("trigger_id")
         act = (body.get("actions") or [{}])[0]
@@ -379,10 +483,14 @@ def handle_song_request_deny(ack, body, logger):
 @app.view("song_request_deny_modal")
 def handle_deny_modal_submission(ack, body, logger):
     ack()
-    Thread(target=_do_deny, args=(body, logger)).start()
+    try:
+        enqueue(_do_deny, body)
+    except QueueFull:
+        logger.error("[song_request_deny] task queue full, dropping submission")
 
 
-def _do_deny(body, logger):
+@task("slack")
+def _do_deny(body):
     try:
         user_id = (body.get("user") or {}).get("id")
         meta = json.loads(body["view"].get("private_metadata", "{}"))
@@ -0,0 +1,229 @@
+"""
+Slack user directory: email <-> Slack ID <-> profile.
+
+Every user lookup goes through here instead of calling users.lookupByEmail/users.info,
+which are rate limited per workspace. Lookups check a small in-process LRU cache, then
+the SlackUser entities in Datastore, and only ask Slack for users that are missing or
+haven't been refreshed in SLACK_USER_STALE_AFTER. warm_slack_user_directory() loads
+the whole workspace with users.list (a few calls) and runs daily from cron.
+
+Records are dicts with id, email, real_name, display_name, profile, deleted and is_bot.
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from constants import SLACK_BOT_TOKEN
+from db.expiry import utc_now
+from db.slack_user import (
+    get_slack_user as get_stored_slack_user,
+    get_slack_user_by_email as get_stored_slack_user_by_email,
+    get_slack_users_by_email as get_stored_slack_users_by_email,
+    put_slack_users,
+)
+from util.slackbots._slackbot import app
+
+logger = logging.getLogger(__name__)
+
+# Stored entries older than this are refreshed from Slack on lookup
+SLACK_USER_STALE_AFTER = 24 * 60 * 60
+# Entries kept in the in-process cache, and seconds before rechecking Datastore
+SLACK_USER_CACHE_SIZE = 2000
+SLACK_USER_CACHE_TTL = 15 * 60
+# Users per users.list page (Slack recommends at most 200)
+SLACK_USER_PAGE_SIZE = 200
+
+# "id:<user id>" / "email:<email>" -> (time.monotonic() it expires, record or None)
+_cache = OrderedDict()
+_cache_lock = Lock()
+
+
+def _cache_get(key):
+    """Return (hit, record); a hit with None means Slack has no such user."""
+
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return False, None
+        if entry[0] <= time.monotonic():
+            del _cache[key]
+            return False, None
+        _cache.move_to_end(key)
+        return True, entry[1]
+
+
+def _cache_put(key, record):
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + SLACK_USER_CACHE_TTL, record)
+        _cache.move_to_end(key)
+        while len(_cache) > SLACK_USER_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def _remember(record):
+    _cache_put(f"id:{record['id']}", record)
+    if record.get("email"):
+        _cache_put(f"email:{record['email'].lower()}", record)
+
+
+def _is_fresh(record):
+    fetched_at = record.get("fetched_at")
+    return (
+        fetched_at is not None
+        and (utc_now() - fetched_at).total_seconds() < SLACK_USER_STALE_AFTER
+    )
+
+
+def _record_from_slack(user):
+    profile = user.get("profile") or {}
+    return {
+        "id": user["id"],
+        "email": (profile.get("email") or "").lower() or None,
+        "real_name": user.get("real_name") or profile.get("real_name"),
+        "display_name": profile.get("display_name"),
+        "profile": profile,
+        "deleted": bool(user.get("deleted")),
+        "is_bot": bool(user.get("is_bot")),
+    }
+
+
+def _save(record):
+    try:
+        put_slack_users([record])
+    except Exception:
+        logger.exception(f"Failed to store Slack user {record['id']}")
+    record["fetched_at"] = utc_now()
+    _remember(record)
+    return record
+
+
+def get_slack_user(user_id: str) -> Optional[dict]:
+    """Return the directory record for a Slack user ID, or None if it can't be found."""
+
+    if not user_id:
+        return None
+    hit, record = _cache_get(f"id:{user_id}")
+    if hit:
+        return record
+
+    stored = get_stored_slack_user(user_id)
+    if stored and _is_fresh(stored):
+        _remember(stored)
+        return stored
+
+    try:
+        res = app.client.users_info(token=SLACK_BOT_TOKEN, user=user_id)
+        return _save(_record_from_slack(res["user"]))
+    except Exception as e:
+        if "user_not_found" in str(e):
+            _cache_put(f"id:{user_id}", None)
+            return None
+        logger.error(f"users_info failed for {user_id}: {e}")
+        # An out-of-date record beats none while Slack is unavailable
+        return stored
+
+
+def get_slack_user_by_email(email: str) -> Optional[dict]:
+    """Return the directory record for an email address, or None if it can't be found."""
+
+    if not email:
+        return None
+    email = email.strip().lower()
+    hit, record = _cache_get(f"email:{email}")
+    if hit:
+        return record
+
+    stored = get_stored_slack_user_by_email(email)
+    if stored and _is_fresh(stored):
+        _remember(stored)
+        return stored
+
+    try:
+        res = app.client.users_lookupByEmail(token=SLACK_BOT_TOKEN, email=email)
+        return _save(_record_from_slack(res["user"]))
+    except Exception as e:
+        error_msg = str(e)
+        if "users_not_found" in error_msg:
+            logger.warning(f"Lookup failed: No Slack account found for {email}")
+            # Remember the miss too, so repeated lookups don't each ask Slack
+            _cache_put(f"email:{email}", None)
+            return None
+        if "ratelimited" in error_msg:
+            logger.critical(f"SLACK RATE LIMIT HIT: {error_msg}")
+        else:
+            logger.error(f"users_lookupByEmail failed for {email}: {error_msg}")
+        return stored
+
+
+def get_slack_ids_by_email(emails, lookup_missing=True) -> dict:
+    """
+    Return {email: Slack user ID or None} for several emails, with one Datastore query
+    per 30 emails not already cached. Only emails unknown there are looked up in Slack,
+    one call each; with lookup_missing=False they are left out of the result instead.
+    """
+
+    results = {}
+    missing = set()
+    for email in {email for email in emails if email}:
+        hit, record = _cache_get(f"email:{email.strip().lower()}")
+        if hit:
+            results[email] = record["id"] if record else None
+        else:
+            missing.add(email)
+    if not missing:
+        return results
+
+    try:
+        stored = get_stored_slack_users_by_email(missing)
+    except Exception:
+        logger.exception("Bulk Slack user lookup failed")
+        stored = {}
+    for email in missing:
+        record = stored.get(email.strip().lower())
+        if record and _is_fresh(record):
+            _remember(record)
+            results[email] = record["id"]
+        elif lookup_missing:
+            results[email] = get_slack_id_by_email(email)
+    return results
+
+
+def get_slack_id_by_email(email: str) -> Optional[str]:
+    """Return the Slack user ID for an email address, or None."""
+
+    record = get_slack_user_by_email(email)
+    return record["id"] if record else None
+
+
+def get_slack_email(user_id: str) -> Optional[str]:
+    """Return the email address of a Slack user ID, or None (e.g. hidden or a bot)."""
+
+    record = get_slack_user(user_id)
+    return record.get("email") if record else None
+
+
+def warm_slack_user_directory() -> int:
+    """
+    Load every user in the workspace with users.list into Datastore and this process's
+    cache. Returns how many users were stored.
+    """
+
+    stored = 0
+    cursor = None
+    while True:
+        res = app.client.users_list(
+            token=SLACK_BOT_TOKEN, limit=SLACK_USER_PAGE_SIZE, cursor=cursor
+        )
+        records = [_record_from_slack(user) for user in res.get("members", [])]
+        stored += put_slack_users(records)
+        now = utc_now()
+        for record in records:
+            record["fetched_at"] = now
+            _remember(record)
+
+        cursor = (res.get("response_metadata") or {}).get("next_cursor")
+        if not cursor:
+            return stored
@@ -11,6 +11,13 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+WP_POSTS_API_URL = "https://dailyillini.com/wp-json/wp/v2/posts"
+# Seconds to wait for the WordPress REST API
+WP_TIMEOUT = 10
+
+# Shared so repeated WordPress checks reuse connections
+_wp_session = requests.Session()
+
 
 def get_title_from_url(url):
     try:
@@ -34,14 +41,18 @@ def get_title_from_url(url):
         return None
 
 
-def get_published_url(editor_url):
+def _wp_post_api_url(editor_url):
     post_id_match = re.search(r"post=(\d+)", editor_url)
     if not post_id_match:
         return None
+    return f"{WP_POSTS_API_URL}/{post_id_match.group(1)}"
 
-    post_id = post_id_match.group(1)
-    api_url = f"https://dailyillini.com/wp-json/wp/v2/posts/{post_id}"
-    response = requests.get(api_url)
+
+def get_published_url(editor_url):
+    api_url = _wp_post_api_url(editor_url)
+    if api_url is None:
+        return None
+    response = _wp_session.get(api_url, timeout=WP_TIMEOUT)
 
     data = response.json()
     if "link" in data:
@@ -50,6 +61,45 @@ def get_published_url(editor_url):
         return None
 
 
+def check_published(editor_url, etag=None, last_modified=None):
+    """
+    Ask WordPress whether the post behind an editor URL is published, sending the
+    validators from the previous check so an unchanged post costs a 304.
+
+    Returns a dict with "status" ("published", "unpublished", "not_modified" or
+    "invalid" for URLs without a post ID), "link" (the published URL, when published)
+    and the response's "etag"/"last_modified". Raises on network errors.
+    """
+    api_url = _wp_post_api_url(editor_url)
+    if api_url is None:
+        return {"status": "invalid", "link": None, "etag": None, "last_modified": None}
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = _wp_session.get(api_url, headers=headers, timeout=WP_TIMEOUT)
+    if response.status_code >= 500:
+        response.raise_for_status()
+    result = {
+        "status": "unpublished",
+        "link": None,
+        "etag": response.headers.get("ETag") or etag,
+        "last_modified": response.headers.get("Last-Modified") or last_modified,
+    }
+    if response.status_code == 304:
+        result["status"] = "not_modified"
+        return result
+
+    # Drafts and scheduled posts aren't visible to anonymous requests (401/404)
+    if response.ok:
+        data = response.json()
+        if data.get("status", "publish") == "publish" and data.get("link"):
+            result.update(status="published", link=data["link"])
+    return result
+
+
 def get_story_details_from_url(url):
     try:
         response = requests.get(url + "feed/?withoutcomments=1")
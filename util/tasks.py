@@ -0,0 +1,357 @@
+"""
+Shared background task executor.
+
+Slow work that shouldn't hold up a web request or a Slack ack (group syncs, /ask
+answers, social posts) is registered with @task and started with enqueue(). Each named
+queue has its own worker threads and a cap on waiting tasks, retries failed tasks with
+exponential backoff, and keeps metrics for queue depth and task latency.
+
+TASKS_MODE picks where tasks run:
+    "thread"       in this process (default)
+    "local-push"   POSTed to this app's /tasks/<queue> handler, a local stand-in for
+                   Cloud Tasks that exercises the same HTTP path
+    "cloud-tasks"  pushed to the Cloud Tasks queue of the same name (see queue.yaml),
+                   which calls /tasks/<queue> on any instance and handles retries
+
+Task arguments are sent as JSON in every mode, so they must be JSON-serializable.
+
+enqueue_once() skips a task whose key was already enqueued recently, for work started
+by deliveries that may repeat, like Slack retrying an event it didn't see acked in time.
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock, Timer
+
+import requests
+
+from constants import (
+    BASE_URL,
+    CLOUD_TASKS_LOCATION,
+    GOOGLE_PROJECT_ID,
+    TASKS_MODE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Keep in sync with queue.yaml. Queue name: worker threads, waiting tasks allowed,
+# attempts per task, and seconds before the first retry (doubled on each retry)
+TASK_QUEUES = {
+    "default": {"workers": 4, "max_pending": 100, "max_attempts": 3, "retry_delay": 2},
+    "groups": {"workers": 2, "max_pending": 50, "max_attempts": 3, "retry_delay": 5},
+    # Answers go straight back to the user, so failures aren't retried
+    "ask": {"workers": 4, "max_pending": 20, "max_attempts": 1, "retry_delay": 0},
+    "slack": {"workers": 4, "max_pending": 100, "max_attempts": 3, "retry_delay": 1},
+    # Posting to Reddit/X isn't idempotent, so failures aren't retried
+    "socials": {"workers": 1, "max_pending": 20, "max_attempts": 1, "retry_delay": 0},
+}
+
+# Seconds to wait on Cloud Tasks (or the local stand-in) to accept/run a task
+TASK_PUSH_TIMEOUT = 600
+# Seconds enqueue_once() remembers a key on this instance (Cloud Tasks keeps task
+# names for about an hour)
+TASK_DEDUPE_TTL = 600
+
+CLOUD_TASKS_API = "https://cloudtasks.googleapis.com/v2"
+
+_tasks = {}
+_queues = {}
+_queues_lock = Lock()
+_metrics = {name: Counter() for name in TASK_QUEUES}
+_metrics_lock = Lock()
+_cloud_tasks_session = None
+# enqueue_once() key -> time.monotonic() it can be enqueued again
+_recent_keys = {}
+_recent_keys_lock = Lock()
+
+
+class QueueFull(Exception):
+    """Raised by enqueue() when a queue has no room for another task."""
+
+
+def task(queue="default"):
+    """
+    Register a module-level function as a background task on a named queue.
+    Tasks are looked up by module and name when they run, so they must not be nested.
+    """
+
+    if queue not in TASK_QUEUES:
+        raise ValueError(f"Unknown task queue: {queue}")
+
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+        _tasks[name] = (func, queue)
+        func.task_name = name
+        return func
+
+    return decorator
+
+
+def _record(queue, **values):
+    with _metrics_lock:
+        metrics = _metrics[queue]
+        for name, value in values.items():
+            if name == "run_seconds_max":
+                metrics[name] = max(metrics[name], value)
+            else:
+                metrics[name] += value
+
+
+def enqueue(func, *args, **kwargs):
+    """
+    Run a @task function in the background with the given arguments.
+    Raises QueueFull if its queue is backed up, so callers can tell the user or drop it.
+    """
+
+    _enqueue(func, args, kwargs)
+
+
+def enqueue_once(key, func, *args, **kwargs):
+    """
+    Like enqueue(), but only the first call with a given key (e.g. a Slack event_id)
+    within TASK_DEDUPE_TTL starts the task. Returns whether it was enqueued.
+    """
+
+    now = time.monotonic()
+    with _recent_keys_lock:
+        seen = _recent_keys.get(key, 0) > now
+        if not seen:
+            if len(_recent_keys) > 10000:
+                for old_key in [k for k, exp in _recent_keys.items() if exp <= now]:
+                    del _recent_keys[old_key]
+            _recent_keys[key] = now + TASK_DEDUPE_TTL
+
+    enqueued = False
+    if not seen:
+        try:
+            enqueued = _enqueue(func, args, kwargs, dedupe_key=key)
+        except Exception:
+            # Let a later delivery try again
+            with _recent_keys_lock:
+                _recent_keys.pop(key, None)
+            raise
+    if not enqueued:
+        _record(_tasks[func.task_name][1], deduplicated=1)
+    return enqueued
+
+
+def _enqueue(func, args, kwargs, dedupe_key=None):
+    name = getattr(func, "task_name", None)
+    if name not in _tasks:
+        raise ValueError(f"{func!r} is not registered with @task")
+    queue = _tasks[name][1]
+    payload = json.dumps({"task": name, "args": args, "kwargs": kwargs})
+
+    if TASKS_MODE == "cloud-tasks":
+        # Named tasks are deduplicated by Cloud Tasks across instances
+        task_id = (
+            hashlib.sha256(dedupe_key.encode()).hexdigest() if dedupe_key else None
+        )
+        if not _push_to_cloud_tasks(queue, payload, task_id):
+            return False
+        _record(queue, enqueued=1)
+    else:
+        _get_queue(queue).submit(payload)
+    return True
+
+
+def _execute(payload):
+    data = json.loads(payload)
+    func, queue = _tasks[data["task"]]
+    start_time = time.perf_counter()
+    try:
+        func(*data.get("args", []), **data.get("kwargs", {}))
+    finally:
+        run_seconds = time.perf_counter() - start_time
+        _record(
+            queue, ran=1, run_seconds_total=run_seconds, run_seconds_max=run_seconds
+        )
+
+
+def run_pushed_task(queue, payload):
+    """
+    Run a task delivered to /tasks/<queue> by Cloud Tasks or the local stand-in.
+    Returns False if the task isn't known here; exceptions from the task propagate so
+    the caller can report a failure and have it retried.
+    """
+
+    try:
+        name = json.loads(payload)["task"]
+    except (ValueError, KeyError, TypeError):
+        logger.error(f"Malformed task payload on queue {queue}")
+        return False
+    if name not in _tasks or _tasks[name][1] != queue:
+        logger.error(f"Unknown task {name} on queue {queue}")
+        return False
+
+    if TASKS_MODE == "local-push":
+        # The in-process queue that pushed it counts the outcome and retries
+        _execute(payload)
+        return True
+
+    try:
+        _execute(payload)
+    except Exception:
+        _record(queue, failed=1)
+        raise
+    _record(queue, succeeded=1)
+    return True
+
+
+class _LocalQueue:
+    """Worker threads for one queue, with a bounded number of waiting tasks."""
+
+    def __init__(self, name, workers, max_pending, max_attempts, retry_delay):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix=f"task-{name}"
+        )
+        # One slot per task that is running, waiting or waiting to retry
+        self._slots = BoundedSemaphore(workers + max_pending)
+
+    def submit(self, payload):
+        if not self._slots.acquire(blocking=False):
+            _record(self.name, rejected=1)
+            raise QueueFull(self.name)
+        _record(self.name, enqueued=1, depth=1)
+        self._executor.submit(self._run, payload, 1, time.monotonic())
+
+    def _run(self, payload, attempt, queued_at):
+        _record(
+            self.name,
+            started=1,
+            running=1,
+            wait_seconds_total=time.monotonic() - queued_at,
+        )
+        try:
+            if TASKS_MODE == "local-push":
+                _push_to_self(self.name, payload)
+            else:
+                _execute(payload)
+        except Exception:
+            if attempt < self.max_attempts:
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logger.warning(
+                    f"Task on queue {self.name} failed (attempt {attempt}), "
+                    f"retrying in {delay}s",
+                    exc_info=True,
+                )
+                _record(self.name, running=-1, retried=1)
+                timer = Timer(
+                    delay,
+                    self._executor.submit,
+                    args=(self._run, payload, attempt + 1, time.monotonic() + delay),
+                )
+                timer.daemon = True
+                timer.start()
+                return
+            logger.exception(f"Task on queue {self.name} failed after {attempt} tries")
+            _record(self.name, running=-1, depth=-1, failed=1)
+        else:
+            _record(self.name, running=-1, depth=-1, succeeded=1)
+        self._slots.release()
+
+
+def _get_queue(name):
+    with _queues_lock:
+        if name not in _queues:
+            _queues[name] = _LocalQueue(name, **TASK_QUEUES[name])
+        return _queues[name]
+
+
+def _push_to_self(queue, payload):
+    response = requests.post(
+        f"{BASE_URL}/tasks/{queue}",
+        data=payload,
+        headers={
+            "Content-Type": "application/json",
+            "X-AppEngine-QueueName": queue,
+        },
+        timeout=TASK_PUSH_TIMEOUT,
+    )
+    response.raise_for_status()
+
+
+def _push_to_cloud_tasks(queue, payload, task_id=None):
+    """Create a Cloud Task; returns False if a task named task_id already exists."""
+
+    global _cloud_tasks_session
+
+    if _cloud_tasks_session is None:
+        import google.auth
+        from google.auth.transport.requests import AuthorizedSession
+
+        credentials, _ = google.auth.default(
+            scopes=["https://www.googleapis.com/auth/cloud-platform"]
+        )
+        _cloud_tasks_session = AuthorizedSession(credentials)
+
+    queue_path = (
+        f"projects/{GOOGLE_PROJECT_ID}/locations/{CLOUD_TASKS_LOCATION}/queues/{queue}"
+    )
+    cloud_task = {
+        "appEngineHttpRequest": {
+            "httpMethod": "POST",
+            "relativeUri": f"/tasks/{queue}",
+            "headers": {"Content-Type": "application/json"},
+            "body": base64.b64encode(payload.encode()).decode(),
+        }
+    }
+    if task_id is not None:
+        cloud_task["name"] = f"{queue_path}/tasks/{task_id}"
+
+    response = _cloud_tasks_session.post(
+        f"{CLOUD_TASKS_API}/{queue_path}/tasks",
+        json={"task": cloud_task},
+        timeout=TASK_PUSH_TIMEOUT,
+    )
+    if response.status_code == 409:
+        return False
+    if response.status_code == 429:
+        _record(queue, rejected=1)
+        raise QueueFull(queue)
+    response.raise_for_status()
+    return True
+
+
+def get_task_metrics():
+    """
+    Return {queue: metrics} with task counts, current depth (waiting + running) and
+    average wait/run times in seconds. Depth is only tracked for in-process queues.
+    """
+
+    with _metrics_lock:
+        snapshot = {name: dict(metrics) for name, metrics in _metrics.items()}
+
+    results = {}
+    for name, metrics in snapshot.items():
+        finished = metrics.get("succeeded", 0) + metrics.get("failed", 0)
+        started = metrics.get("started", 0)
+        ran = metrics.get("ran", 0)
+        results[name] = {
+            "enqueued": metrics.get("enqueued", 0),
+            "rejected": metrics.get("rejected", 0),
+            "succeeded": metrics.get("succeeded", 0),
+            "failed": metrics.get("failed", 0),
+            "retried": metrics.get("retried", 0),
+            "deduplicated": metrics.get("deduplicated", 0),
+            "depth": metrics.get("depth", 0),
+            "running": metrics.get("running", 0),
+            "avg_wait_seconds": (
+                round(metrics.get("wait_seconds_total", 0) / started, 3)
+                if started
+                else 0.0
+            ),
+            "avg_run_seconds": (
+                round(metrics.get("run_seconds_total", 0) / ran, 3) if ran else 0.0
+            ),
+            "max_run_seconds": round(metrics.get("run_seconds_max", 0), 3),
+        }
+    return results
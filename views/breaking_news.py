@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request
+from flask import Blueprint, jsonify, render_template, request
 from flask_login import current_user, login_required
 from util.security import restrict_to
 from util.slackbots.copy_editing import notify_copy_editor
@@ -6,33 +6,19 @@ from util.slackbots.copy_editing import notify_copy_editor
 from db.story import Story, add_story, get_recent_stories
 
 from flask_login import login_required
-from db.story import add_story, get_recent_stories
+from db.story import (
+    add_story,
+    get_recent_stories,
+    get_story_by_slack_message,
+    rekey_stories,
+)
 from db.social_post import SocialPlatform
-from util.stories import get_published_url
+from util.breaking_news_watcher import POSTED_SUCCESSFULLY, request_publish_check
 from util.slackbots._slackbot import app
 from constants import SLACK_BOT_TOKEN
 from util.security import csrf
 
 DI_COPYING_ID = "C50E93LJG"
-POSTED_SUCCESSFULLY = [
-    {"type": "divider"},
-    {
-        "type": "header",
-        "text": {
-            "type": "plain_text",
-            "text": ":white_check_mark:*BREAKING NEWS HAS BEEN PUBLISHED*:white_check_mark:",
-            "emoji": True,
-        },
-    },
-    {
-        "type": "section",
-        "text": {
-            "type": "mrkdwn",
-            "text": ":white_check_mark: Story has been published :white_check_mark:",
-        },
-    },
-    {"type": "divider"},
-]
 
 breaking_routes = Blueprint("breaking_routes", __name__, url_prefix="/breaking")
 
@@ -105,6 +91,7 @@ def submit_story():
         post_to_twitter=post_to_twitter,
         slack_message_id=slack_message_id,
         created_by=created_by,
+        slack_channel_id=DI_COPYING_ID,
     )
 
     return "success", 200
@@ -116,10 +103,13 @@ def breaking_button(ack, logger, body):
     ack()
     logger.info(body)
     ts = body["message"]["ts"]
-    url = story_url_from_ts(10, ts)
+    # WordPress is checked by the publish watcher; the button shows what it found
+    story = get_story_by_slack_message(DI_COPYING_ID, ts)
+    url = story["url"] if story else None
     if url == None:
-        print("story is no longer recent")
-    elif get_published_url(url) == None:
+        print("no story found for this message")
+    elif story.get("published_url") == None:
+        request_publish_check(story["id"], DI_COPYING_ID)
         app.client.chat_update(
             token=SLACK_BOT_TOKEN,
             channel=DI_COPYING_ID,
@@ -160,7 +150,7 @@ def breaking_button(ack, logger, body):
             ],
             text="STORY HAS NOT BEEN POSTED",
         )
-    elif get_published_url(url) != None:
+    else:
         app.client.chat_update(
             token=SLACK_BOT_TOKEN,
             channel=DI_COPYING_ID,
@@ -170,9 +160,10 @@ def breaking_button(ack, logger, body):
         )
 
 
-def story_url_from_ts(count, ts):
-    stories = get_recent_stories(count)
-    for i in stories:
-        if i["slack_message_id"] == ts:
-            return i["url"]
-    return None
+# Key stories saved before they were keyed by URL, and index their Slack messages
+@breaking_routes.route("/api/backfill", methods=["POST"])
+@login_required
+@restrict_to(["imc-staff-webdev"])
+def api_backfill():
+    updated = rekey_stories(DI_COPYING_ID)
+    return jsonify({"message": "backfilled", "updated": updated}), 200
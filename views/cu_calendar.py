@@ -9,6 +9,7 @@ from datetime import datetime, time, timezone
 from flask import Blueprint, jsonify, request, render_template
 from flask_cors import cross_origin
 from flask_login import login_required
+from google.api_core.exceptions import BadRequest
 from constants import (
     BASE_URL,
     CU_CALENDAR_ID,
@@ -21,9 +22,10 @@ from db.cu_calender import (
     accept_event,
     add_calendar_source,
     add_event,
+    backfill_event_geohashes,
     center_val,
     get_event_by_id,
-    get_future_public_events,
+    get_future_public_events_in_cell,
     get_pending_events,
     highlight_event as db_highlight_event,
     remove_event as db_remove_event,
@@ -31,8 +33,11 @@ from db.cu_calender import (
     get_all_calendar_sources,
     get_public_event_categories,
     normalize_public_event_category,
+    query_public_events,
 )
 from util.cu_calendar import geocode_address, gcal_to_events, upload_images_to_gcs
+from util.helpers.geohash import covering_cell
+from util.map_clusters import CALENDAR_SOURCE, get_clusters, parse_bbox
 from util.security import csrf, restrict_to
 
 from util.slackbots.general import dm_channel_by_id
@@ -45,6 +50,10 @@ public_calendar_api_routes = Blueprint(
     "public_calendar_api_routes", __name__, url_prefix="/api/events"
 )
 
+# Largest page a client can request from the public event feeds
+MAX_PUBLIC_EVENTS_PAGE_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
 
 def _safe_public_event_category(event_type):
     """
@@ -125,6 +134,70 @@ def _parse_submission_datetime(raw_value, is_end=False):
         ) from exc
 
 
+def _parse_public_event_filters():
+    """
+    Read optional feed filters from the query string:
+    north/south/east/west (all four), start/end dates, category, highlight, limit, cursor.
+    Raises ValueError on invalid input.
+    """
+
+    filters = {}
+
+    bbox = parse_bbox(request.args)
+    if bbox is not None:
+        filters["bbox"] = bbox
+        filters["geohash_cell"] = covering_cell(*bbox)
+
+    filters["window_start"] = _parse_submission_datetime(request.args.get("start"))
+    filters["window_end"] = _parse_submission_datetime(
+        request.args.get("end"), is_end=True
+    )
+    if (
+        filters["window_start"]
+        and filters["window_end"]
+        and filters["window_end"] < filters["window_start"]
+    ):
+        raise ValueError("end must be after start.")
+
+    if request.args.get("category"):
+        filters["category"] = normalize_public_event_category(
+            request.args.get("category")
+        )
+    filters["highlight_only"] = request.args.get("highlight", "").lower() in (
+        "1",
+        "true",
+    )
+
+    if request.args.get("limit") or request.args.get("cursor"):
+        try:
+            limit = int(request.args.get("limit") or MAX_PUBLIC_EVENTS_PAGE_SIZE)
+        except ValueError as exc:
+            raise ValueError("limit must be an integer.") from exc
+        filters["limit"] = max(1, min(limit, MAX_PUBLIC_EVENTS_PAGE_SIZE))
+        filters["cursor"] = request.args.get("cursor")
+
+    return filters
+
+
+def _public_events_response(serializer):
+    """
+    Filtered public events as a JSON list. When paging, the cursor for the next page
+    is sent in the X-Next-Cursor header (absent on the last page).
+    """
+
+    try:
+        filters = _parse_public_event_filters()
+        events, next_cursor = query_public_events(**filters)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    except BadRequest:
+        # Datastore rejects cursors that decode but were not issued for this query
+        return jsonify({"error": "Invalid cursor."}), 400
+
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    return jsonify([serializer(event) for event in events]), 200, headers
+
+
 def _get_uploaded_files():
     """Collect image uploads from the request."""
 
@@ -205,15 +278,12 @@ def _create_pending_submission():
 
 # public routes
 @calendar_routes.route("/events", methods=["GET"])
-@cross_origin()
+@cross_origin(expose_headers=[NEXT_CURSOR_HEADER])
 @csrf.exempt
 def list_public_events():
-    """GET future accepted events (legacy JSON)."""
+    """GET future accepted events (legacy JSON), with the same filters as /api/events."""
 
-    events = [
-        _serialize_legacy_public_event(event) for event in get_future_public_events()
-    ]
-    return jsonify(events), 200
+    return _public_events_response(_serialize_legacy_public_event)
 
 
 @calendar_routes.route("/center", methods=["GET"])
@@ -237,13 +307,45 @@ def submit_calendar_item():
 
 
 @public_calendar_api_routes.route("", methods=["GET"])
-@cross_origin()
+@cross_origin(expose_headers=[NEXT_CURSOR_HEADER])
 @csrf.exempt
 def list_public_events_api():
-    """GET /api/events — future accepted events."""
+    """
+    GET /api/events — future accepted events.
+    Optional filters: north/south/east/west, start/end, category, highlight, limit/cursor.
+    """
 
-    events = [_serialize_public_event(event) for event in get_future_public_events()]
-    return jsonify(events), 200
+    return _public_events_response(_serialize_public_event)
+
+
+@public_calendar_api_routes.route("/clusters", methods=["GET"])
+@cross_origin()
+@csrf.exempt
+def list_public_event_clusters():
+    """
+    GET marker clusters for a map view.
+    Requires north/south/east/west and zoom; each cluster has count, centroid
+    (lat/long) and a per-category histogram.
+    """
+
+    try:
+        bbox = parse_bbox(request.args)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    if bbox is None:
+        return jsonify({"error": "north, south, east and west are required."}), 400
+    zoom = request.args.get("zoom", type=int)
+    if zoom is None:
+        return jsonify({"error": "zoom must be an integer."}), 400
+
+    clusters = get_clusters(
+        CALENDAR_SOURCE,
+        get_future_public_events_in_cell,
+        bbox,
+        zoom,
+        category_field="event_type",
+    )
+    return jsonify(clusters), 200
 
 
 @public_calendar_api_routes.route("/submissions", methods=["POST"])
@@ -333,6 +435,16 @@ def add_and_process_source():
     return jsonify({"success": True, "message": message}), 200
 
 
+@admin_calendar_routes.route("/backfill-geohash", methods=["POST"])
+@login_required
+@restrict_to(["imc-staff-webdev"])
+def backfill_geohash():
+    """POST re-save events so they appear in bounding-box queries."""
+
+    updated = backfill_event_geohashes()
+    return jsonify({"success": True, "updated": updated}), 200
+
+
 @admin_calendar_routes.route("/<uid>/highlight", methods=["POST"])
 @login_required
 @restrict_to(["cu-calendar-admin", "imc-staff-webdev"])
@@ -8,10 +8,10 @@ Last modified by Aryaa Rathi on Feb 19, 2026
 """
 
 from datetime import datetime
-from flask import Blueprint, render_template, request
+from flask import Blueprint, jsonify, render_template, request
 from flask_login import login_required
 
-from db.socials_poster import get_all_stories
+from db.socials_poster import backfill_social_stories, get_all_stories
 from util.security import restrict_to
 
 di_social_poster_routes = Blueprint(
@@ -56,6 +56,18 @@ def dashboard():
     )
 
 
+@di_social_poster_routes.route("/api/backfill", methods=["POST"])
+@login_required
+@restrict_to(["imc-staff-webdev"])
+def api_backfill():
+    """
+    Key stories saved before they were keyed by URL, index their Slack messages and
+    set slack_posted_at, then reseed the posting counters.
+    """
+    updated = backfill_social_stories()
+    return jsonify({"message": "backfilled", "updated": updated}), 200
+
+
 # @di_social_poster_routes.route("/test-post", methods=["POST"])
 # @login_required
 # def test_post():
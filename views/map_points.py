@@ -7,14 +7,13 @@ from db.map_point import (
     get_next_points,
     center_val,
     get_future_points,
+    get_future_points_in_cell,
 )
 from util.security import restrict_to, csrf
 from util.map_point import add
+from util.map_clusters import MAP_POINTS_SOURCE, get_clusters, parse_bbox
 from datetime import datetime
-from util.map_point import scheduler
-from db.json_store import json_store_get, json_store_set
 from constants import GOOGLE_MAP_API
-from util.scheduler import scheduler_to_json, import_from_db
 
 
 map_points_routes = Blueprint("map_points_routes", __name__, url_prefix="/map-points")
@@ -46,6 +45,30 @@ def list_map_points_json():
     return jsonify(get_future_points())
 
 
+@map_points_routes.route("/clusters", methods=["GET"])
+@cross_origin()
+@csrf.exempt
+def list_map_point_clusters():
+    try:
+        bbox = parse_bbox(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if bbox is None:
+        return jsonify({"error": "north, south, east and west are required."}), 400
+    zoom = request.args.get("zoom", type=int)
+    if zoom is None:
+        return jsonify({"error": "zoom must be an integer."}), 400
+
+    clusters = get_clusters(
+        MAP_POINTS_SOURCE,
+        get_future_points_in_cell,
+        bbox,
+        zoom,
+        category_field="point_type",
+    )
+    return jsonify(clusters), 200
+
+
 @map_points_routes.route("/", methods=["POST"])
 @login_required
 @restrict_to(["student-managers", "editors", "imc-staff-webdev"])
@@ -91,33 +114,3 @@ def delete_map_point(uid):
 def get_center():
     center = center_val()
     return jsonify({"lat_center": center[0], "long_center": center[1]})
-
-
-@map_points_routes.route("/scheduler", methods=["GET"])
-@login_required
-@restrict_to(["imc-staff-webdev"])
-def print_jobs():
-    print(type(json_store_get("MAP_JOBS")))
-    return json_store_get("MAP_JOBS") if json_store_get("MAP_JOBS") else "None", 200
-
-
-@map_points_routes.route("/check-jobs", methods=["GET"])
-@login_required
-@restrict_to(["imc-staff-webdev"])
-def jobs():
-    scheduler.print_jobs()
-    json = []
-    job_list = scheduler.get_jobs()
-    for job in job_list:
-        json.append({"id": job.id, "runtime": job.next_run_time})
-    return jsonify(json), 200
-
-
-@map_points_routes.route("/clear-scheduler", methods=["GET"])
-@login_required
-@restrict_to(["imc-staff-webdev"])
-def clear():
-    scheduler.remove_all_jobs()
-    map_json = scheduler_to_json(scheduler)
-    json_store_set("MAP_JOBS", map_json)
-    return "cleared MAP_POINTS scheduler", 200
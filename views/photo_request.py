@@ -10,8 +10,8 @@ Last modified Nov. 8, 2025
 
 from flask import Blueprint, render_template, request, jsonify
 from flask_login import login_required
+from google.api_core.exceptions import BadRequest
 from util.security import restrict_to
-from datetime import datetime
 
 from util.slackbots.photo_request import (
     build_blocks_from_request,
@@ -25,15 +25,11 @@ from util.slackbots.photo_request import (
 
 from db.photo_request import (
     add_photo_request,
+    backfill_photo_request_fields,
     get_all_photo_requests,
+    get_photo_requests_page,
     update_photo_request,
     get_photo_request_by_uid,
-    get_completed_photo_requests,
-    get_inprogress_photo_requests,
-    get_claimed_photo_requests,
-    get_unclaimed_photo_requests,
-    get_claimed_photo_requests_for_user,
-    get_completed_photo_requests_for_user,
     get_submitted_photo_requests_for_user,
 )
 
@@ -66,52 +62,46 @@ def dashboard(selection=None):
     """
     print(f'Fetching "{selection}" photo requests for dashboard...')
 
-    # Fetch the appropriate requests based on selection
     # Format the selection name to display on the dashboard
+    email = request.args.get("email")
     match selection:
         case "completed":
-            requests = get_completed_photo_requests()
             selection_name = "Completed Requests"
         case "in-progress":
-            requests = get_inprogress_photo_requests()
             selection_name = "In-Progress Requests"
         case "claimed":
-            requests = get_claimed_photo_requests()
             selection_name = "Claimed Requests"
         case "unclaimed":
-            requests = get_unclaimed_photo_requests()
             selection_name = "Unclaimed Requests"
         case "claimed-email":
-            email = request.args.get("email")
-            requests = get_claimed_photo_requests_for_user(email)
             selection_name = f"Requests Claimed by {email}"
         case "completed-email":
-            email = request.args.get("email")
-            requests = get_completed_photo_requests_for_user(email)
             selection_name = f"Requests Completed by {email}"
         case "submitted-email":
-            email = request.args.get("email")
-            requests = get_submitted_photo_requests_for_user(email)
             selection_name = f"Requests Submitted by {email}"
         case "all":
-            requests = get_all_photo_requests()
             selection_name = "All Requests"
         case _:
             return "Invalid request selection", 404
 
-    for req in requests:
-        if req["dueDate"] and req["submissionTimestamp"]:
-            due_dt = datetime.combine(req["dueDate"], datetime.max.time())
-
-            if req["submissionTimestamp"].tzinfo is not None:
-                due_dt = due_dt.replace(tzinfo=req["submissionTimestamp"].tzinfo)
-
-            diff = due_dt - req["submissionTimestamp"]
-            req["lateSubmit"] = diff.total_seconds() < 48 * 60 * 60
+    # Fetch one page of the selection; the cursor query arg selects later pages
+    sort = request.args.get("sort", "submitted")
+    if sort not in ("submitted", "due"):
+        return "Invalid sort", 400
+    try:
+        requests, next_cursor = get_photo_requests_page(
+            selection, email=email, sort=sort, cursor=request.args.get("cursor")
+        )
+    except (ValueError, BadRequest):
+        return "Invalid cursor", 400
 
     print("Fetched.")
     return render_template(
-        "photo-req/photo_req_sheet.html", requests=requests, selection=selection_name
+        "photo-req/photo_req_sheet.html",
+        requests=requests,
+        selection=selection_name,
+        next_cursor=next_cursor,
+        sort=sort,
     )
 
 
@@ -286,6 +276,16 @@ def api_modify(uid):
     return jsonify({"error": "no changes"}), 400
 
 
+# /api/backfill — set derived fields (status, due date/time, lateness) on older requests
+@photo_request_routes.route("/api/backfill", methods=["POST"])
+@login_required
+@restrict_to(["imc-staff-webdev"])
+def api_backfill():
+    """Re-saves every photo request so derived, indexed fields are populated."""
+    updated = backfill_photo_request_fields()
+    return jsonify({"message": "backfilled", "updated": updated}), 200
+
+
 # —————————————————————————————————————————————————————————————————————— #
 
 
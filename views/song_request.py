@@ -1,29 +1,43 @@
-from flask import Blueprint, render_template, request, jsonify, redirect, url_for
+import json
+from datetime import datetime, timedelta, timezone
+
+from flask import (
+    Blueprint,
+    Response,
+    render_template,
+    request,
+    jsonify,
+    redirect,
+    url_for,
+)
+from google.api_core.exceptions import BadRequest
 from flask_login import login_required, current_user
 from util.security import restrict_to
 
+from db.expiry import utc_now
 from db.song_request import (
     create_song_request,
-    get_all_song_requests,
+    get_song_request_change_version,
+    get_song_request_deletions_since,
+    get_song_requests_changed_since,
+    get_song_requests_page,
     get_song_request_by_id,
     update_request_status,
     delete_all_song_requests,
     delete_song_request,
 )
-from util.song_request import (
-    send_song_request_submission_email,
-    send_song_request_update_email,
-)
-from db.song_request import update_slack_ts
+from util.helpers.ap_datetime import ap_datetime
+from util.song_request import send_song_request_update_email
 from util.slackbots.general import (
     dm_channel_by_id,
     dm_user_by_email,
 )
 from util.slackbots.song_request import (
     delete_song_request_message,
-    post_song_request_to_slack,
+    deliver_song_request_effects,
     update_song_request_message,
 )
+from util.tasks import QueueFull, enqueue
 
 song_request_routes = Blueprint(
     "song_request_routes", __name__, url_prefix="/wpgu-song-requests"
@@ -55,7 +69,14 @@ def form():
             submitter_email = current_user.email
             submitter_slack_id = getattr(current_user, "slack_id", None)
 
-        # Create the database record
+        # Slack post, email and DM are delivered after responding (outbox pattern)
+        effects = ["slack_post"]
+        if is_imc_employee:
+            if submitter_slack_id or submitter_email:
+                effects.append("submission_dm")
+        elif submitter_email:
+            effects.append("submission_email")
+
         new_request = create_song_request(
             song_name=song_name,
             artist_name=artist_name,
@@ -63,42 +84,20 @@ def form():
             submitter_email=submitter_email,
             is_imc_employee=is_imc_employee,
             submitter_slack_id=submitter_slack_id,
+            effects=effects,
         )
 
-        slack_res = post_song_request_to_slack(
-            song_name=song_name,
-            artist_name=artist_name,
-            submitter_slack_id=submitter_slack_id,
-            submitter_email=submitter_email,
-            request_id=new_request.key.id() if new_request.key else None,
-        )
-        if slack_res.get("ok") and new_request.key:
-            update_slack_ts(new_request.key.id(), slack_res["ts"])
-
-        if not is_imc_employee and submitter_email:
-            send_song_request_submission_email(
-                to_email=submitter_email,
-                song_name=song_name,
-                artist_name=artist_name,
-            )
-
-        if is_imc_employee:
-            if submitter_slack_id:
-                dm_channel_by_id(
-                    channel_id=submitter_slack_id,
-                    text=f'✅ Your song request "*{song_name}*" by "*{artist_name}*" has been submitted!',
-                )
-            elif submitter_email:
-                dm_user_by_email(
-                    email=submitter_email,
-                    text=f'✅ Your song request "*{song_name}*" by "*{artist_name}*" has been submitted!',
-                )
+        try:
+            enqueue(deliver_song_request_effects, new_request.key.id())
+        except QueueFull:
+            # Left pending for /cron/song-request-outbox
+            pass
 
         return (
             jsonify(
                 {
                     "message": "Song request submitted successfully!",
-                    "uid": new_request.key.id() if new_request.key else None,
+                    "uid": new_request.key.id(),
                 }
             ),
             200,
@@ -111,7 +110,35 @@ def form():
 
 
 # Dashboard Routes
-# Dashboard Routes
+# Max requests per page of the dashboard and /get-requests
+SONG_REQUEST_PAGE_SIZE = 50
+MAX_SONG_REQUEST_PAGE_SIZE = 200
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Seconds between the dashboard's checks for changed requests
+SONG_REQUEST_STREAM_POLL_SECONDS = 5
+# Changes are re-checked this far back, in case a write committed after a newer one
+SONG_REQUEST_STREAM_OVERLAP = timedelta(seconds=5)
+
+DASHBOARD_FILTERS = {
+    "pending": ("pending", "Pending Requests"),
+    "in-progress": ("in_progress", "In-Progress Requests"),
+    "accepted": ("accepted", "Accepted Requests"),
+    "declined": ("declined", "Declined Requests"),
+}
+
+
+def _serialize_song_request(req):
+    """JSON shape of a song request for the dashboard and /get-requests."""
+
+    req_dict = req.to_dict()
+    req_dict["timestamp_display"] = ap_datetime(req.timestamp)
+    for field in ("timestamp", "updated_at"):
+        if req_dict.get(field):
+            req_dict[field] = req_dict[field].isoformat() + "Z"
+    req_dict["uid"] = req.key.id() if req.key else None
+    return req_dict
+
+
 @song_request_routes.route("/dashboard", methods=["GET"])
 @song_request_routes.route("/dashboard/<filter_type>", methods=["GET"])
 @login_required
@@ -119,50 +146,122 @@ def form():
 def dashboard(filter_type="all"):
     """
     Dashboard to view and manage song requests. Matches IMC styling.
+    Renders the first page of requests; later pages are loaded from /get-requests
+    and changes arrive over /stream.
     """
-    all_requests = get_all_song_requests()
-
-    # Apply filtering based on the URL parameter
-    if filter_type.lower() == "pending":
-        requests = [r for r in all_requests if r.status == "pending"]
-        selection = "Pending Requests"
-    elif filter_type.lower() == "in-progress":
-        requests = [r for r in all_requests if r.status == "in_progress"]
-        selection = "In-Progress Requests"
-    elif filter_type.lower() == "accepted":
-        requests = [r for r in all_requests if r.status == "accepted"]
-        selection = "Accepted Requests"
-    elif filter_type.lower() == "declined":
-        requests = [r for r in all_requests if r.status == "declined"]
-        selection = "Declined Requests"
-    else:
-        requests = all_requests
-        selection = "All Requests"
+    status, selection = DASHBOARD_FILTERS.get(
+        filter_type.lower(), (None, "All Requests")
+    )
+    # Taken before the query so the stream replays anything written or deleted meanwhile
+    stream_since = utc_now()
+    stream_version = get_song_request_change_version()
+    requests, next_cursor = get_song_requests_page(
+        status=status, limit=SONG_REQUEST_PAGE_SIZE
+    )
 
     return render_template(
         "wpgu-song-req/wpgu_song_req_dashboard.html",
-        requests=requests,
+        requests=[_serialize_song_request(r) for r in requests],
+        next_cursor=next_cursor,
+        page_size=SONG_REQUEST_PAGE_SIZE,
+        status=status,
         selection=selection,
+        stream_since=f"{stream_since.isoformat()}|{stream_version}",
     )
 
 
+# Directors can open the dashboard, which loads its older pages from here
 @song_request_routes.route("/get-requests", methods=["GET"])
 @login_required
-@restrict_to(["wpgu-staff-operations", "imc-staff-webdev"])
+@restrict_to(["wpgu-staff-operations", "wpgu-directors", "imc-staff-webdev"])
 def get_requests():
-    """Returns all song requests in JSON format."""
-    requests = get_all_song_requests()
+    """
+    Returns one page of song requests in JSON format, newest first, with optional
+    limit (default SONG_REQUEST_PAGE_SIZE), cursor and status. The next page's cursor
+    is sent in the X-Next-Cursor header.
+    """
+    limit = request.args.get("limit", SONG_REQUEST_PAGE_SIZE, type=int)
+    if not 1 <= limit <= MAX_SONG_REQUEST_PAGE_SIZE:
+        return (
+            jsonify(
+                {"error": f"limit must be between 1 and {MAX_SONG_REQUEST_PAGE_SIZE}."}
+            ),
+            400,
+        )
+
+    try:
+        requests, next_cursor = get_song_requests_page(
+            status=request.args.get("status") or None,
+            limit=limit,
+            cursor=request.args.get("cursor"),
+        )
+    except (ValueError, BadRequest):
+        return jsonify({"error": "Invalid cursor."}), 400
 
-    results = []
-    for req in requests:
-        req_dict = req.to_dict()
-        if req_dict.get("timestamp"):
-            req_dict["timestamp"] = req_dict["timestamp"].isoformat() + "Z"
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    return jsonify([_serialize_song_request(r) for r in requests]), 200, headers
 
-        req_dict["uid"] = req.key.id() if req.key else None
-        results.append(req_dict)
 
-    return jsonify(results), 200
+def _sse(event, data, event_id=None):
+    lines = [f"event: {event}", f"data: {json.dumps(data)}"]
+    if event_id:
+        lines.insert(0, f"id: {event_id}")
+    return "\n".join(lines) + "\n\n"
+
+
+def _stream_position():
+    """
+    Return (since, version) from the Last-Event-ID the browser sends when reconnecting,
+    or from ?since= (set by the dashboard) on the first connection. Both are
+    "<since>|<change version>".
+    """
+    since, _, version = (
+        request.headers.get("Last-Event-ID") or request.args.get("since") or ""
+    ).partition("|")
+    try:
+        since = datetime.fromisoformat(since)
+    except ValueError:
+        since = utc_now()
+    if since.tzinfo is not None:
+        since = since.astimezone(timezone.utc).replace(tzinfo=None)
+    try:
+        version = int(version)
+    except ValueError:
+        version = get_song_request_change_version()
+    return since, version
+
+
+@song_request_routes.route("/stream", methods=["GET"])
+@login_required
+@restrict_to(["wpgu-staff-operations", "wpgu-directors", "imc-staff-webdev"])
+def stream():
+    """
+    Server-Sent Events of song requests created or changed after ?since= (or the
+    Last-Event-ID the browser sends when reconnecting), as "request" events, and of
+    deletions on this instance as "deleted" events. Each response checks once and
+    ends with a "sync" event; the browser reconnects SONG_REQUEST_STREAM_POLL_SECONDS
+    later and resumes from its id, so no worker is held between checks.
+    """
+    since, version = _stream_position()
+
+    checked_at = utc_now()
+    events = [f"retry: {SONG_REQUEST_STREAM_POLL_SECONDS * 1000}\n\n"]
+    for req in get_song_requests_changed_since(since - SONG_REQUEST_STREAM_OVERLAP):
+        since = max(since, req.updated_at)
+        events.append(_sse("request", _serialize_song_request(req)))
+    version, deleted = get_song_request_deletions_since(version)
+    for uid in deleted:
+        events.append(_sse("deleted", {"uid": uid}))
+
+    # Resume from here on reconnect; the overlap re-checks writes that committed late
+    position = f"{max(since, checked_at).isoformat()}|{version}"
+    events.append(_sse("sync", {}, event_id=position))
+
+    return Response(
+        "".join(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @song_request_routes.route("/api/<uid>/claim", methods=["POST"])